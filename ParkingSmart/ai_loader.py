@@ -0,0 +1,150 @@
+"""
+FILE: ai_loader.py
+DESCRIPTION: Nạp model YOLO + EasyOCR ở thread nền và chạy warm-up.
+Server web/API cảm biến chạy được ngay, cổng biết AI đã sẵn sàng qua /api/ready.
+Ưu tiên model YOLO đã export cho CPU (OpenVINO / ONNX) nếu có.
+
+ultralytics / easyocr chỉ import trong load() / export_model(): import torch mất vài giây,
+import module này (app.py) không phải chờ.
+
+Export model: python ai_loader.py export --format openvino
+"""
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+
+# Thứ tự ưu tiên khi YOLO_EXPORT_FORMAT = "auto"
+EXPORT_CANDIDATES = ["openvino", "onnx"]
+
+
+def exported_path(pt_path, fmt):
+    """models/best.pt -> models/best_openvino_model/ hoặc models/best.onnx"""
+    base = os.path.splitext(pt_path)[0]
+    if fmt == "openvino": return f"{base}_openvino_model"
+    if fmt == "onnx": return f"{base}.onnx"
+    return pt_path
+
+
+def resolve_yolo_path(pt_path, fallback, export_format):
+    if export_format and export_format != "pt":
+        fmts = EXPORT_CANDIDATES if export_format == "auto" else [export_format]
+        for fmt in fmts:
+            path = exported_path(pt_path, fmt)
+            if os.path.exists(path):
+                return path, fmt
+    if os.path.exists(pt_path):
+        return pt_path, "pt"
+    return fallback, "pt"
+
+
+class ModelLoader:
+    def __init__(self, yolo_path, fallback="yolov8n.pt", export_format="auto",
+                 ocr_langs=("en",), warmup_runs=2, warmup_batch=1, on_ready=None):
+        self.yolo_path = yolo_path
+        self.fallback = fallback
+        self.export_format = export_format
+        self.ocr_langs = list(ocr_langs)
+        self.warmup_runs = warmup_runs
+        self.warmup_batch = warmup_batch
+        self.on_ready = on_ready
+
+        self.model = None
+        self.reader = None
+        self.state = "idle"   # idle -> loading -> warming -> ready | failed
+        self.backend = None
+        self.errors = []
+        self.timings = {}
+        self.ready = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Nạp ở thread nền"""
+        self._thread = threading.Thread(target=self.load, name="model-loader", daemon=True)
+        self._thread.start()
+        return self
+
+    def load(self):
+        t_start = time.perf_counter()
+        self.state = "loading"
+        print("--- LOADING AI MODELS ---")
+
+        # 1. YOLO
+        t = time.perf_counter()
+        try:
+            from ultralytics import YOLO
+            path, self.backend = resolve_yolo_path(self.yolo_path, self.fallback, self.export_format)
+            print(f"[YOLO] Loading {path} ({self.backend})")
+            self.model = YOLO(path, task="detect")
+        except Exception as e:
+            self.errors.append(f"YOLO: {e}")
+            print(f"[YOLO ERROR] {e}")
+        self.timings["yolo_load_ms"] = round((time.perf_counter() - t) * 1000, 1)
+
+        # 2. EasyOCR
+        t = time.perf_counter()
+        try:
+            print("[OCR] Loading EasyOCR...")
+            import easyocr
+            self.reader = easyocr.Reader(self.ocr_langs, gpu=False)
+        except Exception as e:
+            self.errors.append(f"OCR: {e}")
+            print(f"[OCR ERROR] {e}")
+        self.timings["ocr_load_ms"] = round((time.perf_counter() - t) * 1000, 1)
+
+        if not self.model or not self.reader:
+            self.state = "failed"
+            self.timings["total_ms"] = round((time.perf_counter() - t_start) * 1000, 1)
+            return
+
+        # 3. Warm-up: khởi tạo kernel torch / cấp phát bộ nhớ trước khi xe đầu tiên tới
+        self.state = "warming"
+        self.warmup()
+        self.timings["total_ms"] = round((time.perf_counter() - t_start) * 1000, 1)
+
+        if self.on_ready:
+            self.on_ready(self.model, self.reader)
+        self.state = "ready"
+        self.ready.set()
+        print(f"[AI] Ready in {self.timings['total_ms']}ms ({self.backend})")
+
+    def warmup(self):
+        dummy = np.zeros((480, 640, 3), np.uint8)
+        runs = []
+        for _ in range(self.warmup_runs):
+            t = time.perf_counter()
+            try:
+                self.model.predict([dummy] * self.warmup_batch, conf=0.25, verbose=False)
+            except Exception as e:
+                print(f"[YOLO WARMUP] {e}")
+            runs.append(round((time.perf_counter() - t) * 1000, 1))
+        self.timings["yolo_warmup_ms"] = runs
+
+        t = time.perf_counter()
+        try:
+            self.reader.readtext(np.full((64, 256), 255, np.uint8), detail=0)
+        except Exception as e:
+            print(f"[OCR WARMUP] {e}")
+        self.timings["ocr_warmup_ms"] = round((time.perf_counter() - t) * 1000, 1)
+
+    def status(self):
+        return {"ready": self.ready.is_set(), "state": self.state, "backend": self.backend,
+                "timings": self.timings, "errors": self.errors}
+
+
+def export_model(pt_path, fmt):
+    """Export YOLO .pt sang định dạng chạy nhanh trên CPU (openvino / onnx)"""
+    from ultralytics import YOLO
+    print(f"[YOLO] Exporting {pt_path} -> {fmt}")
+    return YOLO(pt_path).export(format=fmt)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) >= 2 and sys.argv[1] == "export":
+        fmt = sys.argv[sys.argv.index("--format") + 1] if "--format" in sys.argv else "openvino"
+        path = sys.argv[sys.argv.index("--model") + 1] if "--model" in sys.argv else "models/best.pt"
+        print(export_model(path, fmt))
+    else:
+        print("Usage: python ai_loader.py export [--model models/best.pt] [--format openvino|onnx]")
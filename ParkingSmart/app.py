@@ -1,5 +1,6 @@
-from flask import Flask, render_template, request, jsonify, send_file, abort
-from flask_socketio import SocketIO
+from flask import Flask, Response, render_template, request, jsonify, send_file, abort, stream_with_context
+from werkzeug.utils import safe_join
+from flask_socketio import SocketIO, join_room, leave_room, emit, rooms as socket_rooms
 from datetime import datetime, timedelta
 import sqlite3
 import os
@@ -8,64 +9,262 @@ import requests
 import numpy as np
 from PIL import Image
 from io import BytesIO
-from ultralytics import YOLO
-import easyocr
 import re
 import time
+import json
+import csv
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from inference import InferenceEngine
+from roi import RoiRegistry
+from frame_cache import RecognitionCache
+from ocr_prep import recognize_plate
+from ai_loader import ModelLoader
+from plate_vote import vote_plate
+from plate_cache import RegisteredCache
+from plate_match import VersionedPlateIndex, plate_distance
+from jobs import JobManager
+from commands import CommandBus
+from realtime import RealtimeOutbox, SensorFanout, ROOMS, ROOM_SENSORS, ROOM_LOGS
+from storage import AsyncFileWriter
+from thumbs import ThumbnailCache
+from capture_store import CaptureStore, referenced_paths
+from timeseries import SensorTimeSeries
+from camera import CameraClient
+from db import (ConnectionPool, migrate, open_session, close_session, keep_capture,
+                SQL_FIND_IN_BY_PLATE, SQL_FIND_IN_BY_RFID, SQL_INSERT_ENTRY)
+from stats import record_entry, record_exit, query_stats, backfill as backfill_stats
+from tariff import load_tariff, GUEST_VEHICLE_TYPE
+from metrics import MetricsRegistry, GateTracer, CONTENT_TYPE as METRICS_CONTENT_TYPE
+from lots import LotRegistry
+from broker import connect as connect_broker, CHANNEL_REALTIME, CHANNEL_COMMANDS
 
 # ======================================
 # 1. CONFIGURATION
 # ======================================
+# Các giá trị có thể ghi đè bằng biến môi trường (bench/loadgen.py dùng để trỏ sang camera giả / DB thử)
 AI_SERVER_IP = "0.0.0.0"  # Nghe trên mọi IP trong mạng LAN
-PORT = 5000
+PORT = int(os.environ.get("PORT", 5000))
+SERVER_DEBUG = os.environ.get("SERVER_DEBUG", "1") == "1"
 
-# IP Camera (ESP32-CAM)
-CAM_ENTRY_IP = "172.31.106.40"
+# IP Camera (ESP32-CAM), có thể kèm cổng: "127.0.0.1:8081"
+CAM_ENTRY_IP = os.environ.get("CAM_ENTRY_IP", "172.31.106.40")
 
-CAM_EXIT_IP  = "172.31.106.41"
+CAM_EXIT_IP  = os.environ.get("CAM_EXIT_IP", "172.31.106.41")
+
+# Danh sách bãi / cổng (xem lots.example.json). Không có file -> 1 bãi: cổng entry / exit ở 2 IP trên
+LOTS_FILE = os.environ.get("LOTS_FILE", "lots.json")
+lot_registry = LotRegistry.load(LOTS_FILE, CAM_ENTRY_IP, CAM_EXIT_IP)
+CAM_GATES = lot_registry.cam_labels()  # IP camera -> id cổng (nhãn thư mục ảnh / metrics)
+
+# Nhiều worker trên 1 máy (cluster.py đặt các biến này). Chạy app.py trực tiếp = 1 worker, broker trong tiến trình
+WORKER_ID = int(os.environ.get("WORKER_ID", 0))
+WORKER_COUNT = int(os.environ.get("WORKER_COUNT", 1))
+WORKER_PORT_BASE = int(os.environ.get("WORKER_PORT_BASE", PORT - WORKER_ID))  # Worker k nghe ở cổng này + k
+BROKER_URL = os.environ.get("BROKER_URL", "")     # "" = trong tiến trình, "redis://127.0.0.1:6390/"
+# Worker 0: nhận request từ thiết bị, giữ hàng đợi lệnh barie, lịch sử cảm biến, dọn ảnh
+IS_PRIMARY = WORKER_ID == 0
+WORKER_HEARTBEAT = 3  # Giây, ghi worker:<id> vào broker (xem /api/cluster)
+FORWARD_HEADER = "X-Parking-Forwarded"  # Request đã được worker khác chuyển tới -> xử lý tại chỗ
+
+# Chế độ stream MJPEG: đọc liên tục và giữ sẵn CAM_RING_SIZE frame mới nhất
+# (cần firmware có /stream, VD CameraWebServer mặc định ở cổng 81)
+CAM_STREAM_MODE = False
+CAM_STREAM_URL = "http://{ip}:81/stream"
+CAM_RING_SIZE = 5
 
 # Đường dẫn file
-CAPTURE_FOLDER = "static/captures"
-DB_FILE = "database.db"
+CAPTURE_FOLDER = os.environ.get("CAPTURE_FOLDER", "static/captures")
+THUMB_FOLDER = os.environ.get("THUMB_FOLDER", "static/thumbs")   # Ảnh thu nhỏ (tạo lúc chụp hoặc lần xem đầu tiên)
+THUMB_FORMAT = "webp"            # "webp" | "jpeg"
+CAPTURE_CACHE_MAX_AGE = 30 * 24 * 3600  # Ảnh chụp không bao giờ sửa -> cho trình duyệt cache lâu
+
+# Vòng đời ảnh chụp (captures/YYYY/MM/DD/<cam>/...): dọn shot không dùng, ảnh debug, đóng gói ngày cũ
+CAPTURE_KEEP_SHOTS_DAYS = 7     # Shot không được chọn làm ảnh của lượt gửi
+CAPTURE_KEEP_DEBUG_DAYS = 3     # Ảnh crop _debug.jpg
+CAPTURE_PACK_AFTER_DAYS = 30    # Ngày cũ hơn -> gom vào YYYY/MM/DD.zip (None = không gom)
+CAPTURE_RETENTION_INTERVAL = 3600  # Giây
+DB_FILE = os.environ.get("DB_FILE", "database.db")
 YOLO_MODEL_PATH = "models/best.pt"
 
+# Nạp model ở thread nền (server web + API cảm biến chạy ngay, xem /api/ready)
+AI_BACKGROUND_LOAD = True
+# "auto": dùng models/best_openvino_model hoặc models/best.onnx nếu đã export, "pt": luôn dùng .pt
+YOLO_EXPORT_FORMAT = "auto"
+
+# Micro-batch cho YOLO: gom tối đa AI_BATCH_MAX frame, chờ tối đa AI_BATCH_WAIT_MS
+AI_BATCH_MAX = 4
+AI_BATCH_WAIT_MS = 15
+AI_TIMEOUT = 10  # Giây, thời gian tối đa 1 request chờ kết quả AI
+
+# Camera cố định: học vùng biển số hay xuất hiện, chạy YOLO trên ảnh cắt với imgsz nhỏ hơn
+ROI_ENABLED = True
+ROI_IMGSZ = 320
+
+# Ảnh gần như trùng ảnh vừa nhận diện (xe đứng yên trước barie, quẹt thẻ lại) -> dùng lại kết quả
+RECOG_CACHE_ENABLED = True
+RECOG_CACHE_TTL = 3.0    # Giây
+RECOG_CACHE_SIZE = 16    # Số ảnh nhớ cho mỗi camera
+
+# Tiền xử lý OCR: "adaptive" (resize theo chiều cao chữ, tách biển 2 dòng, chỉ chạy bộ nhận dạng)
+# hoặc "legacy" (phóng to 3 lần + readtext như cũ)
+OCR_MODE = "adaptive"
+OCR_ALLOWLIST = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ.-'
+
+# Chế độ chụp nhiều ảnh: "pipelined" (tải ảnh kế tiếp trong lúc AI chạy + bỏ phiếu)
+# hoặc "serial" (chụp -> nhận diện -> nghỉ 0.2s như cũ)
+CAPTURE_MODE = "pipelined"
+CAPTURE_CONF_THRESHOLD = 0.85  # Đủ tự tin thì dừng chụp ngay
+
+# So khớp gần đúng biển số (nhầm 0/O, 8/B... tính 0.25, sai hẳn 1 ký tự tính 1.0).
+# Phải < 1.0: sai hẳn 1 ký tự có thể là xe khác (xe hàng xóm vào bằng vé tháng, đóng nhầm lượt của xe khác)
+FUZZY_MAX_COST = 0.5
+
+# Bảng giá (khung giờ, trần phí/ngày, hệ số loại xe). Không có file -> 15p miễn phí, 100đ/phút
+TARIFF_FILE = "tariff.json"
+
+# Job cổng (chụp + AI + DB) chạy trên thread pool riêng
+GATE_JOB_WORKERS = 4
+GATE_JOB_TIMEOUT = 20  # Giây, chế độ đồng bộ chờ tối đa chừng này rồi trả job_id
+
+# sensor_update: chỉ phát khi slot/MQ135 đổi, gộp theo tick, heartbeat để web biết cảm biến còn sống
+SENSOR_TICK = 0.2        # Giây
+SENSOR_HEARTBEAT = 2.0   # Giây (< watchdog 5s của dashboard)
+SENSOR_MQ_DELTA = 10     # MQ135 đổi ít hơn ngưỡng này thì bỏ qua
+
+# Lịch sử cảm biến (mọi lần ESP32 gửi lên) cho biểu đồ: file memmap riêng, không ghi vào parking_log
+SENSOR_TS_FOLDER = os.environ.get("SENSOR_TS_FOLDER", "data/sensors")
+SENSOR_TS_FLUSH = 1.0       # Giây, ghi bộ đệm xuống file theo lô
+SENSOR_TS_RAW_DAYS = 7      # Giữ dữ liệu thô chừng này ngày (tầng 1 phút / 1 giờ giữ lại)
+
+# Lệnh mở barie: hết hạn sau COMMAND_TTL giây, long-poll chờ tối đa COMMAND_MAX_WAIT giây
+COMMAND_TTL = 30
+COMMAND_MAX_WAIT = 25
+COMMAND_REDELIVER = 5  # Giây, lệnh đã giao (client yêu cầu ack) mà chưa ack thì giao lại
+
+# Bật để lưu ảnh crop biển số (_debug.jpg) phục vụ dò lỗi OCR
+DEBUG_AI = os.environ.get("DEBUG_AI", "0") == "1"
+
 # Tạo thư mục lưu ảnh
 os.makedirs(CAPTURE_FOLDER, exist_ok=True)
 
+# Ghi ảnh bằng chứng ở thread nền (không chặn cổng)
+evidence_writer = AsyncFileWriter().start()
+capture_store = CaptureStore(CAPTURE_FOLDER, cam_names=CAM_GATES,
+                             thumb_root=THUMB_FOLDER, keep_shots_days=CAPTURE_KEEP_SHOTS_DAYS,
+                             keep_debug_days=CAPTURE_KEEP_DEBUG_DAYS, pack_after_days=CAPTURE_PACK_AFTER_DAYS)
+thumb_cache = ThumbnailCache(CAPTURE_FOLDER, THUMB_FOLDER, evidence_writer, fmt=THUMB_FORMAT,
+                             read_source=capture_store.read)
+
+# Thread tải trước ảnh kế tiếp cho smart_capture_loop
+capture_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="cam-prefetch")
+capture_reports = deque(maxlen=200)  # Thời gian từng lượt chụp (cho /api/capture/stats)
+
+# Mỗi camera 1 client giữ kết nối keep-alive
+cameras = {}
+
+def get_camera(cam_ip):
+    cam = cameras.get(cam_ip)
+    if cam is None:
+        stream_url = CAM_STREAM_URL.format(ip=cam_ip) if CAM_STREAM_MODE else None
+        cam = cameras.setdefault(cam_ip, CameraClient(cam_ip, stream_url=stream_url, ring_size=CAM_RING_SIZE))
+        cam.start_stream()
+    return cam
+
 # Khởi tạo Flask & SocketIO
 app = Flask(__name__, static_folder="static", template_folder="templates")
 app.config['SECRET_KEY'] = 'secret!'
 socketio = SocketIO(app, cors_allowed_origins="*")
 
+# Job nặng ở cổng chạy trên thread thật; chờ bằng socketio.sleep để không chặn request khác
+gate_jobs = JobManager(max_workers=GATE_JOB_WORKERS, sleep=socketio.sleep,
+                       id_prefix=f"w{WORKER_ID}-" if WORKER_COUNT > 1 else "",
+                       on_finish=lambda: db_pool.release())  # Job xong -> trả kết nối DB về pool
+# Sự kiện Socket.IO + lệnh barie đi qua broker -> worker nào phát cũng tới được mọi client / hàng đợi lệnh
+broker = connect_broker(BROKER_URL)
+realtime = RealtimeOutbox(socketio, broker=broker, channel=CHANNEL_REALTIME).start()
+sensor_fanout = SensorFanout(realtime, tick=SENSOR_TICK, heartbeat=SENSOR_HEARTBEAT,
+                             mq_delta=SENSOR_MQ_DELTA).start(socketio)
+# Chỉ worker chính ghi file lịch sử (worker khác chuyển /api/update_data về worker chính)
+sensor_history = SensorTimeSeries(SENSOR_TS_FOLDER, n_slots=4, raw_keep_days=SENSOR_TS_RAW_DAYS) \
+    .start(interval=SENSOR_TS_FLUSH) if IS_PRIMARY else None
+# Lệnh điều khiển barie theo cổng (long-poll /api/get_command hoặc push qua room gate:<cổng>)
+command_bus = CommandBus(gates=tuple(lot_registry.gates), ttl=COMMAND_TTL, redeliver_after=COMMAND_REDELIVER,
+                         sleep=socketio.sleep, id_prefix=f"w{WORKER_ID}-" if WORKER_COUNT > 1 else "",
+                         on_push=lambda cmd: realtime.emit("gate_command", cmd.to_dict(), to=f"gate:{cmd.gate}"))
+
+def on_command_message(m):
+    """Worker chính: lệnh mới / ack / thiết bị giữ socket ở worker khác vào, ra room gate:<cổng>"""
+    op = m.get("op", "enqueue")
+    if op == "enqueue":
+        command_bus.enqueue(m["gate"], m["command"], cmd_id=m["id"])
+    elif op == "attach":
+        command_bus.attach(m["gate"])
+    elif op == "detach":
+        command_bus.detach(m["gate"])
+    elif op == "ack":
+        # Trả kết quả cho đúng socket đã ack (phát qua broker -> worker đang giữ socket đó gửi đi)
+        acked = command_bus.ack(m["id"])
+        if m.get("sid"):
+            realtime.emit("command_ack_result", {"id": m["id"], "acked": acked}, to=m["sid"])
+
+def on_realtime_message(m):
+    """Worker khác: giữ trạng thái cảm biến worker chính vừa phát để gửi cho client mới vào room"""
+    if m.get("event") == sensor_fanout.event:
+        sensor_fanout.observe(m["payload"])
+
+if IS_PRIMARY:
+    broker.subscribe(CHANNEL_COMMANDS, on_command_message)
+else:
+    broker.subscribe(CHANNEL_REALTIME, on_realtime_message)
+
+# Đo thời gian từng bước ở cổng (chụp, giải mã, YOLO, OCR, DB, emit) -> /metrics, /api/traces
+metrics = MetricsRegistry()
+tracer = GateTracer(metrics)
+metrics.gauge("parking_realtime_pending", "Sự kiện Socket.IO đang chờ phát", realtime.pending)
+metrics.gauge("parking_db_connections", "Kết nối SQLite đang mở trong pool", lambda: db_pool.stats()["connections"])
+metrics.gauge("parking_ai_ready", "1 khi model AI đã nạp xong", lambda: int(ai_engine is not None))
+recog_cache_lookups = metrics.counter(
+    "parking_recognition_cache_lookups_total",
+    "Số lần tra cache nhận diện theo tầng / kết quả (hit, miss, rejected = giống nhưng không dùng được)",
+    ("level", "result"))
+
 # ======================================
 # 2. LOAD AI MODELS
 # ======================================
-print("--- LOADING AI MODELS ---")
 model = None
-try:
-    if os.path.exists(YOLO_MODEL_PATH):
-        print(f"[YOLO] Loading custom model: {YOLO_MODEL_PATH}")
-        model = YOLO(YOLO_MODEL_PATH)
-    else:
-        print("[YOLO] Custom model not found, loading standard yolov8n.pt...")
-        model = YOLO("yolov8n.pt")
-except Exception as e:
-    print(f"[YOLO ERROR] {e}")
-
 reader = None
-try:
-    print("[OCR] Loading EasyOCR...")
-    reader = easyocr.Reader(['en'], gpu=False)
-except Exception as e:
-    print(f"[OCR ERROR] {e}")
+ai_engine = None
+
+def on_models_ready(loaded_model, loaded_reader):
+    """Model đã nạp + warm-up xong -> bật InferenceEngine"""
+    global model, reader, ai_engine
+    model, reader = loaded_model, loaded_reader
+    ai_engine = InferenceEngine(yolo_detect_batch, read_plate_from_detections,
+                                max_batch=AI_BATCH_MAX, max_wait_ms=AI_BATCH_WAIT_MS, pass_meta=True).start()
+
+# Vùng biển số theo từng camera (chỉ học từ box đã đọc ra biển hợp lệ)
+roi_registry = RoiRegistry()
+# Kết quả nhận diện gần đây theo hash cảm nhận của khung hình / crop biển số
+recog_cache = RecognitionCache(ttl=RECOG_CACHE_TTL, max_entries=RECOG_CACHE_SIZE,
+                               on_lookup=lambda level, result: recog_cache_lookups.inc(level=level, result=result))
+
+model_loader = ModelLoader(YOLO_MODEL_PATH, export_format=YOLO_EXPORT_FORMAT,
+                           warmup_batch=AI_BATCH_MAX, on_ready=on_models_ready)
 
 # ======================================
 # 3. DATABASE HELPER
 # ======================================
+# Mỗi thread 1 kết nối dùng chung (WAL, synchronous=NORMAL, mmap, cache lớn)
+db_pool = ConnectionPool(DB_FILE)
+
 def get_db_connection():
-    conn = sqlite3.connect(DB_FILE, check_same_thread=False)
-    conn.row_factory = sqlite3.Row
-    return conn
+    return db_pool.connection()
+
+@app.teardown_appcontext
+def release_db_connection(exc):
+    # Werkzeug (threading) mở thread mới cho mỗi request -> trả kết nối về pool khi request xong
+    db_pool.release()
 
 def init_db():
     """Khởi tạo database với cấu trúc mới nhất (có RFID)"""
@@ -97,11 +296,48 @@ def init_db():
             )
         """)
         conn.commit()
+
+        # Index + bảng active_sessions + bảng tổng hợp (theo PRAGMA user_version)
+        migrate(conn)
+
+        # DB cũ vừa có bảng tổng hợp -> dựng lại từ lịch sử 1 lần
+        if not conn.execute("SELECT 1 FROM stats_daily LIMIT 1").fetchone() and \
+                conn.execute("SELECT 1 FROM parking_log LIMIT 1").fetchone():
+            print(f"[STATS] Backfilled {backfill_stats(conn)} days.")
     print("[DB] Database initialized.")
 
 # Gọi khởi tạo ngay khi chạy
 init_db()
 
+# Cache vé tháng trong RAM (tự nạp lại khi registered_version trong DB thay đổi)
+registered_cache = RegisteredCache(get_db_connection)
+registered_cache.reload()
+db_pool.release()  # Thread chính sẽ chạy server, không giữ kết nối
+
+def capture_referenced_paths():
+    try:
+        return referenced_paths(get_db_connection(), CAPTURE_FOLDER)
+    finally:
+        db_pool.release()
+
+# Dọn ảnh chụp định kỳ (giữ ảnh đang được parking_log tham chiếu), chỉ ở worker chính
+if IS_PRIMARY:
+    capture_store.start(capture_referenced_paths, interval=CAPTURE_RETENTION_INTERVAL)
+
+# Chỉ mục biển số xe đang trong bãi (dùng khi lúc ra OCR đọc lệch so với lúc vào)
+active_plates = VersionedPlateIndex(get_db_connection, "active_version",
+                                    "SELECT plate FROM active_sessions WHERE plate != 'UNKNOWN'",
+                                    check_interval=0)
+
+def resolve_plate(plate, matcher, label):
+    """OCR đọc lệch vài ký tự -> thay bằng biển số khớp gần nhất (nếu có)"""
+    if not plate or plate == "UNKNOWN": return plate
+    match, cost = matcher(plate, FUZZY_MAX_COST)
+    if match and match != plate:
+        print(f"[MATCH] {label}: {plate} -> {match} (cost={cost})")
+        return match
+    return plate
+
 # ======================================
 # 4. LOGIC FUNCTIONS
 # ======================================
@@ -122,48 +358,66 @@ def normalize_plate(text):
         
     return plate
 
-def calculate_fee(entry_str, exit_str=None):
-    """Tính phí gửi xe"""
-    if not entry_str: return 0, None
-    
-    fmt = "%Y-%m-%d %H:%M:%S"
-    t1 = datetime.strptime(entry_str, fmt)
-    
-    if exit_str:
-        t2 = datetime.strptime(exit_str, fmt)
-    else:
-        t2 = datetime.now()
-        exit_str = t2.strftime(fmt)
+tariff = load_tariff(TARIFF_FILE)
 
-    duration = (t2 - t1).total_seconds() / 60.0 # Phút
-    
-    # Logic: Miễn phí 15p đầu, sau đó 100đ/phút
-    if duration <= 15:
-        return 0, exit_str
+def calculate_fee(entry_str, exit_str=None, vehicle_type=GUEST_VEHICLE_TYPE):
+    """Tính phí gửi xe theo bảng giá hiện hành (tariff.py)"""
+    if not entry_str: return 0
     
-    money = round(duration * 100) 
-    return money, exit_str
+    if not exit_str:
+        exit_str = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+    return tariff.fee(entry_str, exit_str, vehicle_type)
+
+def vehicle_type_of(plate):
+    """Loại xe để tính phí: theo đăng ký vé tháng (kể cả đã hết hạn), khách vãng lai -> GUEST_VEHICLE_TYPE"""
+    info = registered_cache.get(plate) if plate and plate != "UNKNOWN" else None
+    return (info or {}).get("vehicle_type") or GUEST_VEHICLE_TYPE
+
 def smart_capture_loop(cam_ip, label_prefix, max_retries=3):
     """
-    Chụp liên tiếp tối đa 3 ảnh.
-    Nếu ảnh nào đọc được biển số thì DỪNG NGAY và trả về kết quả.
+    Chụp liên tiếp tối đa 3 ảnh, trả về (plate, img_path, report).
+    report chứa thời gian từng shot để đo độ trễ mở cổng.
     """
-    final_plate = "UNKNOWN"
+    t0 = time.perf_counter()
+    if CAPTURE_MODE == "pipelined":
+        plate, img_path, shots = _capture_pipelined(cam_ip, label_prefix, max_retries)
+    else:
+        plate, img_path, shots = _capture_serial(cam_ip, label_prefix, max_retries)
+
+    report = {"mode": CAPTURE_MODE, "plate": plate, "shots": shots,
+              "total_ms": round((time.perf_counter() - t0) * 1000, 1)}
+    capture_reports.append(report)
+    print(f"[SMART CAM] {CAPTURE_MODE}: {len(shots)} shot(s), {report['total_ms']}ms")
+    return plate, img_path, report
+
+def _capture_serial(cam_ip, label_prefix, max_retries):
+    """Chế độ cũ: Nếu ảnh nào đọc được biển số thì DỪNG NGAY và trả về kết quả."""
     final_img_path = None
+    shots = []
     
     print(f"[SMART CAM] Bắt đầu chu trình chụp liên tiếp ({max_retries} shots)...")
 
     for i in range(max_retries):
         print(f"--- SHOT {i+1}/{max_retries} ---")
         
-        # 1. Chụp ảnh (Dùng hàm capture nhanh)
-        img_path = capture_and_save(cam_ip, f"{label_prefix}_shot{i+1}")
+        # 1. Chụp ảnh vào RAM (file được ghi nền)
+        t_cap = time.perf_counter()
+        timings = {}
+        frame, img_path = capture_frame(cam_ip, f"{label_prefix}_shot{i+1}", timings)
+        shot = {"shot": i + 1, "capture_ms": round((time.perf_counter() - t_cap) * 1000, 1)}
+        trace_timings(timings)
+        shots.append(shot)
         
-        if not img_path:
+        if frame is None:
+            shot["status"] = "CAM_FAIL"
             continue # Lỗi mạng, thử lại
             
-        # 2. Nhận diện
-        plate, status = process_plate_ai(img_path)
+        # 2. Nhận diện trực tiếp trên frame trong RAM
+        t_ai = time.perf_counter()
+        plate, status, conf, _ = recognize_frame(frame, img_path.replace(".jpg", "_debug.jpg"), cam_ip,
+                                                 use_cache=i == 0)
+        shot.update(infer_ms=round((time.perf_counter() - t_ai) * 1000, 1), status=status, plate=plate, conf=conf)
         
         # Lưu lại đường dẫn ảnh mới nhất để hiển thị web (dù có đọc được hay không)
         final_img_path = img_path
@@ -171,82 +425,202 @@ def smart_capture_loop(cam_ip, label_prefix, max_retries=3):
         # 3. Kiểm tra kết quả
         if plate:
             print(f"[SMART CAM] => ĐÃ TÌM THẤY: {plate} (Dừng chụp)")
-            return plate, final_img_path # Thành công -> Thoát vòng lặp ngay
+            return plate, final_img_path, shots # Thành công -> Thoát vòng lặp ngay
         else:
             print(f"[SMART CAM] => Shot {i+1} thất bại/mờ. Thử lại...")
             # Chờ 1 chút xíu để xe nhích vị trí hoặc camera ổn định lại
             time.sleep(0.2) 
 
     print("[SMART CAM] => Đã hết lượt thử. Không đọc được biển.")
-    return "UNKNOWN", final_img_path
+    return "UNKNOWN", final_img_path, shots
+
+def _timed_grab(cam_ip):
+    t = time.perf_counter()
+    timings = {}
+    frame, data = grab_frame(cam_ip, timings)
+    return frame, data, (time.perf_counter() - t) * 1000, timings
+
+def trace_timings(timings):
+    """Thời gian các bước chụp (đo ở thread tải ảnh) -> trace của lượt hiện tại"""
+    for stage, ms in timings.items():
+        tracer.add(stage, ms)
+
+def _capture_pipelined(cam_ip, label_prefix, max_retries):
+    """
+    Chế độ pipeline: trong lúc AI xử lý ảnh i, ảnh i+1 đã được tải song song.
+    Kết quả các shot được bỏ phiếu theo độ tin cậy, đủ ngưỡng thì dừng ngay.
+    """
+    reads = []        # [(chars, conf, img_path)]
+    shots = []
+    final_img_path = None
+    plate, conf = None, 0.0
+
+    pending = capture_pool.submit(_timed_grab, cam_ip)
+    for i in range(max_retries):
+        t_wait = time.perf_counter()
+        frame, data, cap_ms, timings = pending.result()
+        wait_ms = (time.perf_counter() - t_wait) * 1000
+        trace_timings(timings)
+
+        # Tải trước ảnh kế tiếp (speculative) trong lúc nhận diện ảnh hiện tại
+        pending = capture_pool.submit(_timed_grab, cam_ip) if i + 1 < max_retries else None
+
+        shot = {"shot": i + 1, "capture_ms": round(cap_ms, 1), "wait_ms": round(wait_ms, 1)}
+        shots.append(shot)
+        if frame is None:
+            shot["status"] = "CAM_FAIL"
+            continue
+
+        img_path = persist_capture(data, f"{label_prefix}_shot{i+1}", cam_ip, frame)
+        final_img_path = final_img_path or img_path
+
+        t_ai = time.perf_counter()
+        # Chỉ shot đầu được dùng cache: mỗi phiếu phải là 1 lần đọc thật
+        shot_plate, status, shot_conf, chars = recognize_frame(frame, img_path.replace(".jpg", "_debug.jpg"), cam_ip,
+                                                               use_cache=i == 0)
+        shot.update(infer_ms=round((time.perf_counter() - t_ai) * 1000, 1),
+                    status=status, plate=shot_plate, conf=shot_conf)
+
+        if shot_plate:
+            reads.append((chars, shot_conf, img_path))
+            plate, conf = vote_plate([r[0] for r in reads])
+            shot["vote"] = {"plate": plate, "conf": conf}
+            if conf >= CAPTURE_CONF_THRESHOLD:
+                print(f"[SMART CAM] => ĐÃ TÌM THẤY: {plate} (conf={conf}, dừng chụp)")
+                break
+
+    # Ảnh tải trước không dùng tới thì bỏ (không ghi đĩa)
+    if pending: pending.cancel()
+
+    if not plate:
+        print("[SMART CAM] => Đã hết lượt thử. Không đọc được biển.")
+        return "UNKNOWN", final_img_path, shots
+
+    # Ảnh hiển thị: shot khớp kết quả bỏ phiếu có conf cao nhất
+    matching = [r for r in reads if "".join(ch for ch, _ in r[0]) == plate]
+    if matching:
+        final_img_path = max(matching, key=lambda r: r[1])[2]
+    return plate, final_img_path, shots
 def is_plate_registered(plate):
-    """Kiểm tra biển số có trong danh sách đăng ký không"""
-    if not plate: return False
-    with get_db_connection() as conn:
-        row = conn.execute("SELECT * FROM registered_vehicles WHERE plate = ?", (plate,)).fetchone()
-        if row: return True # Có thể thêm logic check expiry_date tại đây
-    return False
+    """Kiểm tra biển số có trong danh sách đăng ký (và còn hạn) không - tra từ cache"""
+    return registered_cache.status(plate) == "ACTIVE"
 
-def capture_and_save(cam_ip, label):
+def fetch_jpeg(cam_ip):
+    """Lấy 1 ảnh JPEG (bytes) từ Camera IP qua kết nối keep-alive"""
+    return get_camera(cam_ip).fetch_jpeg()
+
+def grab_frame(cam_ip, timings=None):
     """
-    Chụp ảnh từ Camera IP và lưu file.
-    Phiên bản tối ưu cho ESP32-CAM "No Delay".
+    Lấy frame đã giải mã trong RAM. Trả về (frame, jpeg_bytes)
+    (Chế độ stream: lấy ngay frame mới nhất trong ring buffer)
     """
-    url = f"http://{cam_ip}/capture"
-    filename = f"{label}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.jpg"
-    filepath = os.path.join(CAPTURE_FOLDER, filename)
+    return get_camera(cam_ip).grab(timings=timings)
 
-    print(f"[CAM] Requesting {url}...")
-    
-    # Thử 3 lần, nhưng thử rất nhanh
-    for attempt in range(3):
-        try:
-            # Timeout 2s là đủ vì mạng LAN rất nhanh
-            resp = requests.get(url, timeout=2) 
-            
-            if resp.status_code == 200:
-                with open(filepath, 'wb') as f:
-                    f.write(resp.content)
-                # Chụp thành công -> Thoát ngay lập tức
-                return filepath
-        except Exception as e:
-            # Nếu lỗi mạng, chờ xíu rồi thử lại (0.1s)
-            print(f"[CAM] Retry {attempt+1} due to error: {e}")
-            time.sleep(0.1) 
-            
-    print(f"[CAM] Failed to capture from {cam_ip}")
-    return None
+def persist_capture(data, label, cam_ip=None, frame=None):
+    """
+    Đẩy file JPEG gốc sang evidence_writer để ghi nền (thư mục theo ngày / camera),
+    tạo thumbnail từ frame đã giải mã nếu có. Trả về đường dẫn
+    """
+    filepath = capture_store.path_for(label, cam_ip)
+    evidence_writer.write(filepath, data)
+    if frame is not None:
+        thumb_cache.submit(capture_rel(filepath), frame)
+    return filepath
 
-def process_plate_ai(image_path):
+def capture_frame(cam_ip, label, timings=None):
     """
-    Xử lý AI: YOLO Detect -> Crop -> Upscale -> Gray -> EasyOCR
+    Chụp ảnh vào RAM, không đọc lại từ đĩa.
+    Trả về (frame, filepath) hoặc (None, None)
     """
-    if not model or not reader:
-        print("[AI] Model chưa sẵn sàng")
-        return None, "AI_NOT_READY"
-    
-    # 1. Đọc ảnh
-    frame = cv2.imread(image_path)
-    if frame is None: return None, "READ_ERR"
+    frame, data = grab_frame(cam_ip, timings)
+    if frame is None: return None, None
+    return frame, persist_capture(data, label, cam_ip, frame)
+
+def capture_rel(image_path):
+    """'static/captures/a/b.jpg' -> 'a/b.jpg' (None nếu không phải ảnh chụp)"""
+    if not image_path: return None
+    path = image_path.replace("\\", "/")
+    prefix = CAPTURE_FOLDER.rstrip("/") + "/"
+    return path[len(prefix):] if path.startswith(prefix) else None
 
-    # 2. YOLO Detect
+def media_urls(image_path):
+    """URL ảnh gốc (chỉ mở khi click) + thumbnail cho bảng lịch sử / khung live"""
+    rel = capture_rel(image_path)
+    if rel is None:
+        return {"image_url": image_path, "thumb_url": image_path, "preview_url": image_path}
+    return {"image_url": f"/captures/{rel}", "thumb_url": f"/thumbs/sm/{rel}", "preview_url": f"/thumbs/md/{rel}"}
+
+def _yolo_boxes(frames, **kwargs):
+    """Chạy YOLO 1 lần cho cả list ảnh, trả về list box (x1, y1, x2, y2, conf) cho từng ảnh"""
     # conf=0.25: Giảm ngưỡng tự tin xuống để bắt được biển số dễ hơn
-    results = model.predict(frame, conf=0.25, verbose=False)
-    boxes = results[0].boxes
+    results = model.predict(frames, conf=0.25, verbose=False, **kwargs)
+    out = []
+    for r in results:
+        boxes = []
+        for b in r.boxes:
+            x1, y1, x2, y2 = map(int, b.xyxy[0].tolist())
+            boxes.append((x1, y1, x2, y2, float(b.conf[0])))
+        out.append(boxes)
+    return out
 
-    if len(boxes) == 0:
-        print("[AI] Không thấy đối tượng nào (No bounding box)")
-        return None, "NO_DETECTION"
+def _touches_cut_edge(box, region, shape, pad=2):
+    """Box chạm mép vùng cắt (mà mép đó không phải mép khung hình) -> có thể bị cắt mất 1 phần biển"""
+    x1, y1, x2, y2 = box[:4]
+    rx1, ry1, rx2, ry2 = region
+    h, w = shape[:2]
+    return ((rx1 > 0 and x1 <= rx1 + pad) or (ry1 > 0 and y1 <= ry1 + pad) or
+            (rx2 < w and x2 >= rx2 - pad) or (ry2 < h and y2 >= ry2 - pad))
 
-    # Lấy box có độ tin cậy cao nhất
-    best_box = max(boxes, key=lambda b: float(b.conf[0]))
-    x1, y1, x2, y2 = map(int, best_box.xyxy[0].tolist())
-    
-    # Cắt ảnh biển số
-    plate_img = frame[y1:y2, x1:x2]
+def yolo_detect_batch(frames, metas=None):
+    """
+    YOLO cho cả batch. Frame của camera đã học được ROI -> chạy trên ảnh cắt (ROI_IMGSZ),
+    không thấy biển trong vùng cắt -> chạy lại cùng các frame còn lại trên cả khung hình
+    """
+    t0 = time.perf_counter()
+    metas = metas or [{} for _ in frames]
+    out = [None] * len(frames)
+    hits = misses = 0
+    crop_ms = full_ms = None
 
-    # --- BƯỚC NÂNG CẤP XỬ LÝ ẢNH ---
-    
+    crops = []
+    if ROI_ENABLED:
+        for i, (frame, meta) in enumerate(zip(frames, metas)):
+            region = roi_registry.region(meta.get("cam"), frame.shape)
+            if region:
+                x1, y1, x2, y2 = region
+                crops.append((i, region, frame[y1:y2, x1:x2]))
+    if crops:
+        t = time.perf_counter()
+        results = _yolo_boxes([c[2] for c in crops], imgsz=ROI_IMGSZ)
+        crop_ms = (time.perf_counter() - t) * 1000 / len(crops)
+        for (i, region, _), boxes in zip(crops, results):
+            ox, oy = region[0], region[1]
+            boxes = [(x1 + ox, y1 + oy, x2 + ox, y2 + oy, c) for x1, y1, x2, y2, c in boxes]
+            best = max(boxes, key=lambda b: b[4]) if boxes else None
+            if best and not _touches_cut_edge(best, region, frames[i].shape):
+                out[i] = boxes
+                hits += 1
+            else:
+                roi_registry.miss(metas[i].get("cam"))
+                misses += 1
+
+    rest = [i for i in range(len(frames)) if out[i] is None]
+    if rest:
+        t = time.perf_counter()
+        results = _yolo_boxes([frames[i] for i in rest])
+        full_ms = (time.perf_counter() - t) * 1000 / len(rest)
+        for i, boxes in zip(rest, results):
+            out[i] = boxes
+
+    roi_registry.record(hits=hits, misses=misses, full=len(rest) - misses, crop_ms=crop_ms, full_ms=full_ms)
+    # Mọi frame trong batch đều phải chờ cả batch xong
+    batch_ms = (time.perf_counter() - t0) * 1000
+    for meta in metas:
+        meta["yolo_ms"] = batch_ms
+    return out
+
+def legacy_ocr(plate_img):
+    """Tiền xử lý cũ: Upscale 3x -> Gray -> Blur -> readtext. Trả về (ocr_res, gray)"""
     # 3. Phóng to ảnh (Upscale) - Rất quan trọng cho EasyOCR
     # Tăng kích thước lên gấp 3 lần
     plate_img = cv2.resize(plate_img, None, fx=3, fy=3, interpolation=cv2.INTER_CUBIC)
@@ -257,36 +631,248 @@ def process_plate_ai(image_path):
     # 5. Tăng độ tương phản (Tùy chọn: Dùng GaussianBlur để giảm nhiễu hạt)
     gray = cv2.GaussianBlur(gray, (5, 5), 0)
 
-    # Lưu ảnh đã xử lý ra để kiểm tra (Debug)
-    debug_path = image_path.replace(".jpg", "_debug.jpg")
-    cv2.imwrite(debug_path, gray)
-    # -------------------------------
-
     # 6. Đọc OCR (Thêm allowlist để chỉ đọc chữ và số)
-    try:
-        ocr_res = reader.readtext(gray, detail=0, allowlist='0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ.-')
-    except Exception as e:
-        print(f"[OCR ERR] {e}")
-        return None, "OCR_FAIL"
+    return reader.readtext(gray, detail=1, allowlist=OCR_ALLOWLIST), gray
+
+def read_plate_from_detections(frame, boxes, meta):
+    """
+    Phần hậu xử lý sau YOLO: Crop -> (Resize theo cỡ chữ -> Gray -> EasyOCR recognize)
+    (Chạy trên worker của InferenceEngine)
+    """
+    if len(boxes) == 0:
+        print("[AI] Không thấy đối tượng nào (No bounding box)")
+        return None, "NO_DETECTION", 0.0, []
+
+    # Lấy box có độ tin cậy cao nhất
+    x1, y1, x2, y2, _ = max(boxes, key=lambda b: b[4])
+    
+    # Cắt ảnh biển số
+    plate_img = frame[y1:y2, x1:x2]
+
+    if plate_img.size == 0:
+        return None, "NO_DETECTION", 0.0, []
+
+    # Crop gần trùng crop vừa đọc ở camera này (xe đứng yên) -> dùng lại kết quả OCR
+    cam = meta.get("cam")
+    meta["plate_box"] = (x1, y1, x2, y2)
+    ocr_res = None
+    fresh_ocr = False  # Vừa chạy OCR (không phải lấy từ cache) -> lưu vào cache nếu đọc ra biển
+    if RECOG_CACHE_ENABLED and cam is not None:
+        if meta.get("use_cache", True):
+            ocr_res, meta["crop_hash"] = recog_cache.lookup_ocr(cam, plate_img)
+        else:
+            meta["crop_hash"] = recog_cache.crop_key(plate_img)  # Vẫn lưu kết quả cho lượt sau
+
+    # --- XỬ LÝ ẢNH + ĐỌC OCR ---
+    if ocr_res is None:
+        t_ocr = time.perf_counter()
+        try:
+            if OCR_MODE == "adaptive":
+                ocr_res, gray = recognize_plate(reader, plate_img, allowlist=OCR_ALLOWLIST)
+                if not ocr_res:
+                    # Tách dòng / resize không hợp -> thử lại cách cũ
+                    ocr_res, gray = legacy_ocr(plate_img)
+            else:
+                ocr_res, gray = legacy_ocr(plate_img)
+        except Exception as e:
+            print(f"[OCR ERR] {e}")
+            return None, "OCR_FAIL", 0.0, []
+        finally:
+            meta["ocr_ms"] = (time.perf_counter() - t_ocr) * 1000
+        fresh_ocr = True
+
+        # Lưu ảnh đã xử lý ra để kiểm tra (Chỉ khi bật DEBUG_AI, ghi nền)
+        debug_path = meta.get("debug_path")
+        if DEBUG_AI and debug_path:
+            ok, buf = cv2.imencode(".jpg", gray)
+            if ok: evidence_writer.write(debug_path, buf.tobytes())
+    # -------------------------------
     
     if not ocr_res:
         print(f"[OCR] Không đọc được chữ nào trong box {x1,y1,x2,y2}")
-        return None, "OCR_EMPTY"
+        return None, "OCR_EMPTY", 0.0, []
     
     # Ghép các từ lại (VD: đọc ra ['76A', '222.22'] -> '76A22222')
-    raw_text = "".join(ocr_res)
+    raw_text = "".join(text for _, text, _ in ocr_res)
     print(f"[OCR RAW] Đọc được: '{raw_text}'") # In ra xem nó đọc được gì
 
     final_plate = normalize_plate(raw_text)
     
     if final_plate:
-        print(f"[AI SUCCESS] Biển số chuẩn: {final_plate}")
-        return final_plate, "SUCCESS"
+        # Độ tin cậy từng ký tự (lấy theo đoạn OCR chứa ký tự đó) để bỏ phiếu nhiều shot
+        chars = [(ch, float(c)) for _, text, c in ocr_res for ch in text.upper() if ch.isalnum()]
+        conf = round(min(c for _, c in chars), 4)
+        roi_registry.observe(cam, (x1, y1, x2, y2), frame.shape)
+        if fresh_ocr and "crop_hash" in meta:
+            recog_cache.store_ocr(cam, meta["crop_hash"], ocr_res, "SUCCESS")
+        print(f"[AI SUCCESS] Biển số chuẩn: {final_plate} (conf={conf})")
+        return final_plate, "SUCCESS", conf, chars
     else:
         print(f"[AI FAIL] Chuẩn hóa thất bại từ: {raw_text}")
-        return None, "INVALID_FORMAT"
-def emit_realtime(event, payload):
-    socketio.emit(event, payload)
+        return None, "INVALID_FORMAT", 0.0, []
+
+# Worker dùng chung cho mọi làn: bật trong on_models_ready khi model đã sẵn sàng
+if AI_BACKGROUND_LOAD:
+    model_loader.start()
+else:
+    model_loader.load()
+
+def recognize_frame(frame, debug_path=None, cam=None, use_cache=True):
+    """
+    Gửi frame vào InferenceEngine (YOLO batch + OCR) và chờ kết quả.
+    Trả về (plate, status, conf, chars) - chars là [(ký_tự, conf)] dùng để bỏ phiếu
+    use_cache=False: không dùng lại kết quả trong cache (shot chụp lại trong cùng 1 lượt - kết quả
+    cache của shot trước mà tính thêm 1 phiếu thì độ tin cậy bỏ phiếu bị thổi phồng), vẫn lưu vào cache
+    """
+    if not ai_engine and model_loader.state in ("loading", "warming"):
+        # Xe tới khi model còn đang nạp -> chờ thêm 1 chút thay vì trả UNKNOWN ngay
+        model_loader.ready.wait(AI_TIMEOUT)
+    if not ai_engine:
+        print("[AI] Model chưa sẵn sàng")
+        tracer.count_status("AI_NOT_READY", CAM_GATES.get(cam))
+        return None, "AI_NOT_READY", 0.0, []
+    if frame is None:
+        tracer.count_status("READ_ERR", CAM_GATES.get(cam))
+        return None, "READ_ERR", 0.0, []
+
+    # Khung gần trùng khung vừa nhận diện ở camera này -> trả lại kết quả cũ, không chạy YOLO + OCR
+    cache_key = cached = None
+    if RECOG_CACHE_ENABLED and cam is not None:
+        with tracer.span("frame_cache"):
+            if use_cache:
+                cached, cache_key = recog_cache.lookup(cam, frame)
+            else:
+                cache_key = recog_cache.frame_key(frame)
+        if cached is not None:
+            print(f"[AI CACHE] Ảnh gần trùng ảnh trước -> dùng lại kết quả ({cached[1]} {cached[0] or ''})")
+            tracer.count_status(cached[1], CAM_GATES.get(cam))
+            return cached
+
+    # Worker ghi yolo_ms / ocr_ms vào meta, phần còn lại là thời gian chờ gom batch
+    meta = {"debug_path": debug_path, "cam": cam, "use_cache": use_cache}
+    t = time.perf_counter()
+    future = ai_engine.submit(frame, meta)
+    try:
+        result = future.result(timeout=AI_TIMEOUT)
+    except Exception as e:
+        print(f"[AI ERR] {e}")
+        result = None, "AI_FAIL", 0.0, []
+    total_ms = (time.perf_counter() - t) * 1000
+    yolo_ms, ocr_ms = meta.get("yolo_ms"), meta.get("ocr_ms")
+    if yolo_ms is not None:
+        tracer.add("ai_wait", max(0.0, total_ms - yolo_ms - (ocr_ms or 0)))
+        tracer.add("yolo", yolo_ms)
+    if ocr_ms is not None:
+        tracer.add("ocr", ocr_ms)
+    tracer.count_status(result[1], CAM_GATES.get(cam))
+    if cache_key is not None:
+        recog_cache.store(cam, cache_key, result, meta.get("plate_box"), meta.get("crop_hash"))
+    return result
+
+def emit_realtime(event, payload, room=ROOM_LOGS):
+    # Gọi được từ thread của job, background task của SocketIO sẽ phát đi
+    with tracer.span("socket_emit"):
+        realtime.emit(event, payload, to=room)
+
+def run_gate_job(kind, fn, *args):
+    """
+    Chạy handler của cổng trên thread pool.
+    ?mode=async -> trả job_id ngay (202), cổng hỏi lại qua /api/jobs/<id>
+    Mặc định    -> chờ kết quả (nhường CPU cho request khác) rồi trả như cũ
+    """
+    job = gate_jobs.submit(kind, fn, *args)
+    if request.args.get("mode") == "async":
+        return jsonify({"status": "queued", "job_id": job.id, "poll": f"/api/jobs/{job.id}"}), 202
+
+    if not gate_jobs.wait(job, GATE_JOB_TIMEOUT):
+        return jsonify({"status": "pending", "job_id": job.id, "poll": f"/api/jobs/{job.id}"}), 202
+    if job.state == "error":
+        return jsonify({"status": "error", "msg": job.error}), 500
+    body, code = job.result
+    return jsonify(body), code
+
+# ======================================
+# NHIỀU WORKER: CHUYỂN TIẾP REQUEST / LỆNH
+# ======================================
+forward_http = requests.Session()  # Keep-alive tới các worker khác trên cùng máy
+
+def worker_url(worker):
+    return f"http://127.0.0.1:{WORKER_PORT_BASE + worker}"
+
+def forward_to(worker, timeout=GATE_JOB_TIMEOUT + 5):
+    """Chuyển nguyên request sang worker khác, trả lại đúng body + mã HTTP của worker đó"""
+    headers = {FORWARD_HEADER: str(WORKER_ID)}
+    if request.content_type:
+        headers["Content-Type"] = request.content_type
+    try:
+        r = forward_http.request(request.method, worker_url(worker) + request.full_path,
+                                 data=request.get_data(), headers=headers, timeout=timeout)
+    except requests.RequestException as e:
+        print(f"[CLUSTER] Chuyển tới worker {worker} lỗi: {e}")
+        return jsonify({"status": "error", "msg": f"Worker {worker} không phản hồi"}), 502
+    return Response(r.content, status=r.status_code, content_type=r.headers.get("Content-Type"))
+
+def resolve_gate(kind):
+    """?gate=<id> (hoặc "gate" trong JSON), ?lot=<id>; mặc định: cổng đúng loại của bãi đầu tiên"""
+    data = request.get_json(silent=True) or {}
+    return lot_registry.resolve(kind, request.args.get("gate") or data.get("gate"),
+                                request.args.get("lot") or data.get("lot"))
+
+def lane_owner(gate):
+    """Worker giữ làn này (None = xử lý tại đây)"""
+    owner = lot_registry.owner(gate.id, WORKER_COUNT)
+    if owner == WORKER_ID or request.headers.get(FORWARD_HEADER):
+        return None
+    return owner
+
+# Trạng thái chỉ có ở worker chính (hàng đợi lệnh, lịch sử cảm biến) -> worker khác chuyển về
+PRIMARY_ENDPOINTS = {"api_get_command", "api_command_ack", "api_command_stats",
+                     "api_update_data", "api_sensors_history", "api_sensors_stats"}
+
+@app.before_request
+def forward_primary_only():
+    if not IS_PRIMARY and request.endpoint in PRIMARY_ENDPOINTS and not request.headers.get(FORWARD_HEADER):
+        return forward_to(0, timeout=COMMAND_MAX_WAIT + 5)
+
+def send_command(gate, name):
+    """Lệnh barie qua broker tới hàng đợi ở worker chính, trả về id lệnh"""
+    cmd_id = command_bus.new_id()
+    broker.publish(CHANNEL_COMMANDS, {"op": "enqueue", "id": cmd_id, "gate": gate, "command": name})
+    return cmd_id
+
+def gate_listener(gate, op):
+    """Thiết bị vào (attach) / rời (detach) room gate:<cổng> -> đếm ở hàng đợi lệnh của worker chính"""
+    if IS_PRIMARY:
+        getattr(command_bus, op)(gate)
+    else:
+        broker.publish(CHANNEL_COMMANDS, {"op": op, "gate": gate})
+
+def ack_command(cmd_id, sid=None):
+    """
+    Xác nhận lệnh qua socket. Worker khác gửi ack qua broker tới worker chính (giữ hàng đợi) thay vì
+    chờ HTTP ngay trong handler socket (chặn hub eventlet) -> trả None, kết quả tới socket sid qua
+    sự kiện command_ack_result
+    """
+    if not cmd_id:
+        return False
+    if IS_PRIMARY:
+        return command_bus.ack(cmd_id)
+    broker.publish(CHANNEL_COMMANDS, {"op": "ack", "id": cmd_id, "sid": sid})
+    return None
+
+def worker_heartbeat():
+    """worker:<id> trong broker hết hạn sau 3 nhịp -> /api/cluster chỉ thấy worker còn sống"""
+    owned = [g for g in lot_registry.gates if lot_registry.owner(g, WORKER_COUNT) == WORKER_ID]
+    while True:
+        try:
+            broker.set(f"worker:{WORKER_ID}", json.dumps({
+                "id": WORKER_ID, "pid": os.getpid(), "url": worker_url(WORKER_ID), "gates": owned,
+                "ai_ready": ai_engine is not None, "jobs": gate_jobs.stats()}), ex=WORKER_HEARTBEAT * 3)
+        except Exception as e:
+            print(f"[CLUSTER] Heartbeat lỗi: {e}")
+        socketio.sleep(WORKER_HEARTBEAT)
+
+socketio.start_background_task(worker_heartbeat)
 
 # ======================================
 # 5. WEB ROUTES (UI)
@@ -306,7 +892,31 @@ def registered_page():
 
 @app.route('/captures/<path:filename>')
 def serve_capture(filename):
-    return send_file(os.path.join(CAPTURE_FOLDER, filename))
+    path = safe_join(CAPTURE_FOLDER, filename)
+    if path is None: abort(404)
+    # Ảnh vừa chụp có thể chưa ghi xong xuống đĩa -> trả từ RAM
+    data = evidence_writer.pending(path)
+    if data is not None:
+        return send_file(BytesIO(data), mimetype="image/jpeg")
+    if not os.path.exists(path):
+        # Ngày cũ đã được đóng gói -> đọc từ YYYY/MM/DD.zip
+        data = capture_store.read(filename)
+        if data is None: abort(404)
+        return send_file(BytesIO(data), mimetype="image/jpeg", max_age=CAPTURE_CACHE_MAX_AGE)
+    # ETag + Last-Modified: trình duyệt hỏi lại chỉ nhận 304
+    return send_file(path, conditional=True, etag=True, max_age=CAPTURE_CACHE_MAX_AGE)
+
+@app.route('/thumbs/<size>/<path:filename>')
+def serve_thumbnail(size, filename):
+    """Ảnh thu nhỏ của /captures/<filename> (filename là đường dẫn ảnh gốc)"""
+    src = safe_join(CAPTURE_FOLDER, filename)
+    if src is None: abort(404)
+    path, data = thumb_cache.get(size, filename, evidence_writer.pending(src))
+    if path is None: abort(404)
+    if data is not None:
+        return send_file(BytesIO(data), mimetype=thumb_cache.mimetype, max_age=60)
+    return send_file(path, mimetype=thumb_cache.mimetype, conditional=True, etag=True,
+                     max_age=CAPTURE_CACHE_MAX_AGE)
 
 # ======================================
 # 6. API ROUTES (QUẢN LÝ DỮ LIỆU)
@@ -314,40 +924,232 @@ def serve_capture(filename):
 # ======================================
 # API ROUTES (QUẢN LÝ DỮ LIỆU)
 # ======================================
-@app.route('/api/history', methods=['GET'])
-def api_history():
-    # Lấy tham số từ URL: ?start=2023-11-01&end=2023-11-05
-    start_date = request.args.get('start')
-    end_date = request.args.get('end')
-    
-    conn = get_db_connection()
-    
-    # Nếu có chọn ngày, lọc theo ngày
+HISTORY_FIELDS = ["id", "plate", "rfid_uid", "entry_time", "exit_time", "fee", "image_path", "status"]
+HISTORY_PAGE_MAX = 1000
+
+def history_query(args):
+    """
+    Dựng câu SQL lịch sử từ tham số URL:
+    start/end (ngày), cursor (id của dòng cuối trang trước), fields (chọn cột)
+    Trả về (sql, params, fields)
+    """
+    fields = [f for f in (args.get("fields") or "").split(",") if f in HISTORY_FIELDS] or HISTORY_FIELDS
+    if "id" not in fields:
+        fields = ["id"] + fields  # Cần id để làm cursor
+
+    where, params = [], []
+    start_date, end_date = args.get('start'), args.get('end')
     if start_date and end_date:
         # Thêm giờ vào để lấy trọn vẹn ngày bắt đầu và ngày kết thúc
         # VD: 2023-11-01 00:00:00 đến 2023-11-01 23:59:59
-        start_str = f"{start_date} 00:00:00"
-        end_str = f"{end_date} 23:59:59"
-        
-        sql = """
-            SELECT * FROM parking_log 
-            WHERE entry_time >= ? AND entry_time <= ? 
-            ORDER BY id DESC
-        """
-        rows = conn.execute(sql, (start_str, end_str)).fetchall()
-        
-    else:
-        # Mặc định: Lấy 50 tin mới nhất (như cũ)
-        rows = conn.execute("SELECT * FROM parking_log ORDER BY id DESC LIMIT 50").fetchall()
-        
-    conn.close()
-    return jsonify([dict(r) for r in rows])
+        where.append("entry_time >= ? AND entry_time <= ?")
+        params += [f"{start_date} 00:00:00", f"{end_date} 23:59:59"]
+
+    cursor = args.get("cursor", type=int)
+    if cursor:
+        where.append("id < ?")
+        params.append(cursor)
+
+    sql = f"SELECT {', '.join(fields)} FROM parking_log"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += " ORDER BY id DESC"
+    return sql, params, fields
+
+def iter_history_rows(sql, params, batch=500, media=False):
+    """
+    Đọc dần theo từng lô bằng cursor, không giữ toàn bộ kết quả trong RAM.
+    Chạy khi response đang stream (sau teardown của request) -> tự trả kết nối về pool khi đọc xong
+    hoặc client ngắt giữa chừng
+    """
+    try:
+        cur = get_db_connection().execute(sql, params)
+        while True:
+            rows = cur.fetchmany(batch)
+            if not rows: break
+            for r in rows:
+                yield history_item(r) if media else dict(r)
+    finally:
+        db_pool.release()
+
+def history_item(row):
+    """Dòng lịch sử cho web: thêm thumb_url (hiện trong bảng) và image_url (ảnh gốc khi click)"""
+    item = dict(row)
+    if "image_path" in item:
+        urls = media_urls(item["image_path"])
+        item["image_url"], item["thumb_url"] = urls["image_url"], urls["thumb_url"]
+    return item
+
+@app.route('/api/history', methods=['GET'])
+def api_history():
+    """
+    ?limit=N[&cursor=id]  -> 1 trang: {"items": [...], "next_cursor": id | null}
+    ?start=...&end=...     -> toàn bộ khoảng ngày (stream mảng JSON, như cũ)
+    Không tham số          -> 50 tin mới nhất (như cũ)
+    Tùy chọn: &fields=id,plate,status (chọn cột)
+    """
+    sql, params, _ = history_query(request.args)
+    conn = get_db_connection()
+
+    # Phân trang keyset theo id
+    if request.args.get("limit") or request.args.get("cursor"):
+        limit = max(1, min(request.args.get("limit", 200, type=int), HISTORY_PAGE_MAX))
+        rows = conn.execute(sql + " LIMIT ?", params + [limit + 1]).fetchall()
+        items = [history_item(r) for r in rows[:limit]]
+        next_cursor = items[-1]["id"] if len(rows) > limit else None
+        return jsonify({"items": items, "next_cursor": next_cursor})
+
+    # Nếu có chọn ngày, stream cả khoảng (không fetchall)
+    if request.args.get('start') and request.args.get('end'):
+        def generate():
+            yield "["
+            for i, row in enumerate(iter_history_rows(sql, params, media=True)):
+                yield ("," if i else "") + json.dumps(row, ensure_ascii=False)
+            yield "]"
+        return Response(stream_with_context(generate()), mimetype="application/json")
+
+    # Mặc định: Lấy 50 tin mới nhất (như cũ)
+    rows = conn.execute(sql + " LIMIT 50", params).fetchall()
+    return jsonify([history_item(r) for r in rows])
+
+class _LineBuffer:
+    """File giả cho csv.writer: trả lại từng dòng vừa ghi"""
+    def write(self, line):
+        return line
+
+@app.route('/api/history/export', methods=['GET'])
+def api_history_export():
+    """Xuất lịch sử dạng stream: ?format=ndjson|csv (+ start/end/cursor/fields như /api/history)"""
+    sql, params, fields = history_query(request.args)
+    fmt = request.args.get("format", "ndjson")
+
+    if fmt == "csv":
+        writer = csv.writer(_LineBuffer())
+        def generate():
+            yield writer.writerow(fields)
+            for row in iter_history_rows(sql, params):
+                yield writer.writerow([row[f] for f in fields])
+        return Response(stream_with_context(generate()), mimetype="text/csv",
+                        headers={"Content-Disposition": "attachment; filename=parking_history.csv"})
+
+    def generate():
+        for row in iter_history_rows(sql, params):
+            yield json.dumps(row, ensure_ascii=False) + "\n"
+    return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
+
+@app.route('/api/stats', methods=['GET'])
+def api_stats():
+    """
+    Doanh thu / lượt vào-ra / thời gian gửi TB cho khoảng ngày, đọc từ bảng tổng hợp.
+    ?start=YYYY-MM-DD&end=YYYY-MM-DD&group=day|hour (mặc định: hôm nay, theo giờ)
+    """
+    today = datetime.now().strftime("%Y-%m-%d")
+    start = request.args.get('start') or today
+    end = request.args.get('end') or start
+    try:
+        datetime.strptime(start, "%Y-%m-%d")
+        datetime.strptime(end, "%Y-%m-%d")
+    except ValueError:
+        return jsonify({"status": "error", "msg": "start/end phải dạng YYYY-MM-DD"}), 400
+    group = request.args.get('group') or ("hour" if start == end else "day")
+    if group not in ("day", "hour"):
+        return jsonify({"status": "error", "msg": "group = day | hour"}), 400
+    return jsonify(query_stats(get_db_connection(), start, end, group))
+
+@app.route('/api/storage/stats', methods=['GET'])
+def api_storage_stats():
+    """Dung lượng ảnh theo loại + kết quả dọn dẹp gần nhất. ?refresh=1 để quét lại ngay"""
+    if request.args.get("refresh") == "1" or capture_store.last_usage is None:
+        capture_store.usage()
+    return jsonify({**capture_store.stats(), "writer": evidence_writer.stats(), "thumbs": thumb_cache.stats()})
+
+@app.route('/api/ready', methods=['GET'])
+def api_ready():
+    """Readiness: 200 khi AI đã nạp + warm-up xong, 503 khi đang nạp"""
+    status = model_loader.status()
+    return jsonify(status), (200 if status["ready"] else 503)
+
+@app.route('/api/ai/stats', methods=['GET'])
+def api_ai_stats():
+    """
+    Thống kê micro-batch (kích thước, độ trễ) + tỉ lệ trúng ROI để tinh chỉnh AI_BATCH_WAIT_MS / ROI_IMGSZ
+    + số lần dùng lại kết quả cho ảnh gần trùng (cache)
+    """
+    if not ai_engine:
+        return jsonify({"status": "not_ready"}), 503
+    return jsonify({**ai_engine.stats(), "roi": roi_registry.stats(), "cache": recog_cache.stats()})
+
+@app.route('/api/capture/stats', methods=['GET'])
+def api_capture_stats():
+    """Thời gian chụp/nhận diện của các lượt gần nhất, tách theo chế độ chụp"""
+    summary = {}
+    for mode in ("pipelined", "serial"):
+        reps = [r for r in capture_reports if r["mode"] == mode]
+        if reps:
+            summary[mode] = {
+                "count": len(reps),
+                "avg_total_ms": round(sum(r["total_ms"] for r in reps) / len(reps), 1),
+                "avg_shots": round(sum(len(r["shots"]) for r in reps) / len(reps), 2),
+            }
+    return jsonify({"mode": CAPTURE_MODE, "summary": summary, "recent": list(capture_reports)[-20:]})
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Histogram thời gian từng bước / cả lượt theo cổng + đếm trạng thái nhận diện (Prometheus scrape)"""
+    return Response(metrics.render(), content_type=METRICS_CONTENT_TYPE)
+
+@app.route('/api/traces', methods=['GET'])
+def api_traces():
+    """Các lượt xử lý gần nhất (span từng bước) + thời gian TB từng bước theo cổng. ?n=50"""
+    n = min(max(request.args.get("n", 50, type=int), 1), 200)
+    return jsonify({"summary": tracer.summary(), "recent": tracer.recent(n)})
+
+@app.route('/api/cameras', methods=['GET'])
+def api_cameras():
+    return jsonify({ip: cam.stats() for ip, cam in cameras.items()})
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def api_job_status(job_id):
+    """Cổng hỏi kết quả job. ?wait=N: chờ tối đa N giây (long-poll) trước khi trả lời"""
+    job = gate_jobs.get(job_id)
+    if not job:
+        owner = re.match(r"w(\d+)-", job_id)
+        if owner and int(owner.group(1)) != WORKER_ID and not request.headers.get(FORWARD_HEADER):
+            return forward_to(int(owner.group(1)))  # Job của làn thuộc worker khác
+        return jsonify({"status": "error", "msg": "Job not found"}), 404
+    wait = min(float(request.args.get("wait", 0) or 0), GATE_JOB_TIMEOUT)
+    if wait > 0:
+        gate_jobs.wait(job, wait)
+
+    info = job.to_dict()
+    if job.state == "done":
+        body, code = job.result
+        info["code"] = code
+        info["result"] = body
+    return jsonify(info)
+
+@app.route('/api/jobs', methods=['GET'])
+def api_jobs_stats():
+    return jsonify(gate_jobs.stats())
+
+@app.route('/api/lots', methods=['GET'])
+def api_lots():
+    return jsonify(lot_registry.to_dict(WORKER_COUNT))
+
+@app.route('/api/cluster', methods=['GET'])
+def api_cluster():
+    """Worker đang trả lời + các worker còn sống (theo heartbeat trong broker)"""
+    alive = []
+    for key in broker.keys("worker:*"):
+        info = broker.get(key)
+        if info: alive.append(json.loads(info))
+    return jsonify({"worker": WORKER_ID, "workers": WORKER_COUNT, "primary": IS_PRIMARY,
+                    "broker": broker.stats(), "alive": sorted(alive, key=lambda w: w["id"])})
 
 @app.route('/api/registered', methods=['GET'])
 def api_get_registered():
     conn = get_db_connection()
     rows = conn.execute("SELECT * FROM registered_vehicles ORDER BY id DESC").fetchall()
-    conn.close()
     return jsonify([dict(r) for r in rows])
 
 @app.route('/api/registered', methods=['POST'])
@@ -356,20 +1158,31 @@ def api_add_registered():
     plate = normalize_plate(data.get('plate'))
     if not plate: return jsonify({"status": "error", "msg": "Invalid Plate"}), 400
     
+    # Hạn vé tháng: truyền thẳng expiry_date (YYYY-MM-DD) hoặc số ngày (days)
+    expiry = data.get('expiry_date')
+    if not expiry and data.get('days'):
+        try:
+            expiry = (datetime.now() + timedelta(days=int(data.get('days')))).strftime("%Y-%m-%d")
+        except ValueError:
+            return jsonify({"status": "error", "msg": "Invalid days"}), 400
+    vehicle_type = data.get('type') or data.get('vehicle_type')
+
     with get_db_connection() as conn:
         try:
-            conn.execute("INSERT INTO registered_vehicles (plate, owner, vehicle_type) VALUES (?, ?, ?)",
-                         (plate, data.get('owner'), data.get('type')))
+            conn.execute("INSERT INTO registered_vehicles (plate, owner, vehicle_type, expiry_date) VALUES (?, ?, ?, ?)",
+                         (plate, data.get('owner'), vehicle_type, expiry))
             conn.commit()
         except:
             return jsonify({"status": "error", "msg": "Plate exists"}), 400
-    return jsonify({"status": "ok"})
+    registered_cache.put(plate, expiry, vehicle_type, data.get('owner'))
+    return jsonify({"status": "ok", "plate": plate})
 
 @app.route('/api/registered/<plate>', methods=['DELETE'])
 def api_del_registered(plate):
     with get_db_connection() as conn:
         conn.execute("DELETE FROM registered_vehicles WHERE plate=?", (plate,))
         conn.commit()
+    registered_cache.remove(plate)
     return jsonify({"status": "ok"})
 
 # ======================================
@@ -387,66 +1200,201 @@ def api_update_data():
         "free_slots": slots.count(0),
         "mq135": data.get("mq135", 0)
     }
-    emit_realtime("sensor_update", payload)
+    sensor_fanout.update(payload)  # Phát đi ở tick kế tiếp nếu có thay đổi
+    sensor_history.write(slots, payload["mq135"])
     return jsonify({"status": "ok"})
+
+@app.route('/api/realtime/stats', methods=['GET'])
+def api_realtime_stats():
+    return jsonify({"sensors": sensor_fanout.stats(), "sent": realtime.sent, "pending": realtime.pending()})
+
+def _parse_time_ms(value, default):
+    """Epoch (giây) hoặc 'YYYY-MM-DD[ HH:MM[:SS]]' giờ địa phương -> epoch ms"""
+    if not value:
+        return default
+    try:
+        return int(float(value) * 1000)
+    except ValueError:
+        pass
+    for fmt in ("%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M", "%Y-%m-%d"):
+        try:
+            return int(datetime.strptime(value, fmt).timestamp() * 1000)
+        except ValueError:
+            continue
+    raise ValueError(value)
+
+@app.route('/api/sensors/history', methods=['GET'])
+def api_sensors_history():
+    """
+    Dữ liệu biểu đồ slot / MQ135. ?start=&end= (epoch giây hoặc YYYY-MM-DD HH:MM, mặc định 1 giờ qua)
+    &tier=auto|raw|1m|1h &points=600 (số điểm tối đa khi tier=auto). t trả về là epoch ms
+    """
+    now = int(time.time() * 1000)
+    try:
+        end = _parse_time_ms(request.args.get('end'), now)
+        start = _parse_time_ms(request.args.get('start'), end - 3600 * 1000)
+        points = max(10, min(int(request.args.get('points', 600)), 20000))
+    except ValueError:
+        return jsonify({"status": "error", "msg": "start/end phải là epoch giây hoặc YYYY-MM-DD HH:MM"}), 400
+    tier = request.args.get('tier', 'auto')
+    if tier not in ("auto", "raw", "1m", "1h"):
+        return jsonify({"status": "error", "msg": "tier = auto | raw | 1m | 1h"}), 400
+    if end <= start:
+        return jsonify({"status": "error", "msg": "end phải sau start"}), 400
+    return jsonify({"start": start, "end": end, **sensor_history.query(start, end, tier=tier, max_points=points)})
+
+@app.route('/api/sensors/stats', methods=['GET'])
+def api_sensors_stats():
+    return jsonify(sensor_history.stats())
+
 # ======================================
-# THÊM BIẾN TOÀN CỤC ĐỂ LƯU HÀNG ĐỢI LỆNH
+# SOCKET.IO ROOMS
 # ======================================
-command_queue = []
+def _join_rooms(names):
+    joined = []
+    for name in names:
+        if name in ROOMS:
+            join_room(name)
+            joined.append(name)
+        elif name.startswith("gate:") and name[5:] in command_bus.gates:
+            # Thiết bị cổng giữ socket -> lệnh mới được đẩy ngay thay vì chờ long-poll
+            join_room(name)
+            gate_listener(name[5:], "attach")
+            joined.append(name)
+    # Client mới vào room cảm biến nhận ngay trạng thái hiện tại, không chờ thay đổi kế tiếp
+    state = sensor_fanout.snapshot()
+    if ROOM_SENSORS in joined and state:
+        emit("sensor_update", state)
+    return joined
+
+@socketio.on('connect')
+def on_socket_connect(auth=None):
+    # io({query: {rooms: "logs"}}) -> chỉ nhận log; không khai báo -> nhận tất cả (client cũ)
+    rooms = request.args.get("rooms")
+    _join_rooms(rooms.split(",") if rooms else ROOMS)
+
+@socketio.on('disconnect')
+def on_socket_disconnect():
+    for name in socket_rooms():
+        if name.startswith("gate:"): gate_listener(name[5:], "detach")
+
+@socketio.on('command_ack')
+def on_socket_command_ack(data):
+    # acked = None: đang xác nhận ở worker chính, kết quả gửi lại qua sự kiện command_ack_result
+    cmd_id = (data or {}).get("id")
+    return {"id": cmd_id, "acked": ack_command(cmd_id, request.sid)}
 
+@socketio.on('subscribe')
+def on_socket_subscribe(data):
+    return {"rooms": _join_rooms((data or {}).get("rooms", []))}
+
+@socketio.on('unsubscribe')
+def on_socket_unsubscribe(data):
+    for name in (data or {}).get("rooms", []):
+        if name in ROOMS: leave_room(name)
+        elif name.startswith("gate:") and name in socket_rooms():
+            leave_room(name)
+            gate_listener(name[5:], "detach")
 # ======================================
 # API: NHẬN LỆNH TỪ WEB (ADMIN BẤM NÚT)
 # ======================================
+MANUAL_COMMANDS = {"open_entry": ("entry", "OPEN_ENTRY"), "open_exit": ("exit", "OPEN_EXIT")}  # -> (loại cổng, lệnh)
+
 @app.route('/api/control/<action>', methods=['POST'])
 def api_manual_control(action):
-    global command_queue
-    
-    if action == "open_entry":
-        command_queue.append("OPEN_ENTRY") # Bỏ lệnh vào hộp thư
-        print("[MANUAL] Lệnh đã vào hàng đợi: OPEN_ENTRY")
-        return jsonify({"status": "ok", "msg": "Đang mở cổng VÀO..."})
-        
-    elif action == "open_exit":
-        command_queue.append("OPEN_EXIT") # Bỏ lệnh vào hộp thư
-        print("[MANUAL] Lệnh đã vào hàng đợi: OPEN_EXIT")
-        return jsonify({"status": "ok", "msg": "Đang mở cổng RA..."})
-        
-    return jsonify({"status": "error", "msg": "Lệnh không hợp lệ"}), 400
+    if action not in MANUAL_COMMANDS:
+        return jsonify({"status": "error", "msg": "Lệnh không hợp lệ"}), 400
+
+    kind, name = MANUAL_COMMANDS[action]
+    gate = resolve_gate(kind)
+    if gate is None:
+        return jsonify({"status": "error", "msg": "Cổng không hợp lệ"}), 400
+    cmd_id = send_command(gate.id, name)  # Bỏ lệnh vào hộp thư của cổng
+    print(f"[MANUAL] Lệnh đã vào hàng đợi: {name} ({gate.id})")
+    msg = "Đang mở cổng VÀO..." if kind == "entry" else "Đang mở cổng RA..."
+    return jsonify({"status": "ok", "msg": msg, "command_id": cmd_id})
 
 # ======================================
-# API MỚI: ĐỂ ESP32 KIỂM TRA LỆNH (POLLING)
+# API: ĐỂ ESP32 LẤY LỆNH (POLLING / LONG-POLL)
 # ======================================
 @app.route('/api/get_command', methods=['GET'])
 def api_get_command():
-    global command_queue
-    if len(command_queue) > 0:
-        # Lấy lệnh đầu tiên ra và gửi cho ESP32
-        cmd = command_queue.pop(0)
-        return jsonify({"command": cmd})
+    """
+    ?gate=<id cổng>   -> chỉ lấy lệnh của cổng đó
+    ?lot=<id bãi>     -> không có gate: lấy lệnh của mọi cổng trong bãi (mặc định: bãi đầu tiên;
+                         cấu hình 1 bãi = mọi cổng, như bản cũ). Bộ điều khiển không lấy nhầm lệnh bãi khác
+    ?wait=N           -> chưa có lệnh thì giữ request tối đa N giây (long-poll)
+    ?ack=1            -> lệnh phải được xác nhận qua /api/command/<id>/ack, không thì giao lại
+    """
+    gate = request.args.get("gate")
+    if gate:
+        if gate not in command_bus.gates:
+            return jsonify({"status": "error", "msg": "Cổng không hợp lệ"}), 400
+        gates = [gate]
     else:
+        lot = lot_registry.lots.get(request.args.get("lot") or lot_registry.default_lot)
+        if lot is None:
+            return jsonify({"status": "error", "msg": "Bãi không hợp lệ"}), 400
+        gates = lot["gates"]
+    wait = min(float(request.args.get("wait", 0) or 0), COMMAND_MAX_WAIT)
+    want_ack = request.args.get("ack") == "1"
+
+    cmd = command_bus.take(gates, wait=wait, want_ack=want_ack)
+    if cmd is None:
         return jsonify({"command": "none"})
+    return jsonify({"command": cmd.name, "id": cmd.id, "gate": cmd.gate})
+
+@app.route('/api/command/<cmd_id>/ack', methods=['POST'])
+def api_command_ack(cmd_id):
+    if command_bus.ack(cmd_id):
+        return jsonify({"status": "ok"})
+    return jsonify({"status": "error", "msg": "Lệnh không tồn tại hoặc đã xác nhận"}), 404
+
+@app.route('/api/commands/stats', methods=['GET'])
+def api_command_stats():
+    return jsonify(command_bus.stats())
+
 # --- API CAMERA (Nhận diện biển số - Multi Shot) ---
 @app.route('/api/parking/<action>', methods=['POST'])
 def api_parking_camera(action):
-    cam_ip = CAM_ENTRY_IP if action == 'entry' else CAM_EXIT_IP
+    gate = resolve_gate(action)
+    if gate is None:
+        return jsonify({"status": "error", "msg": "Cổng không hợp lệ"}), 400
+    owner = lane_owner(gate)
+    if owner is not None:
+        return forward_to(owner)  # Làn do worker khác xử lý (giữ ROI / cache / kết nối camera của làn)
+    return run_gate_job(f"parking_{action}", tracer.wrap("camera", gate.id, handle_parking_camera), action, gate)
+
+def handle_parking_camera(action, gate):
+    """Logic cổng camera (chạy trong job): trả về (body, http_code)"""
+    cam_ip = gate.cam
     
     # Dùng hàm chụp thông minh (3 shots)
-    plate, img_path = smart_capture_loop(cam_ip, f"CAM_{action}")
+    plate, img_path, _ = smart_capture_loop(cam_ip, f"CAM_{action}")
     
     if not img_path:
-        return jsonify({"status": "error", "msg": "Cam Fail", "action": f"deny_{action}"}), 500
+        return {"status": "error", "msg": "Cam Fail", "action": f"deny_{action}"}, 500
 
     now_str = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    web_img = f"/captures/{os.path.basename(img_path)}"
+    media = media_urls(img_path)
+    web_img = media["image_url"]
     
     # 1. ENTRY
     if action == "entry":
-        is_reg = is_plate_registered(plate)
-        status = "Allowed" if is_reg else "Denied (Unregistered)"
+        with tracer.span("db_lookup"):
+            plate = resolve_plate(plate, registered_cache.resolve, "registered")
+            reg_status = registered_cache.status(plate)
+        is_reg = reg_status == "ACTIVE"
+        if is_reg: status = "Allowed"
+        elif reg_status == "EXPIRED": status = "Denied (Expired)"
+        else: status = "Denied (Unregistered)"
         
-        with get_db_connection() as conn:
-            conn.execute("INSERT INTO parking_log (plate, entry_time, image_path, status) VALUES (?, ?, ?, ?)",
-                         (plate, now_str, img_path, "IN" if is_reg else "DENIED"))
+        with tracer.span("db_write"), get_db_connection() as conn:
+            if is_reg:
+                open_session(conn, plate, None, now_str, img_path)
+            else:
+                conn.execute(SQL_INSERT_ENTRY, (plate, None, now_str, img_path, "DENIED"))
+            record_entry(conn, now_str, denied=not is_reg)
             conn.commit()
 
         # Update UI
@@ -456,18 +1404,26 @@ def api_parking_camera(action):
             "status": status, 
             "time": now_str, 
             "image": web_img,
+            "thumb": media["preview_url"],
             "ticket_type": "Monthly" if is_reg else "Unknown"
         })
 
         if is_reg:
-            return jsonify({"status": "ok", "action": "allow_entry", "plate": plate})
+            return {"status": "ok", "action": "allow_entry", "plate": plate}, 200
         else:
-            return jsonify({"status": "denied", "action": "deny_entry", "plate": plate}), 403
+            return {"status": "denied", "action": "deny_entry", "plate": plate}, 403
 
     # 2. EXIT
     elif action == "exit":
         with get_db_connection() as conn:
-            row = conn.execute("SELECT * FROM parking_log WHERE plate=? AND status='IN' ORDER BY id DESC LIMIT 1", (plate,)).fetchone()
+            with tracer.span("db_lookup"):
+                row = conn.execute(SQL_FIND_IN_BY_PLATE, (plate,)).fetchone()
+                if not row:
+                    # Không khớp chính xác -> thử biển gần đúng trong số xe đang gửi
+                    matched = resolve_plate(plate, active_plates.match, "active")
+                    if matched != plate:
+                        plate = matched
+                        row = conn.execute(SQL_FIND_IN_BY_PLATE, (plate,)).fetchone()
             
             fee = 0
             ticket_type = "Guest"
@@ -479,13 +1435,18 @@ def api_parking_camera(action):
                     fee = 0
                     ticket_type = "Monthly"
                 else:
-                    fee, exit_time = calculate_fee(row['entry_time'])
+                    fee = calculate_fee(row['entry_time'], now_str, vehicle_type_of(plate))
                     ticket_type = "Guest"
 
-                conn.execute("UPDATE parking_log SET exit_time=?, fee=?, status='OUT' WHERE id=?", 
-                             (now_str, fee, row['id']))
-                conn.commit()
+                with tracer.span("db_write"):
+                    close_session(conn, row['id'], now_str, fee, img_path)
+                    record_exit(conn, row['entry_time'], now_str, fee, monthly=is_reg)
+                    conn.commit()
                 status = "Out"
+            else:
+                # Xe ra không có lượt vào: giữ ảnh làm bằng chứng
+                keep_capture(conn, img_path, "exit_not_found", now_str)
+                conn.commit()
 
         emit_realtime("new_log", {
             "plate": plate, 
@@ -493,32 +1454,41 @@ def api_parking_camera(action):
             "status": status, 
             "time": now_str, 
             "image": web_img,
+            "thumb": media["preview_url"],
             "fee": fee,
             "ticket_type": ticket_type # Gửi loại vé để Web hiện đúng màu
         })
 
         if status == "Out":
             action_resp = "allow_exit" if fee == 0 else "payment_due"
-            return jsonify({"status": "ok", "action": action_resp, "fee": fee, "plate": plate})
+            return {"status": "ok", "action": action_resp, "fee": fee, "plate": plate}, 200
         else:
-             return jsonify({"status": "error", "action": "deny_exit", "msg": "No Entry Record"}), 404
+             return {"status": "error", "action": "deny_exit", "msg": "No Entry Record"}, 404
 
-    return jsonify({"status": "err"}), 400
+    return {"status": "err"}, 400
 # --- API RFID (Vé lượt / Thẻ từ - Có chụp ảnh xác thực) ---
 @app.route('/api/rfid/<action>', methods=['POST'])
 def api_rfid_handler(action):
     data = request.json or {}
     uid = data.get("uid", "").strip()
     if not uid: return jsonify({"status": "error"}), 400
+    gate = resolve_gate(action)
+    if gate is None:
+        return jsonify({"status": "error", "msg": "Cổng không hợp lệ"}), 400
+    owner = lane_owner(gate)
+    if owner is not None:
+        return forward_to(owner)
+    return run_gate_job(f"rfid_{action}", tracer.wrap("rfid", gate.id, handle_rfid), action, uid, gate)
 
-    cam_ip = CAM_ENTRY_IP if action == 'entry' else CAM_EXIT_IP
+def handle_rfid(action, uid, gate):
+    """Logic cổng RFID (chạy trong job): trả về (body, http_code)"""
+    cam_ip = gate.cam
     
     # Kích hoạt chụp ảnh thông minh (Multi-shot)
-    current_plate, img_path = smart_capture_loop(cam_ip, f"RFID_{action}_{uid}")
+    current_plate, img_path, _ = smart_capture_loop(cam_ip, f"RFID_{action}_{uid}")
     
-    web_img = "/static/placeholder.jpg"
-    if img_path:
-        web_img = f"/captures/{os.path.basename(img_path)}"
+    media = media_urls(img_path or "/static/placeholder.jpg")
+    web_img = media["image_url"]
     
     now_str = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     
@@ -528,14 +1498,18 @@ def api_rfid_handler(action):
     # 1. ENTRY
     if action == "entry":
         with get_db_connection() as conn:
-            exist = conn.execute("SELECT * FROM parking_log WHERE rfid_uid=? AND status='IN'", (uid,)).fetchone()
+            with tracer.span("db_lookup"):
+                exist = conn.execute(SQL_FIND_IN_BY_RFID, (uid,)).fetchone()
             if exist:
-                 return jsonify({"status": "error", "msg": "Card busy", "action": "deny_entry"}), 400
+                 keep_capture(conn, img_path, "card_busy", now_str, exist['id'])
+                 conn.commit()
+                 return {"status": "error", "msg": "Card busy", "action": "deny_entry"}, 400
             
             # Lưu cả UID và Biển số (nếu đọc được)
-            conn.execute("INSERT INTO parking_log (plate, rfid_uid, entry_time, image_path, status) VALUES (?, ?, ?, ?, ?)",
-                         (current_plate, uid, now_str, img_path, "IN"))
-            conn.commit()
+            with tracer.span("db_write"):
+                open_session(conn, current_plate, uid, now_str, img_path)
+                record_entry(conn, now_str)
+                conn.commit()
         
         emit_realtime("new_log", {
             "plate": display_plate, 
@@ -543,26 +1517,35 @@ def api_rfid_handler(action):
             "status": "Allowed", 
             "time": now_str, 
             "image": web_img,
+            "thumb": media["preview_url"],
             "ticket_type": "Guest"
         })
-        return jsonify({"status": "ok", "action": "allow_entry", "uid": uid, "plate": current_plate})
+        return {"status": "ok", "action": "allow_entry", "uid": uid, "plate": current_plate}, 200
 
     # 2. EXIT
     elif action == "exit":
         with get_db_connection() as conn:
             # Tìm lượt vào chưa ra (status='IN')
-            row = conn.execute("SELECT * FROM parking_log WHERE rfid_uid=? AND status='IN' ORDER BY id DESC LIMIT 1", (uid,)).fetchone()
+            with tracer.span("db_lookup"):
+                row = conn.execute(SQL_FIND_IN_BY_RFID, (uid,)).fetchone()
             
             if not row:
-                # Không tìm thấy lượt vào -> Chặn luôn
-                return jsonify({"status": "error", "action": "deny_exit", "msg": "Card not inside"}), 404
+                # Không tìm thấy lượt vào -> Chặn luôn (giữ ảnh làm bằng chứng)
+                keep_capture(conn, img_path, "card_not_inside", now_str)
+                conn.commit()
+                return {"status": "error", "action": "deny_exit", "msg": "Card not inside"}, 404
             
             # --- KIỂM TRA BIỂN SỐ (LOGIC SỬA ĐỔI) ---
             plate_in = row['plate']
             
             # Chỉ so sánh khi CẢ HAI đều đọc được biển số (Khác UNKNOWN)
-            if plate_in != "UNKNOWN" and current_plate != "UNKNOWN" and plate_in != current_plate:
+            # Chỉ lệch do OCR nhầm ký tự cùng nhóm (0/O, 8/B...) trong ngưỡng FUZZY_MAX_COST mới coi là khớp,
+            # sai hẳn 1 ký tự -> chặn (thẻ đi ra cùng xe khác)
+            if plate_in != "UNKNOWN" and current_plate != "UNKNOWN" and \
+                    plate_distance(plate_in, current_plate, FUZZY_MAX_COST) > FUZZY_MAX_COST:
                 print(f"[ALERT] CHẶN CỔNG: Biển số lệch! Vào: {plate_in} - Ra: {current_plate}")
+                keep_capture(conn, img_path, "exit_blocked", now_str, row['id'])
+                conn.commit()
                 
                 # Gửi cảnh báo lên Web Dashboard ngay lập tức
                 emit_realtime("new_log", {
@@ -571,25 +1554,28 @@ def api_rfid_handler(action):
                     "status": "Biển số sai!", 
                     "time": now_str, 
                     "image": web_img,
+                    "thumb": media["preview_url"],
                     "fee": 0,
                     "ticket_type": "ALERT" # Màu đỏ cảnh báo
                 })
 
                 # QUAN TRỌNG: Trả về deny_exit và return ngay lập tức để không chạy code mở cổng phía dưới
-                return jsonify({
+                return {
                     "status": "error", 
                     "action": "deny_exit", 
                     "msg": f"Mismatch: {plate_in} vs {current_plate}"
-                }), 403
+                }, 403
             # ----------------------------------------
 
             # Nếu biển số khớp (hoặc 1 trong 2 không đọc được), tiếp tục tính tiền
-            fee, exit_time = calculate_fee(row['entry_time'])
+            vehicle_type = vehicle_type_of(plate_in if plate_in != "UNKNOWN" else current_plate)
+            fee = calculate_fee(row['entry_time'], now_str, vehicle_type)
             
             # Cập nhật DB: Đã ra
-            conn.execute("UPDATE parking_log SET exit_time=?, fee=?, status='OUT' WHERE id=?", 
-                         (now_str, fee, row['id']))
-            conn.commit()
+            with tracer.span("db_write"):
+                close_session(conn, row['id'], now_str, fee, img_path)
+                record_exit(conn, row['entry_time'], now_str, fee)
+                conn.commit()
 
         # Gửi thông tin ra web (Hợp lệ)
         emit_realtime("new_log", {
@@ -599,17 +1585,19 @@ def api_rfid_handler(action):
             "fee": fee, 
             "time": now_str, 
             "image": web_img,
+            "thumb": media["preview_url"],
             "ticket_type": "Guest"
         })
         
         # Nếu có phí -> payment_due, nếu miễn phí -> allow_exit
         action_resp = "payment_due" if fee > 0 else "allow_exit"
-        return jsonify({"status": "ok", "action": action_resp, "fee": fee, "uid": uid, "plate": current_plate})
+        return {"status": "ok", "action": action_resp, "fee": fee, "uid": uid, "plate": current_plate}, 200
 
-    return jsonify({"status": "err"}), 400
+    return {"status": "err"}, 400
 # ======================================
 # 8. RUN SERVER
 # ======================================
 if __name__ == '__main__':
-    print(f"Server starting on {AI_SERVER_IP}:{PORT}")
-    socketio.run(app, host=AI_SERVER_IP, port=PORT, debug=True)
\ No newline at end of file
+    print(f"Server starting on {AI_SERVER_IP}:{PORT} (worker {WORKER_ID}/{WORKER_COUNT}, broker {broker.kind})")
+    # Không có eventlet + chạy nền (không TTY, VD bench/loadgen.py) thì Flask-SocketIO đòi cờ này
+    socketio.run(app, host=AI_SERVER_IP, port=PORT, debug=SERVER_DEBUG, allow_unsafe_werkzeug=True)
\ No newline at end of file
@@ -0,0 +1,59 @@
+"""
+FILE: bench/bench_camera.py
+DESCRIPTION: So sánh độ trễ lấy ảnh: requests.get mỗi lần / CameraClient keep-alive / stream MJPEG.
+
+Chạy: python bench/bench_camera.py --shots 100 --latency-ms 20
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+import requests
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from camera import CameraClient
+from fake_camera import FakeCamera
+
+
+def measure(fn, shots, pause=0.0):
+    times = []
+    for _ in range(shots):
+        time.sleep(pause)  # Khoảng cách giữa 2 lần có xe
+        t = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - t) * 1000)
+    times.sort()
+    return {"avg_ms": round(statistics.mean(times), 2), "p95_ms": round(times[int(0.95 * (len(times) - 1))], 2)}
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--shots", type=int, default=100)
+    ap.add_argument("--latency-ms", type=float, default=20, help="Độ trễ giả lập của ESP32 khi chụp")
+    ap.add_argument("--fps", type=float, default=15)
+    args = ap.parse_args()
+
+    cam = FakeCamera(latency_ms=args.latency_ms, fps=args.fps).start()
+    url = f"http://{cam.address}/capture"
+
+    c0 = cam.connections
+    r = measure(lambda: requests.get(url, timeout=2).content, args.shots)
+    print(f"requests.get (new conn) : {r}  connections={cam.connections - c0}")
+
+    client = CameraClient(cam.address)
+    c0 = cam.connections
+    r = measure(client.grab, args.shots)
+    print(f"CameraClient keep-alive : {r}  connections={cam.connections - c0}")
+
+    streamer = CameraClient(cam.address, stream_url=f"http://{cam.address}/stream").start_stream()
+    time.sleep(0.5)  # Chờ stream có frame đầu tiên
+    r = measure(streamer.grab, args.shots, pause=1.0 / args.fps)
+    print(f"MJPEG ring buffer       : {r}  hits={streamer.stats()['stream_hits']}")
+    streamer.stop_stream()
+    cam.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,129 @@
+"""
+FILE: bench/bench_db.py
+DESCRIPTION: Đo thông lượng SQLite khi nhiều làn cùng vào/ra/xem lịch sử.
+  legacy : sqlite3.connect() mỗi lần gọi, rollback journal (như bản cũ)
+  pool   : db.ConnectionPool (kết nối theo thread, WAL, synchronous=NORMAL, mmap)
+
+Chạy: python bench/bench_db.py --rows 200000 --threads 8 --seconds 5
+"""
+import argparse
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import db
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS parking_log (
+    id INTEGER PRIMARY KEY AUTOINCREMENT, plate TEXT, rfid_uid TEXT, entry_time TEXT,
+    exit_time TEXT, fee REAL, image_path TEXT, status TEXT);
+CREATE TABLE IF NOT EXISTS registered_vehicles (
+    id INTEGER PRIMARY KEY AUTOINCREMENT, plate TEXT UNIQUE, vehicle_type TEXT, owner TEXT, expiry_date TEXT);
+"""
+
+
+def seed(path, rows):
+    conn = sqlite3.connect(path)
+    conn.executescript(SCHEMA)
+    start = datetime.now() - timedelta(days=60)
+    batch = []
+    for i in range(rows):
+        t = (start + timedelta(seconds=i * 20)).strftime("%Y-%m-%d %H:%M:%S")
+        batch.append((f"51A{i:05d}", None, t, t, 1000, "", "OUT"))
+    conn.executemany("INSERT INTO parking_log (plate, rfid_uid, entry_time, exit_time, fee, image_path, status) "
+                     "VALUES (?, ?, ?, ?, ?, ?, ?)", batch)
+    conn.executemany("INSERT INTO registered_vehicles (plate, vehicle_type) VALUES (?, 'Car')",
+                     [(f"30F{i:05d}",) for i in range(500)])
+    conn.commit()
+    db.migrate(conn)
+    conn.close()
+
+
+def legacy_conn_factory(path):
+    def get():
+        conn = sqlite3.connect(path, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        return conn
+    return get
+
+
+def worker(get_conn, stop, counts, idx, close_each):
+    rnd = random.Random(idx)
+    while not stop.is_set():
+        op = rnd.random()
+        plate = f"BENCH{idx}{rnd.randint(0, 50)}"
+        now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        conn = get_conn()
+        try:
+            if op < 0.4:  # Entry: kiểm tra vé tháng + ghi log
+                conn.execute(db.SQL_FIND_REGISTERED, (plate,)).fetchone()
+                with conn:
+                    db.open_session(conn, plate, None, now, "")
+                key = "entry"
+            elif op < 0.8:  # Exit: tìm lượt vào + cập nhật phí
+                with conn:
+                    row = conn.execute(db.SQL_FIND_IN_BY_PLATE, (plate,)).fetchone()
+                    conn.execute(db.SQL_FIND_REGISTERED, (plate,)).fetchone()
+                    if row:
+                        db.close_session(conn, row["id"], now, 500)
+                key = "exit"
+            else:  # Dashboard xem lịch sử
+                conn.execute("SELECT * FROM parking_log ORDER BY id DESC LIMIT 50").fetchall()
+                key = "history"
+        except sqlite3.OperationalError:
+            key = "locked"
+        finally:
+            if close_each:
+                conn.close()
+        counts[idx][key] = counts[idx].get(key, 0) + 1
+
+
+def run(mode, path, threads, seconds):
+    if mode == "legacy":
+        get_conn, close_each = legacy_conn_factory(path), True
+    else:
+        pool = db.ConnectionPool(path)
+        get_conn, close_each = pool.connection, False
+
+    stop = threading.Event()
+    counts = [{} for _ in range(threads)]
+    ts = [threading.Thread(target=worker, args=(get_conn, stop, counts, i, close_each)) for i in range(threads)]
+    for t in ts: t.start()
+    time.sleep(seconds)
+    stop.set()
+    for t in ts: t.join()
+
+    total = {}
+    for c in counts:
+        for k, v in c.items():
+            total[k] = total.get(k, 0) + v
+    ops = sum(v for k, v in total.items() if k != "locked")
+    print(f"{mode:7s}: {ops / seconds:8.0f} ops/s  {total}")
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--rows", type=int, default=200000)
+    ap.add_argument("--threads", type=int, default=8)
+    ap.add_argument("--seconds", type=float, default=5)
+    args = ap.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix="bench_db_")
+    base = os.path.join(tmp, "base.db")
+    seed(base, args.rows)
+    for mode in ("legacy", "pool"):
+        path = os.path.join(tmp, f"{mode}.db")
+        shutil.copy(base, path)
+        run(mode, path, args.threads, args.seconds)
+    shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
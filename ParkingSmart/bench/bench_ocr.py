@@ -0,0 +1,133 @@
+"""
+FILE: bench/bench_ocr.py
+DESCRIPTION: So sánh tiền xử lý OCR cũ (phóng to 3x + readtext) với ocr_prep (resize theo cỡ chữ,
+tách biển 2 dòng, 1 lần recognize) về độ chính xác và thời gian trên cùng bộ ảnh biển số đã crop.
+
+Bộ ảnh:
+- Mặc định: sinh ảnh biển 1 dòng / 2 dòng ở nhiều kích thước (có nhiễu, mờ)
+- --fixtures DIR: ảnh crop thật, tên file là biển số đúng (VD 51A12345.jpg, 29B112345_2.png)
+
+Chạy: python bench/bench_ocr.py --count 60 [--fixtures fixtures/plates] [--save-fixtures out_dir]
+"""
+import argparse
+import os
+import random
+import re
+import sys
+import time
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from ocr_prep import recognize_plate
+
+ALLOWLIST = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ.-'
+
+
+def normalize(text):
+    return re.sub(r"[^A-Z0-9]", "", (text or "").upper())
+
+
+def render_plate(top, bottom=None, height=40, rnd=None):
+    """Ảnh biển số tổng hợp: nền trắng, viền đen, chữ đen (1 hoặc 2 dòng), có nhiễu + mờ"""
+    rnd = rnd or random.Random(0)
+    lines = [top] if bottom is None else [top, bottom]
+    scale = 1.0
+    font = cv2.FONT_HERSHEY_SIMPLEX
+    sizes = [cv2.getTextSize(t, font, scale, 3)[0] for t in lines]
+    line_h = max(s[1] for s in sizes)
+    w = max(s[0] for s in sizes) + 30
+    h = int(line_h * (1.8 if bottom is None else 3.2))
+    img = np.full((h, w, 3), 235, np.uint8)
+    cv2.rectangle(img, (3, 3), (w - 4, h - 4), (20, 20, 20), 2)
+    for i, (t, (tw, _)) in enumerate(zip(lines, sizes)):
+        y = int(h / (len(lines) + 1) * (i + 1) + line_h / 2) if len(lines) == 2 else int((h + line_h) / 2)
+        cv2.putText(img, t, ((w - tw) // 2, y), font, scale, (15, 15, 15), 3, cv2.LINE_AA)
+
+    # Về kích thước "như crop từ camera", thêm nhiễu
+    img = cv2.resize(img, (int(w * height / h), height), interpolation=cv2.INTER_AREA)
+    noise = np.random.default_rng(rnd.randint(0, 1 << 30)).normal(0, 8, img.shape)
+    img = np.clip(img.astype(np.float32) + noise, 0, 255).astype(np.uint8)
+    if rnd.random() < 0.5:
+        img = cv2.GaussianBlur(img, (3, 3), 0)
+    return img
+
+
+def synthetic_fixtures(count, seed=1):
+    rnd = random.Random(seed)
+    out = []
+    for i in range(count):
+        province = f"{rnd.randint(11, 99)}"
+        series = rnd.choice("ABCDEFGHKLMNPSTUVXYZ")
+        num = f"{rnd.randint(0, 99999):05d}"
+        if i % 2 == 0:  # Biển dài 1 dòng (ô tô)
+            text, img = f"{province}{series}{num}", render_plate(f"{province}{series}-{num[:3]}.{num[3:]}",
+                                                                 height=rnd.choice([24, 32, 48, 72]), rnd=rnd)
+        else:           # Biển vuông 2 dòng (xe máy)
+            sub = rnd.randint(1, 9)
+            text = f"{province}{series}{sub}{num}"
+            img = render_plate(f"{province}-{series}{sub}", f"{num[:3]}.{num[3:]}",
+                               height=rnd.choice([40, 56, 80, 120]), rnd=rnd)
+        out.append((text, img))
+    return out
+
+
+def load_fixtures(folder):
+    out = []
+    for name in sorted(os.listdir(folder)):
+        img = cv2.imread(os.path.join(folder, name))
+        if img is not None:
+            out.append((normalize(os.path.splitext(name)[0].split("_")[0]), img))
+    return out
+
+
+def legacy_pipeline(reader, crop):
+    img = cv2.resize(crop, None, fx=3, fy=3, interpolation=cv2.INTER_CUBIC)
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    gray = cv2.GaussianBlur(gray, (5, 5), 0)
+    return reader.readtext(gray, detail=1, allowlist=ALLOWLIST)
+
+
+def adaptive_pipeline(reader, crop):
+    res, _ = recognize_plate(reader, crop, allowlist=ALLOWLIST)
+    return res
+
+
+def run(name, fn, reader, fixtures):
+    correct, times = 0, []
+    for truth, crop in fixtures:
+        t = time.perf_counter()
+        res = fn(reader, crop)
+        times.append((time.perf_counter() - t) * 1000)
+        correct += normalize("".join(r[1] for r in res)) == truth
+    times.sort()
+    print(f"{name:9s} acc {correct / len(fixtures) * 100:5.1f}% | avg {sum(times) / len(times):7.1f} ms | "
+          f"p95 {times[round(0.95 * (len(times) - 1))]:7.1f} ms")
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--count", type=int, default=60)
+    ap.add_argument("--fixtures", help="Thư mục ảnh crop thật (tên file = biển số)")
+    ap.add_argument("--save-fixtures", help="Lưu ảnh tổng hợp ra thư mục để xem lại")
+    args = ap.parse_args()
+
+    fixtures = load_fixtures(args.fixtures) if args.fixtures else synthetic_fixtures(args.count)
+    if args.save_fixtures:
+        os.makedirs(args.save_fixtures, exist_ok=True)
+        for i, (truth, img) in enumerate(fixtures):
+            cv2.imwrite(os.path.join(args.save_fixtures, f"{truth}_{i}.png"), img)
+
+    import easyocr
+    reader = easyocr.Reader(["en"], gpu=False)
+    warm = fixtures[0][1]
+    legacy_pipeline(reader, warm), adaptive_pipeline(reader, warm)
+
+    print(f"{len(fixtures)} plates ({'fixtures' if args.fixtures else 'synthetic'})")
+    run("legacy", legacy_pipeline, reader, fixtures)
+    run("adaptive", adaptive_pipeline, reader, fixtures)
+
+
+if __name__ == '__main__':
+    main()
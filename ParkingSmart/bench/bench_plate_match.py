@@ -0,0 +1,83 @@
+"""
+FILE: bench/bench_plate_match.py
+DESCRIPTION: Đo tốc độ / độ chính xác của plate_match.PlateIndex với nhiều biển số.
+Truy vấn được tạo bằng cách làm hỏng biển thật: nhầm ký tự OCR (0/O, 8/B...) và
+thỉnh thoảng thêm 1 lỗi thêm/bớt/sai ký tự.
+
+Chạy: python bench/bench_plate_match.py --plates 50000 --queries 20000
+"""
+import argparse
+import os
+import random
+import string
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from plate_match import CONFUSION_GROUPS, PlateIndex
+
+
+def random_plate(rnd):
+    # VD: 51A12345, 30F9370, 29AB12345
+    series = rnd.choice(string.ascii_uppercase) + (rnd.choice(string.ascii_uppercase) if rnd.random() < 0.2 else "")
+    return f"{rnd.randint(11, 99)}{series}{rnd.randint(0, 99999):0{rnd.choice([4, 5])}d}"
+
+
+def corrupt(plate, rnd):
+    chars = list(plate)
+    # 1-2 lỗi nhầm ký tự quen thuộc
+    for _ in range(rnd.randint(1, 2)):
+        idx = [i for i, ch in enumerate(chars) if any(ch in g for g in CONFUSION_GROUPS)]
+        if not idx: break
+        i = rnd.choice(idx)
+        group = next(g for g in CONFUSION_GROUPS if chars[i] in g)
+        chars[i] = rnd.choice([c for c in group if c != chars[i]])
+    # 30% có thêm 1 lỗi thật
+    if rnd.random() < 0.3:
+        i = rnd.randrange(len(chars))
+        kind = rnd.choice(["sub", "del", "ins"])
+        if kind == "sub": chars[i] = rnd.choice(string.ascii_uppercase + string.digits)
+        elif kind == "del": del chars[i]
+        else: chars.insert(i, rnd.choice(string.digits))
+    return "".join(chars)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--plates", type=int, default=50000)
+    ap.add_argument("--queries", type=int, default=20000)
+    ap.add_argument("--max-cost", type=float, default=1.0)
+    ap.add_argument("--seed", type=int, default=1)
+    args = ap.parse_args()
+
+    rnd = random.Random(args.seed)
+    plates = list({random_plate(rnd) for _ in range(args.plates)})
+
+    t = time.perf_counter()
+    index = PlateIndex(plates)
+    build_s = time.perf_counter() - t
+
+    queries = []
+    for _ in range(args.queries):
+        truth = rnd.choice(plates)
+        queries.append((truth, corrupt(truth, rnd)))
+
+    correct = wrong = none = 0
+    times = []
+    for truth, q in queries:
+        t = time.perf_counter()
+        match, _ = index.match(q, args.max_cost)
+        times.append((time.perf_counter() - t) * 1e6)
+        if match == truth: correct += 1
+        elif match is None: none += 1
+        else: wrong += 1
+
+    times.sort()
+    n = len(times)
+    print(f"Index: {len(index)} plates, build {build_s:.2f}s")
+    print(f"Query: avg {sum(times) / n:.1f}us  p50 {times[n // 2]:.1f}us  p99 {times[int(0.99 * (n - 1))]:.1f}us")
+    print(f"Result: correct {correct / n:.1%}  no-match {none / n:.1%}  wrong {wrong / n:.1%}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+"""
+FILE: bench/bench_tariff.py
+DESCRIPTION: Đo tốc độ tính phí hàng loạt (Tariff.fees) so với từng lượt (Tariff.fee)
+và calculate_fee cũ (strptime mỗi lượt), đồng thời kiểm tra:
+- fees() == fee() trên mẫu ngẫu nhiên, với cả bảng giá mặc định và bảng giá phức tạp
+- Bảng giá mặc định cho đúng kết quả như calculate_fee cũ
+
+Chạy: python bench/bench_tariff.py --sessions 1000000
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import datetime
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from tariff import Tariff, DEFAULT_TARIFF
+
+COMPLEX_TARIFF = {
+    "free_minutes": 10,
+    "bands": [[0, 24, 100], [22, 6, 150], [17, 19, 200]],  # Đêm + giờ cao điểm
+    "daily_cap": 50000,
+    "vehicle_rates": {"Car": 1.0, "Motorbike": 0.3},
+    "round_to": 500,
+}
+
+
+def legacy_fee(entry_str, exit_str):
+    """calculate_fee trước khi có tariff.py"""
+    fmt = "%Y-%m-%d %H:%M:%S"
+    t1 = datetime.strptime(entry_str, fmt)
+    t2 = datetime.strptime(exit_str, fmt)
+    duration = (t2 - t1).total_seconds() / 60.0
+    if duration <= 15:
+        return 0
+    return round(duration * 100)
+
+
+def synthetic_sessions(n, seed=1):
+    """Giờ vào rải trong 1 tháng, thời gian gửi log-normal (vài phút tới vài ngày)"""
+    rnd = np.random.default_rng(seed)
+    start = np.datetime64("2025-11-01T00:00:00").astype(np.int64)
+    entries = start + rnd.integers(0, 30 * 86400, n)
+    dwell = np.minimum(rnd.lognormal(np.log(3600), 1.5, n), 5 * 86400).astype(np.int64)
+    exits = entries + dwell
+    to_str = lambda a: np.datetime_as_string(a.astype("datetime64[s]")).astype(object)
+    entry_str = np.char.replace(to_str(entries).astype(str), "T", " ")
+    exit_str = np.char.replace(to_str(exits).astype(str), "T", " ")
+    kinds = rnd.choice(np.array(["Car", "Motorbike", "Truck"]), n)
+    return entry_str, exit_str, kinds
+
+
+def timed(fn):
+    t = time.perf_counter()
+    out = fn()
+    return out, time.perf_counter() - t
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sessions", type=int, default=1000000)
+    ap.add_argument("--scalar-sample", type=int, default=100000)
+    args = ap.parse_args()
+
+    entries, exits, kinds = synthetic_sessions(args.sessions)
+    sample = min(args.scalar_sample, args.sessions)
+    print(f"{args.sessions} sessions, scalar/legacy on first {sample}")
+
+    for name, cfg in (("default", DEFAULT_TARIFF), ("complex", COMPLEX_TARIFF)):
+        tariff = Tariff.from_dict(cfg)
+        vec, t_vec = timed(lambda: tariff.fees(entries, exits, kinds))
+        scal, t_scal = timed(lambda: [tariff.fee(entries[i], exits[i], kinds[i]) for i in range(sample)])
+        mismatch = int((vec[:sample] != np.array(scal, np.float64)).sum())
+        print(f"[{name}] vectorized {t_vec:.3f}s ({args.sessions / t_vec / 1e6:.2f} M/s) | "
+              f"scalar {t_scal / sample * 1e6:.1f} us/row | vec != scalar: {mismatch}")
+
+        if name == "default":
+            legacy, t_leg = timed(lambda: [legacy_fee(entries[i], exits[i]) for i in range(sample)])
+            diff = int((vec[:sample] != np.array(legacy, np.float64)).sum())
+            print(f"[legacy] strptime {t_leg / sample * 1e6:.1f} us/row | default != legacy: {diff}")
+
+
+if __name__ == '__main__':
+    main()
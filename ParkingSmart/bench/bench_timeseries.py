@@ -0,0 +1,112 @@
+"""
+FILE: bench/bench_timeseries.py
+DESCRIPTION: Đo timeseries.SensorTimeSeries với dữ liệu cảm biến giả (20 lần/giây như ESP32).
+- Ghi: nạp N ngày theo lô 1 giây (như thread flush trong app), in số bản ghi/giây + dung lượng
+- So sánh: cùng dữ liệu ghi vào bảng SQLite (1 dòng / lần gửi), truy vấn trung bình theo phút
+- Đọc: thời gian truy vấn biểu đồ 10 phút / 1 giờ / 1 ngày / cả khoảng (tier=auto)
+
+Chạy: python bench/bench_timeseries.py --days 2 [--sqlite] [--keep out_dir]
+"""
+import argparse
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from timeseries import SensorTimeSeries, RAW_DTYPE
+
+RATE = 20  # Bản ghi / giây
+
+
+def make_data(days, seed=1):
+    """Slot đổi trạng thái vài phút 1 lần, MQ135 dao động quanh 300-500"""
+    rnd = np.random.default_rng(seed)
+    n = days * 86400 * RATE
+    recs = np.zeros(n, RAW_DTYPE)
+    end = int(time.time() * 1000)
+    recs["t"] = end - n * (1000 // RATE) + np.arange(n) * (1000 // RATE)
+    flips = rnd.random((n, 4)) < 1 / (RATE * 300)
+    state = np.cumsum(flips, axis=0) % 2
+    recs["slots"] = (state * (1 << np.arange(4))).sum(axis=1)
+    recs["mq135"] = 400 + 80 * np.sin(np.arange(n) / (RATE * 3600)) + rnd.normal(0, 5, n)
+    return recs
+
+
+def timed(fn, repeat=5):
+    best = None
+    for _ in range(repeat):
+        t = time.perf_counter()
+        out = fn()
+        ms = (time.perf_counter() - t) * 1000
+        best = ms if best is None else min(best, ms)
+    return out, best
+
+
+def bench_store(root, recs):
+    store = SensorTimeSeries(root, n_slots=4, raw_keep_days=30)
+    t = time.perf_counter()
+    for i in range(0, len(recs), RATE):
+        store.write_batch(recs[i:i + RATE])
+    elapsed = time.perf_counter() - t
+    st = store.stats()
+    size = st["raw"]["bytes"] + st["1m"]["bytes"] + st["1h"]["bytes"]
+    print(f"[TS] write {len(recs):,} records in {elapsed:.1f}s ({len(recs) / elapsed:,.0f} rec/s), "
+          f"{size / 1e6:.1f} MB, 1m={st['1m']['records']} 1h={st['1h']['records']}")
+
+    end = int(recs["t"][-1]) + 1
+    for label, span in (("10min", 600_000), ("1h", 3_600_000), ("1d", 86_400_000), ("all", end - int(recs["t"][0]))):
+        out, ms = timed(lambda: store.query(end - span, end))
+        print(f"[TS] query {label:>5}: tier={out['tier']:<3} points={out['points']:<5} {ms:.2f} ms")
+    return store
+
+
+def bench_sqlite(path, recs):
+    conn = sqlite3.connect(path, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("CREATE TABLE sensor_log (t INTEGER, slots INTEGER, mq135 INTEGER)")
+    conn.execute("CREATE INDEX idx_sensor_t ON sensor_log(t)")
+    t = time.perf_counter()
+    for i in range(0, len(recs), RATE):
+        batch = recs[i:i + RATE]
+        conn.execute("BEGIN")
+        conn.executemany("INSERT INTO sensor_log VALUES (?, ?, ?)",
+                         zip(batch["t"].tolist(), batch["slots"].tolist(), batch["mq135"].tolist()))
+        conn.execute("COMMIT")
+    elapsed = time.perf_counter() - t
+    print(f"[SQLITE] write {len(recs):,} rows in {elapsed:.1f}s ({len(recs) / elapsed:,.0f} rows/s), "
+          f"{os.path.getsize(path) / 1e6:.1f} MB")
+
+    end = int(recs["t"][-1]) + 1
+    for label, span in (("1h", 3_600_000), ("1d", 86_400_000)):
+        _, ms = timed(lambda: conn.execute(
+            "SELECT t / 60000, AVG(mq135), MIN(mq135), MAX(mq135) FROM sensor_log "
+            "WHERE t >= ? AND t < ? GROUP BY t / 60000", (end - span, end)).fetchall(), repeat=3)
+        print(f"[SQLITE] query {label:>5} (per minute): {ms:.2f} ms")
+    conn.close()
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--days", type=int, default=2)
+    ap.add_argument("--sqlite", action="store_true", help="So sánh với bảng SQLite 1 dòng / lần gửi")
+    ap.add_argument("--keep", help="Giữ dữ liệu ở thư mục này (mặc định: thư mục tạm, xóa sau khi chạy)")
+    args = ap.parse_args()
+
+    root = args.keep or tempfile.mkdtemp(prefix="sensor_ts_")
+    try:
+        recs = make_data(args.days)
+        bench_store(os.path.join(root, "sensors"), recs)
+        if args.sqlite:
+            bench_sqlite(os.path.join(root, "sensor_log.db"), recs)
+    finally:
+        if not args.keep:
+            shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
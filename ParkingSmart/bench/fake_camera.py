@@ -0,0 +1,129 @@
+"""
+FILE: bench/fake_camera.py
+DESCRIPTION: Giả lập ESP32-CAM để test / benchmark (không cần phần cứng).
+- GET /capture : trả 1 ảnh JPEG (giống sketch ESP32_CAM)
+- GET /stream  : luồng MJPEG multipart (giống CameraWebServer cổng 81)
+
+Chạy: python bench/fake_camera.py --port 8081 --images bench/fixtures/plates --fps 10
+"""
+import argparse
+import glob
+import itertools
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import cv2
+import numpy as np
+
+BOUNDARY = "123456789000000000000987654321"
+
+
+def synthetic_frames(count=4, plate="51A12345"):
+    """Tạo vài ảnh JPEG có biển số giả khi không có ảnh mẫu"""
+    frames = []
+    for i in range(count):
+        img = np.full((480, 640, 3), 90 + i * 10, np.uint8)
+        cv2.rectangle(img, (180, 200), (460, 280), (255, 255, 255), -1)
+        cv2.putText(img, plate, (195, 258), cv2.FONT_HERSHEY_SIMPLEX, 1.6, (0, 0, 0), 4)
+        frames.append(cv2.imencode(".jpg", img)[1].tobytes())
+    return frames
+
+
+def load_frames(image_dir):
+    paths = sorted(glob.glob(os.path.join(image_dir, "*.jpg")) + glob.glob(os.path.join(image_dir, "*.png")))
+    frames = []
+    for p in paths:
+        img = cv2.imread(p)
+        if img is not None:
+            frames.append(cv2.imencode(".jpg", img)[1].tobytes())
+    return frames
+
+
+class FakeCamera:
+    def __init__(self, host="127.0.0.1", port=0, frames=None, fps=10, latency_ms=0):
+        self.frames = frames or synthetic_frames()
+        self._cycle = itertools.cycle(self.frames)
+        self._lock = threading.Lock()
+        self.fps = fps
+        self.latency = latency_ms / 1000.0
+        self.connections = 0
+        self.captures = 0
+
+        cam = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # Cho phép keep-alive như client thật
+            disable_nagle_algorithm = True
+
+            def setup(self):
+                super().setup()
+                with cam._lock:
+                    cam.connections += 1
+
+            def do_GET(self):
+                if self.path.startswith("/capture"):
+                    time.sleep(cam.latency)
+                    data = cam.next_frame()
+                    with cam._lock:
+                        cam.captures += 1
+                    self.send_response(200)
+                    self.send_header("Content-Type", "image/jpeg")
+                    self.send_header("Content-Length", str(len(data)))
+                    self.end_headers()
+                    self.wfile.write(data)
+                elif self.path.startswith("/stream"):
+                    self.send_response(200)
+                    self.send_header("Content-Type", f"multipart/x-mixed-replace;boundary={BOUNDARY}")
+                    self.send_header("Connection", "close")
+                    self.end_headers()
+                    try:
+                        while True:
+                            data = cam.next_frame()
+                            self.wfile.write(f"\r\n--{BOUNDARY}\r\nContent-Type: image/jpeg\r\n"
+                                             f"Content-Length: {len(data)}\r\n\r\n".encode())
+                            self.wfile.write(data)
+                            time.sleep(1.0 / cam.fps)
+                    except (BrokenPipeError, ConnectionResetError):
+                        pass
+                    self.close_connection = True
+                else:
+                    self.send_error(404)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.address = f"{host}:{self.server.server_address[1]}"
+
+    def next_frame(self):
+        with self._lock:
+            return next(self._cycle)
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+if __name__ == '__main__':
+    ap = argparse.ArgumentParser(description="Fake ESP32-CAM server")
+    ap.add_argument("--host", default="0.0.0.0")
+    ap.add_argument("--port", type=int, default=8081)
+    ap.add_argument("--images", help="Thư mục ảnh mẫu (.jpg/.png)")
+    ap.add_argument("--fps", type=float, default=10)
+    ap.add_argument("--latency-ms", type=float, default=0)
+    args = ap.parse_args()
+
+    frames = load_frames(args.images) if args.images else None
+    cam = FakeCamera(args.host, args.port, frames, args.fps, args.latency_ms)
+    print(f"[FAKE CAM] http://{cam.address}/capture  |  http://{cam.address}/stream  ({len(cam.frames)} frames)")
+    try:
+        cam.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,382 @@
+"""
+FILE: bench/loadgen.py
+DESCRIPTION: Tạo tải giờ cao điểm cho app.py và đo độ trễ quyết định ở cổng (không cần phần cứng).
+- Camera giả (fake_camera.FakeCamera) cho cổng vào / ra, phát ảnh biển số ghi sẵn (--images)
+- Mỗi làn = 1 bộ điều khiển ESP32 chạy đúng vòng lặp của CodeArduino/sketch_oct30b:
+  * Xe tới / về qua camera: POST /api/parking/entry | exit
+  * Quẹt thẻ: luôn gọi /api/rfid/entry trước, bị từ chối (deny_entry / Card busy) thì gọi /api/rfid/exit
+  * Mỗi 1s GET /api/get_command, mỗi 3s POST /api/update_data, nghỉ 50ms mỗi vòng
+  * Gọi HTTP là chặn: làn đang chờ server thì xe sau phải đợi (độ trễ xếp hàng ghi riêng là "lag")
+- Lịch xe tới sinh từ --seed (Poisson theo --rate xe/phút/làn) -> chạy lại y hệt được;
+  --record lưu lịch ra file JSONL, --replay chạy lại đúng lịch đó
+- Báo cáo p50/p95/p99 + req/s theo loại request; --json lưu kết quả, --baseline so với lần trước
+  (p95 chậm hơn --max-regression -> exit code 1, dùng trước khi deploy)
+
+Chạy:
+  python bench/seed_db.py bench_seed.db --rows 2000000 --register 51A12345
+  python bench/loadgen.py --spawn --db bench_seed.db --lanes 4 --rate 10 --duration 120 --json out.json
+  python bench/loadgen.py --url http://127.0.0.1:5000 --lanes 2 --duration 60 (server chạy sẵn)
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from fake_camera import FakeCamera, load_frames
+
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+GATE_KINDS = ("camera_entry", "camera_exit", "rfid_entry", "rfid_exit")
+LOOP_SLEEP = 0.05        # vTaskDelay(50) của sketch
+COMMAND_INTERVAL = 1.0   # checkServerCommand mỗi 1s
+SENSOR_INTERVAL = 3.0    # sendSensorData mỗi 3s
+OK_ACTIONS = ("allow_entry", "allow_exit", "payment_due")
+
+
+# ======================================
+# LỊCH XE TỚI
+# ======================================
+def make_schedule(lanes, duration, rate, rfid_share=0.5, dwell=(20, 90), seed=1):
+    """
+    [{t, lane, kind, action, uid}] sắp theo t. Mỗi xe tới sẽ về sau dwell giây (nếu còn trong duration),
+    cùng kiểu cổng (camera / thẻ) như lúc vào
+    """
+    rnd = random.Random(seed)
+    events = []
+    for lane in range(lanes):
+        t, n = 0.0, 0
+        while True:
+            t += rnd.expovariate(rate / 60.0)
+            if t >= duration:
+                break
+            n += 1
+            kind = "rfid" if rnd.random() < rfid_share else "camera"
+            uid = f"{lane:02X} {n >> 8 & 0xFF:02X} {n & 0xFF:02X} {rnd.randrange(256):02X}"
+            events.append({"t": round(t, 3), "lane": lane, "kind": kind, "action": "arrive", "uid": uid})
+            leave = t + rnd.uniform(*dwell)
+            if leave < duration:
+                events.append({"t": round(leave, 3), "lane": lane, "kind": kind, "action": "leave", "uid": uid})
+    return sorted(events, key=lambda e: (e["t"], e["lane"]))
+
+
+def save_schedule(path, events, meta):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(json.dumps({"meta": meta}) + "\n")
+        for e in events:
+            f.write(json.dumps(e) + "\n")
+
+
+def load_schedule(path):
+    meta, events = {}, []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            item = json.loads(line)
+            if "meta" in item: meta = item["meta"]
+            else: events.append(item)
+    return meta, events
+
+
+# ======================================
+# LÀN (BỘ ĐIỀU KHIỂN ESP32 GIẢ)
+# ======================================
+class Recorder:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples = {}   # loại -> [ms]
+        self.errors = {}    # loại -> số lỗi (timeout / 5xx / mất kết nối)
+        self.actions = {}   # loại -> {action: số lần}
+        self.lag = []       # Xe phải chờ làn rảnh (ms)
+
+    def add(self, kind, ms, action=None, error=False):
+        with self._lock:
+            self.samples.setdefault(kind, []).append(ms)
+            if error: self.errors[kind] = self.errors.get(kind, 0) + 1
+            if action:
+                counts = self.actions.setdefault(kind, {})
+                counts[action] = counts.get(action, 0) + 1
+
+
+class Lane(threading.Thread):
+    def __init__(self, idx, base_url, events, recorder, t0, duration, hold=0.0, timeout=30):
+        super().__init__(name=f"lane-{idx}", daemon=True)
+        self.idx = idx
+        self.base = base_url.rstrip("/")
+        self.events = [e for e in events if e["lane"] == idx]
+        self.rec = recorder
+        self.t0 = t0
+        self.duration = duration
+        self.hold = hold            # Thời gian giữ barie mở (sketch: delay 3000)
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.rnd = random.Random(idx)
+        self.slots = [0, 0, 0, 0]
+
+    def call(self, method, path, **kwargs):
+        """-> (ms, body | None, lỗi?)"""
+        t = time.perf_counter()
+        try:
+            r = self.session.request(method, self.base + path, timeout=self.timeout, **kwargs)
+            ms = (time.perf_counter() - t) * 1000
+            try:
+                body = r.json()
+            except ValueError:
+                body = None
+            return ms, body, r.status_code >= 500 and not (body and body.get("action"))
+        except requests.RequestException:
+            return (time.perf_counter() - t) * 1000, None, True
+
+    def gate(self, kind, path, payload=None):
+        ms, body, err = self.call("POST", path, json=payload)
+        action = (body or {}).get("action") or (body or {}).get("msg") or ("error" if err else "none")
+        return ms, body or {}, action, err
+
+    def vehicle(self, e):
+        if e["kind"] == "camera":
+            gate = "entry" if e["action"] == "arrive" else "exit"
+            ms, _, action, err = self.gate(f"camera_{gate}", f"/api/parking/{gate}")
+            self.rec.add(f"camera_{gate}", ms, action, err)
+        else:
+            # Sketch: thử entry trước, "Card busy" -> exit (lượt ra tốn 2 request)
+            ms, body, action, err = self.gate("rfid_entry", "/api/rfid/entry", {"uid": e["uid"]})
+            if action == "deny_entry" or body.get("msg") == "Card busy":
+                ms2, _, action, err = self.gate("rfid_exit", "/api/rfid/exit", {"uid": e["uid"]})
+                self.rec.add("rfid_exit", ms + ms2, action, err)
+            else:
+                self.rec.add("rfid_entry", ms, action, err)
+        if action in OK_ACTIONS and self.hold:
+            time.sleep(self.hold)
+
+    def run(self):
+        pending = list(self.events)
+        next_cmd = next_sensor = 0.0
+        end = self.t0 + self.duration
+        while time.perf_counter() < end:
+            now = time.perf_counter() - self.t0
+            if pending and pending[0]["t"] <= now:
+                e = pending.pop(0)
+                self.rec.lag.append((now - e["t"]) * 1000)
+                self.vehicle(e)
+                continue
+            if now >= next_cmd:
+                ms, _, err = self.call("GET", "/api/get_command")
+                self.rec.add("get_command", ms, error=err)
+                next_cmd = now + COMMAND_INTERVAL
+            if now >= next_sensor:
+                # Thỉnh thoảng 1 slot đổi trạng thái
+                if self.rnd.random() < 0.3:
+                    i = self.rnd.randrange(4)
+                    self.slots[i] ^= 1
+                payload = {f"s{i + 1}": v for i, v in enumerate(self.slots)}
+                payload["mq135"] = 300 + self.rnd.randrange(50)
+                ms, _, err = self.call("POST", "/api/update_data", json=payload)
+                self.rec.add("update_data", ms, error=err)
+                next_sensor = now + SENSOR_INTERVAL
+            time.sleep(LOOP_SLEEP)
+
+
+# ======================================
+# SERVER
+# ======================================
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def spawn_server(db_path, cam_entry, cam_exit, workdir, port, log_path, workers=1):
+    """Chạy app.py (workers > 1: cluster.py) ở process riêng, trỏ sang camera giả + DB thử (biến môi trường)"""
+    env = dict(os.environ, PORT=str(port), SERVER_DEBUG="0", DB_FILE=db_path,
+               CAM_ENTRY_IP=cam_entry, CAM_EXIT_IP=cam_exit,
+               CAPTURE_FOLDER=os.path.join(workdir, "captures"), THUMB_FOLDER=os.path.join(workdir, "thumbs"),
+               SENSOR_TS_FOLDER=os.path.join(workdir, "sensors"), LOTS_FILE=os.path.join(workdir, "lots.json"))
+    cmd = [sys.executable, "app.py"]
+    if workers > 1:
+        cmd = [sys.executable, "cluster.py", "--workers", str(workers), "--port", str(port),
+               "--broker-port", str(free_port())]
+    log = open(log_path, "w")
+    proc = subprocess.Popen(cmd, cwd=APP_DIR, env=env, stdout=log, stderr=subprocess.STDOUT)
+    return proc, log
+
+
+def wait_ready(base_url, timeout, proc=None):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if proc is not None and proc.poll() is not None:
+            raise RuntimeError(f"Server thoát sớm (exit {proc.returncode})")
+        try:
+            if requests.get(base_url + "/api/ready", timeout=2).status_code == 200:
+                return True
+        except requests.RequestException:
+            pass
+        time.sleep(0.5)
+    return False
+
+
+# ======================================
+# BÁO CÁO
+# ======================================
+def summarize(rec, wall):
+    out = {}
+    kinds = list(rec.samples) + (["gate_decision"] if any(k in rec.samples for k in GATE_KINDS) else [])
+    for kind in kinds:
+        if kind == "gate_decision":
+            values = [v for k in GATE_KINDS for v in rec.samples.get(k, [])]
+            errors = sum(rec.errors.get(k, 0) for k in GATE_KINDS)
+        else:
+            values, errors = rec.samples[kind], rec.errors.get(kind, 0)
+        arr = np.array(values)
+        out[kind] = {"count": len(values), "rps": round(len(values) / wall, 2), "errors": errors,
+                     "p50_ms": round(float(np.percentile(arr, 50)), 1),
+                     "p95_ms": round(float(np.percentile(arr, 95)), 1),
+                     "p99_ms": round(float(np.percentile(arr, 99)), 1),
+                     "max_ms": round(float(arr.max()), 1)}
+        if kind in rec.actions:
+            out[kind]["actions"] = rec.actions[kind]
+    if rec.lag:
+        out["lane_lag"] = {"p50_ms": round(float(np.percentile(rec.lag, 50)), 1),
+                           "p95_ms": round(float(np.percentile(rec.lag, 95)), 1)}
+    return out
+
+
+def print_report(result):
+    print(f"\n{'request':14s} {'count':>6s} {'req/s':>7s} {'p50':>8s} {'p95':>8s} {'p99':>8s} {'max':>8s} {'err':>5s}")
+    for kind, r in result["requests"].items():
+        if "count" not in r: continue
+        print(f"{kind:14s} {r['count']:6d} {r['rps']:7.2f} {r['p50_ms']:8.1f} {r['p95_ms']:8.1f} "
+              f"{r['p99_ms']:8.1f} {r['max_ms']:8.1f} {r['errors']:5d}")
+    for kind, r in result["requests"].items():
+        if r.get("actions"):
+            print(f"  {kind}: {r['actions']}")
+    if "lane_lag" in result["requests"]:
+        print(f"  Xe chờ làn rảnh: p50 {result['requests']['lane_lag']['p50_ms']} ms, "
+              f"p95 {result['requests']['lane_lag']['p95_ms']} ms")
+    stages = (result.get("server_traces") or {}).get("summary")
+    if stages:
+        print("\nThời gian TB từng bước phía server (ms, /api/traces):")
+        for gate, steps in stages.items():
+            print(f"  {gate:6s} " + "  ".join(f"{k}={v['avg_ms']}" for k, v in steps.items()))
+
+
+def compare(result, baseline_path, max_regression):
+    with open(baseline_path, encoding="utf-8") as f:
+        base = json.load(f)["requests"]
+    failed = []
+    for kind, r in result["requests"].items():
+        b = base.get(kind)
+        if not b or "p95_ms" not in r or "p95_ms" not in b or not b["p95_ms"]:
+            continue
+        change = r["p95_ms"] / b["p95_ms"] - 1
+        mark = "REGRESSION" if change > max_regression else "ok"
+        print(f"  {kind:14s} p95 {b['p95_ms']:8.1f} -> {r['p95_ms']:8.1f} ms ({change * 100:+.1f}%) {mark}")
+        if change > max_regression:
+            failed.append(kind)
+    return failed
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Load generator cho cổng bãi xe")
+    ap.add_argument("--url", help="Server đang chạy sẵn (mặc định: --spawn)")
+    ap.add_argument("--spawn", action="store_true", help="Tự chạy app.py với camera giả + DB thử")
+    ap.add_argument("--db", help="DB đã seed (bench/seed_db.py), được copy ra thư mục tạm trước khi chạy")
+    ap.add_argument("--images", help="Thư mục ảnh biển số cho camera giả")
+    ap.add_argument("--cam-latency-ms", type=float, default=80, help="Độ trễ chụp của ESP32-CAM giả")
+    ap.add_argument("--cam-ports", help="(--url) bật camera giả ở 2 cổng vào,ra, VD 8081,8082")
+    ap.add_argument("--lanes", type=int, default=2)
+    ap.add_argument("--duration", type=float, default=60, help="Giây")
+    ap.add_argument("--rate", type=float, default=6, help="Xe tới / phút / làn")
+    ap.add_argument("--rfid-share", type=float, default=0.5)
+    ap.add_argument("--dwell", type=float, nargs=2, default=(20, 90), metavar=("MIN", "MAX"),
+                    help="Giây xe ở trong bãi trước khi về")
+    ap.add_argument("--hold", type=float, default=0, help="Giây giữ barie mở sau khi cho qua (sketch: 3)")
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--record", help="Lưu lịch xe tới ra file JSONL")
+    ap.add_argument("--replay", help="Chạy lại lịch đã lưu (bỏ qua --rate/--seed/--lanes)")
+    ap.add_argument("--ready-timeout", type=float, default=300)
+    ap.add_argument("--workers", type=int, default=1, help="(--spawn) Chạy qua cluster.py với N worker")
+    ap.add_argument("--json", help="Lưu kết quả ra file")
+    ap.add_argument("--baseline", help="File kết quả lần trước để so sánh p95")
+    ap.add_argument("--max-regression", type=float, default=0.2)
+    ap.add_argument("--keep", action="store_true", help="Giữ thư mục tạm (DB, ảnh, log server) sau khi chạy")
+    args = ap.parse_args()
+
+    if args.replay:
+        meta, events = load_schedule(args.replay)
+        args.lanes, args.duration = meta.get("lanes", args.lanes), meta.get("duration", args.duration)
+    else:
+        events = make_schedule(args.lanes, args.duration, args.rate, args.rfid_share, args.dwell, args.seed)
+    meta = {"lanes": args.lanes, "duration": args.duration, "rate": args.rate, "seed": args.seed,
+            "rfid_share": args.rfid_share}
+    if args.record:
+        save_schedule(args.record, events, meta)
+    print(f"[LOAD] {len(events)} lượt xe, {args.lanes} làn, {args.duration}s")
+
+    frames = load_frames(args.images) if args.images else None
+    cams, proc, log, workdir = [], None, None, None
+    try:
+        if args.url and not args.spawn:
+            base = args.url.rstrip("/")
+            if args.cam_ports:
+                for port in args.cam_ports.split(","):
+                    cams.append(FakeCamera("0.0.0.0", int(port), frames, latency_ms=args.cam_latency_ms).start())
+        else:
+            workdir = tempfile.mkdtemp(prefix="parking_load_")
+            db_path = os.path.join(workdir, "bench.db")
+            if args.db:
+                shutil.copy(args.db, db_path)
+            cams = [FakeCamera(frames=frames, latency_ms=args.cam_latency_ms).start() for _ in range(2)]
+            port = free_port()
+            proc, log = spawn_server(db_path, cams[0].address, cams[1].address, workdir, port,
+                                     os.path.join(workdir, "server.log"), workers=args.workers)
+            base = f"http://127.0.0.1:{port}"
+            print(f"[LOAD] Server {base} (log: {workdir}/server.log), chờ model nạp xong...")
+
+        if not wait_ready(base, args.ready_timeout, proc):
+            print("[LOAD] Server chưa sẵn sàng (/api/ready), dừng.")
+            return 2
+
+        rec = Recorder()
+        t0 = time.perf_counter()
+        lanes = [Lane(i, base, events, rec, t0, args.duration, hold=args.hold) for i in range(args.lanes)]
+        for lane in lanes: lane.start()
+        for lane in lanes: lane.join()
+        wall = time.perf_counter() - t0
+
+        result = {"meta": meta, "wall_s": round(wall, 1), "requests": summarize(rec, wall)}
+        try:
+            result["server_traces"] = {"summary": requests.get(base + "/api/traces?n=1", timeout=5).json()["summary"]}
+        except (requests.RequestException, ValueError, KeyError):
+            pass
+        print_report(result)
+        if args.json:
+            with open(args.json, "w", encoding="utf-8") as f:
+                json.dump(result, f, indent=2, ensure_ascii=False)
+        if args.baseline:
+            print(f"\nSo với {args.baseline} (ngưỡng +{args.max_regression * 100:.0f}%):")
+            if compare(result, args.baseline, args.max_regression):
+                return 1
+        return 0
+    finally:
+        for cam in cams: cam.stop()
+        if proc is not None:
+            proc.terminate()
+            try:
+                proc.wait(10)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+        if log: log.close()
+        if workdir and not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
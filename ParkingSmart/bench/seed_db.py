@@ -0,0 +1,143 @@
+"""
+FILE: bench/seed_db.py
+DESCRIPTION: Tạo database thử với hàng triệu lượt gửi xe (để đo cổng / lịch sử / báo cáo với DB "già").
+- Lượt vào dồn vào giờ cao điểm (7-9h, 17-19h), thời gian gửi từ vài phút tới vài ngày
+- Trộn vé tháng / vé lượt / thẻ RFID / lượt bị từ chối, phí tính theo bảng giá mặc định
+- N xe cuối cùng còn trong bãi (status='IN') để cổng ra có cái mà tra
+- Chạy migration + dựng bảng tổng hợp như DB thật
+
+Chạy: python bench/seed_db.py bench_seed.db --rows 2000000 [--register 51A12345,30F00001]
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import db
+import stats
+from tariff import Tariff, DEFAULT_TARIFF, to_seconds
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS parking_log (
+    id INTEGER PRIMARY KEY AUTOINCREMENT, plate TEXT, rfid_uid TEXT, entry_time TEXT,
+    exit_time TEXT, fee REAL, image_path TEXT, status TEXT);
+CREATE TABLE IF NOT EXISTS registered_vehicles (
+    id INTEGER PRIMARY KEY AUTOINCREMENT, plate TEXT UNIQUE, vehicle_type TEXT, owner TEXT, expiry_date TEXT);
+"""
+SERIES = np.array(list("ABCDEFGHKLMNPSTUVXYZ"))
+# Tỉ lệ lượt vào theo giờ trong ngày (cao điểm sáng / chiều)
+HOUR_WEIGHTS = np.array([1, 1, 1, 1, 1, 2, 4, 10, 12, 6, 4, 4, 5, 4, 4, 4, 5, 11, 12, 7, 4, 3, 2, 1], float)
+
+
+def make_plates(rnd, n):
+    province = rnd.integers(11, 100, n)
+    series = SERIES[rnd.integers(0, len(SERIES), n)]
+    number = rnd.integers(0, 100000, n)
+    return np.unique([f"{p}{s}{x:05d}" for p, s, x in zip(province, series, number)])
+
+
+def fmt(seconds):
+    """Mảng số giây (epoch) -> mảng chuỗi 'YYYY-MM-DD HH:MM:SS'"""
+    return np.char.replace(np.datetime_as_string(seconds.astype("datetime64[s]"), unit="s"), "T", " ").astype(object)
+
+
+def seed(path, rows, days=365, plates=50000, registered=2000, active=300, rfid_share=0.3,
+         denied_share=0.03, register=(), seed=1, chunk=200000):
+    rnd = np.random.default_rng(seed)
+    tariff = Tariff.from_dict(DEFAULT_TARIFF)
+    conn = sqlite3.connect(path, isolation_level=None)
+    conn.executescript(SCHEMA)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=OFF")
+
+    pool = make_plates(rnd, plates)
+    reg_plates = list(dict.fromkeys(list(register) + list(pool[:registered])))
+    today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    expiry = [(today + timedelta(days=int(d))).strftime("%Y-%m-%d") for d in rnd.integers(-30, 300, len(reg_plates))]
+    kinds = rnd.choice(["Car", "Motorbike"], len(reg_plates))
+    conn.execute("BEGIN")
+    conn.executemany("INSERT OR IGNORE INTO registered_vehicles (plate, vehicle_type, owner, expiry_date) "
+                     "VALUES (?, ?, ?, ?)",
+                     [(p, k, f"Owner {i}", e) for i, (p, k, e) in enumerate(zip(reg_plates, kinds, expiry))])
+    conn.execute("COMMIT")
+
+    # Lượt vào trải đều theo ngày, giờ theo HOUR_WEIGHTS, sắp xếp theo thời gian (như id thật)
+    start, now = to_seconds(today - timedelta(days=days)), to_seconds(datetime.now().replace(microsecond=0))
+    hours = rnd.choice(24, rows, p=HOUR_WEIGHTS / HOUR_WEIGHTS.sum())
+    entry = np.sort(start + rnd.integers(0, days, rows) * 86400 + hours * 3600 + rnd.integers(0, 3600, rows))
+    entry = np.minimum(entry, now - 3600)
+    # Thời gian gửi: phần lớn vài giờ, đuôi dài tới vài ngày
+    dwell = np.clip(rnd.lognormal(np.log(3 * 3600), 1.0, rows), 120, 5 * 86400).astype(np.int64)
+    exit_ = np.minimum(entry + dwell, now)
+
+    plate_idx = rnd.integers(0, len(pool), rows)
+    is_rfid = rnd.random(rows) < rfid_share
+    is_denied = (rnd.random(rows) < denied_share) & ~is_rfid
+    is_active = np.zeros(rows, bool)
+    is_active[max(0, rows - active):] = True
+    is_denied &= ~is_active
+    is_monthly = plate_idx < registered  # pool[:registered] là xe vé tháng
+    fees = np.where(is_monthly | is_denied, 0.0, tariff.fees(entry, exit_))
+
+    t0 = time.perf_counter()
+    conn.execute("BEGIN")
+    for lo in range(0, rows, chunk):
+        hi = min(rows, lo + chunk)
+        entry_s, exit_s = fmt(entry[lo:hi]), fmt(exit_[lo:hi])
+        batch = []
+        for i in range(lo, hi):
+            j = i - lo
+            plate = pool[plate_idx[i]]
+            uid = f"{i & 0xFF:02X} {(i >> 8) & 0xFF:02X} {(i >> 16) & 0xFF:02X} {(i >> 24) & 0xFF:02X}" \
+                if is_rfid[i] else None
+            ts = entry_s[j]
+            image = (f"static/captures/{ts[:4]}/{ts[5:7]}/{ts[8:10]}/entry/"
+                     f"CAM_entry_shot1_{ts[:4]}{ts[5:7]}{ts[8:10]}_{ts[11:13]}{ts[14:16]}{ts[17:19]}.jpg")
+            if is_active[i]:
+                batch.append((plate, uid, entry_s[j], None, None, image, "IN"))
+            elif is_denied[i]:
+                batch.append((plate, None, entry_s[j], None, None, image, "DENIED"))
+            else:
+                batch.append((plate, uid, entry_s[j], exit_s[j], float(fees[i]), image, "OUT"))
+        conn.executemany("INSERT INTO parking_log (plate, rfid_uid, entry_time, exit_time, fee, image_path, status) "
+                         "VALUES (?, ?, ?, ?, ?, ?, ?)", batch)
+        print(f"[SEED] {hi}/{rows} rows ({hi / (time.perf_counter() - t0):,.0f} rows/s)")
+    conn.execute("COMMIT")
+
+    # Index + active_sessions + bảng tổng hợp (tạo sau khi nạp xong -> nhanh hơn nhiều)
+    conn.row_factory = sqlite3.Row
+    db.migrate(conn)
+    print(f"[SEED] Stats backfilled: {stats.backfill(conn)} days")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.close()
+    return {"rows": rows, "registered": len(reg_plates), "active": int(is_active.sum()),
+            "seconds": round(time.perf_counter() - t0, 1)}
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("db", help="File database sẽ tạo (ghi đè)")
+    ap.add_argument("--rows", type=int, default=2000000)
+    ap.add_argument("--days", type=int, default=365)
+    ap.add_argument("--plates", type=int, default=50000, help="Số biển số khác nhau")
+    ap.add_argument("--registered", type=int, default=2000, help="Số xe vé tháng")
+    ap.add_argument("--active", type=int, default=300, help="Số xe còn trong bãi")
+    ap.add_argument("--register", default="", help="Biển số đăng ký thêm (VD biển trong ảnh camera giả), cách nhau dấu phẩy")
+    ap.add_argument("--seed", type=int, default=1)
+    args = ap.parse_args()
+
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(args.db + suffix):
+            os.remove(args.db + suffix)
+    out = seed(args.db, args.rows, days=args.days, plates=args.plates, registered=args.registered,
+               active=args.active, register=[p for p in args.register.split(",") if p], seed=args.seed)
+    print(f"[SEED] {out} -> {args.db} ({os.path.getsize(args.db) / 1e6:.0f} MB)")
+
+
+if __name__ == '__main__':
+    main()
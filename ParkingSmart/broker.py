@@ -0,0 +1,272 @@
+"""
+FILE: broker.py
+DESCRIPTION: Kênh trao đổi giữa các worker (chế độ nhiều tiến trình, xem cluster.py).
+- publish / subscribe theo kênh: sự kiện Socket.IO (mỗi worker phát lại cho client của mình),
+  lệnh barie (về worker chính giữ hàng đợi lệnh)
+- Vài lệnh key-value có hạn (get / set ex= / delete / incr / keys) cho trạng thái dùng chung,
+  VD worker nào đang sống, giữ những cổng nào
+- InProcessBroker: 1 tiến trình (chạy app.py trực tiếp), gọi thẳng handler, không tuần tự hóa
+- RespBroker: giao thức Redis (RESP) qua socket thường -> dùng với Redis thật hoặc broker_server.py
+  (bản thay thế nhỏ chạy cục bộ), không cần cài gói redis
+- connect(url): "" | "memory://" -> InProcessBroker, "redis://host:port/" -> RespBroker
+Message là dict tuần tự hóa được bằng JSON. Mất kết nối thì tự nối lại (message phát trong lúc
+mất kết nối bị bỏ, như pub/sub của Redis)
+"""
+import fnmatch
+import json
+import socket
+import threading
+import time
+from urllib.parse import urlparse
+
+CHANNEL_REALTIME = "parking:realtime"
+CHANNEL_COMMANDS = "parking:commands"
+
+
+# ======================================
+# GIAO THỨC RESP
+# ======================================
+class RespError(Exception):
+    pass
+
+
+def encode_command(*args):
+    out = [b"*%d\r\n" % len(args)]
+    for a in args:
+        b = a if isinstance(a, bytes) else str(a).encode()
+        out.append(b"$%d\r\n%s\r\n" % (len(b), b))
+    return b"".join(out)
+
+
+def read_reply(f):
+    """Đọc 1 giá trị RESP từ file-like (socket.makefile('rb'))"""
+    line = f.readline()
+    if not line:
+        raise ConnectionError("Broker đóng kết nối")
+    kind, body = line[:1], line[1:-2]
+    if kind == b"+":
+        return body.decode()
+    if kind == b"-":
+        raise RespError(body.decode())
+    if kind == b":":
+        return int(body)
+    if kind == b"$":
+        n = int(body)
+        if n < 0: return None
+        data = f.read(n + 2)
+        if len(data) < n + 2:
+            raise ConnectionError("Broker đóng kết nối")
+        return data[:-2]
+    if kind == b"*":
+        n = int(body)
+        return None if n < 0 else [read_reply(f) for _ in range(n)]
+    raise RespError(f"Phản hồi không hợp lệ: {line!r}")
+
+
+class RespConnection:
+    def __init__(self, host, port, timeout=5.0):
+        self.sock = socket.create_connection((host, port), timeout=timeout)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.file = self.sock.makefile("rb")
+
+    def send(self, *args):
+        self.sock.sendall(encode_command(*args))
+
+    def call(self, *args):
+        self.send(*args)
+        return read_reply(self.file)
+
+    def close(self):
+        try:
+            self.file.close()
+            self.sock.close()
+        except OSError:
+            pass
+
+
+# ======================================
+# BROKER
+# ======================================
+class Broker:
+    kind = "base"
+
+    def __init__(self):
+        self._subs = {}  # kênh -> [handler(message)]
+        self._lock = threading.Lock()
+        self.published = 0
+        self.delivered = 0
+        self.errors = 0
+
+    def _handlers(self, channel):
+        with self._lock:
+            return list(self._subs.get(channel, ()))
+
+    def _deliver(self, channel, message):
+        for handler in self._handlers(channel):
+            try:
+                handler(message)
+                self.delivered += 1
+            except Exception as e:
+                self.errors += 1
+                print(f"[BROKER] Handler {channel} lỗi: {e}")
+
+    def stats(self):
+        with self._lock:
+            channels = {ch: len(h) for ch, h in self._subs.items()}
+        return {"kind": self.kind, "published": self.published, "delivered": self.delivered,
+                "errors": self.errors, "channels": channels}
+
+    def close(self):
+        pass
+
+
+class InProcessBroker(Broker):
+    kind = "memory"
+
+    def __init__(self, clock=time.time):
+        super().__init__()
+        self.clock = clock
+        self._kv = {}  # key -> (value, hết hạn | None)
+
+    def publish(self, channel, message):
+        self.published += 1
+        self._deliver(channel, message)
+
+    def subscribe(self, channel, handler):
+        with self._lock:
+            self._subs.setdefault(channel, []).append(handler)
+
+    def _alive(self, key, now):
+        item = self._kv.get(key)
+        if item is not None and item[1] is not None and item[1] <= now:
+            del self._kv[key]
+            return None
+        return item
+
+    def get(self, key):
+        with self._lock:
+            item = self._alive(key, self.clock())
+            return item[0] if item else None
+
+    def set(self, key, value, ex=None):
+        with self._lock:
+            self._kv[key] = (str(value), self.clock() + ex if ex else None)
+
+    def delete(self, key):
+        with self._lock:
+            return int(self._kv.pop(key, None) is not None)
+
+    def incr(self, key):
+        with self._lock:
+            item = self._alive(key, self.clock())
+            value = int(item[0]) + 1 if item else 1
+            self._kv[key] = (str(value), item[1] if item else None)
+            return value
+
+    def keys(self, pattern="*"):
+        now = self.clock()
+        with self._lock:
+            return sorted(k for k in list(self._kv) if fnmatch.fnmatchcase(k, pattern) and self._alive(k, now))
+
+
+class RespBroker(Broker):
+    kind = "resp"
+
+    def __init__(self, host="127.0.0.1", port=6379, timeout=5.0, reconnect_delay=0.5):
+        super().__init__()
+        self.host, self.port = host, port
+        self.timeout = timeout
+        self.reconnect_delay = reconnect_delay
+        self._conn = None             # Kết nối cho lệnh thường (publish, get, set...)
+        self._conn_lock = threading.Lock()
+        self._sub_conn = None         # Kết nối riêng ở chế độ subscribe
+        self._listener = None
+        self._closed = False
+        self.reconnects = 0
+
+    def _call(self, *args):
+        with self._conn_lock:
+            for attempt in (0, 1):
+                try:
+                    if self._conn is None:
+                        self._conn = RespConnection(self.host, self.port, self.timeout)
+                    return self._conn.call(*args)
+                except (OSError, ConnectionError):
+                    if self._conn is not None:
+                        self._conn.close()
+                        self._conn = None
+                    if attempt: raise
+                    self.reconnects += 1
+
+    def publish(self, channel, message):
+        self.published += 1
+        return self._call("PUBLISH", channel, json.dumps(message, ensure_ascii=False))
+
+    def subscribe(self, channel, handler):
+        with self._lock:
+            first = channel not in self._subs
+            self._subs.setdefault(channel, []).append(handler)
+            if first and self._sub_conn is not None:
+                self._sub_conn.send("SUBSCRIBE", channel)
+        if self._listener is None:
+            self._listener = threading.Thread(target=self._listen, name="broker-sub", daemon=True)
+            self._listener.start()
+
+    def _listen(self):
+        while not self._closed:
+            conn = None
+            try:
+                conn = RespConnection(self.host, self.port, self.timeout)
+                conn.sock.settimeout(None)  # Chờ message không giới hạn
+                with self._lock:
+                    conn.send("SUBSCRIBE", *self._subs)
+                    self._sub_conn = conn
+                while True:
+                    reply = read_reply(conn.file)
+                    if isinstance(reply, list) and reply[0] == b"message":
+                        self._deliver(reply[1].decode(), json.loads(reply[2]))
+            except (OSError, ConnectionError, RespError, ValueError) as e:
+                if self._closed: break
+                print(f"[BROKER] Mất kết nối subscribe ({e}), nối lại sau {self.reconnect_delay}s")
+                self.reconnects += 1
+            finally:
+                with self._lock:
+                    if self._sub_conn is conn: self._sub_conn = None
+                if conn is not None: conn.close()
+            time.sleep(self.reconnect_delay)
+
+    def get(self, key):
+        value = self._call("GET", key)
+        return value.decode() if value is not None else None
+
+    def set(self, key, value, ex=None):
+        args = ("SET", key, value) + (("PX", int(ex * 1000)) if ex else ())
+        self._call(*args)
+
+    def delete(self, key):
+        return self._call("DEL", key)
+
+    def incr(self, key):
+        return self._call("INCR", key)
+
+    def keys(self, pattern="*"):
+        return sorted(k.decode() for k in self._call("KEYS", pattern))
+
+    def stats(self):
+        return {**super().stats(), "url": f"redis://{self.host}:{self.port}/", "reconnects": self.reconnects,
+                "subscribed": self._sub_conn is not None}
+
+    def close(self):
+        self._closed = True
+        for conn in (self._conn, self._sub_conn):
+            if conn is not None: conn.close()
+
+
+def connect(url):
+    """"" | memory:// -> InProcessBroker; redis://host:port/ -> RespBroker"""
+    if not url or url.startswith("memory:"):
+        return InProcessBroker()
+    u = urlparse(url)
+    if u.scheme != "redis":
+        raise ValueError(f"BROKER_URL không hỗ trợ: {url}")
+    return RespBroker(u.hostname or "127.0.0.1", u.port or 6379)
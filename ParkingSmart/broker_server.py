@@ -0,0 +1,220 @@
+"""
+FILE: broker_server.py
+DESCRIPTION: Bản thay thế Redis tối giản chạy cục bộ cho chế độ nhiều worker (máy không cài Redis).
+- Nói giao thức RESP như Redis -> RespBroker (broker.py) hoặc redis-cli kết nối được
+- Lệnh hỗ trợ: PING, ECHO, PUBLISH, SUBSCRIBE, UNSUBSCRIBE, GET, SET [EX|PX], DEL, INCR, EXPIRE,
+  KEYS, DBSIZE, FLUSHALL
+- Chỉ giữ trong RAM, mỗi client 1 thread; đủ cho vài worker trên cùng 1 máy
+- cluster.py tự chạy bản này trong tiến trình launcher nếu không chỉ định --broker
+
+Chạy riêng: python broker_server.py --port 6390
+"""
+import argparse
+import fnmatch
+import socket
+import threading
+import time
+
+from broker import read_reply, RespError
+
+
+def encode_reply(value):
+    if isinstance(value, RespError):
+        return b"-%s\r\n" % str(value).encode()
+    if value is None:
+        return b"$-1\r\n"
+    if value is True:
+        return b"+OK\r\n"
+    if isinstance(value, str):  # Simple string (+PONG)
+        return b"+%s\r\n" % value.encode()
+    if isinstance(value, int):
+        return b":%d\r\n" % value
+    if isinstance(value, list):
+        return b"*%d\r\n" % len(value) + b"".join(encode_reply(v) for v in value)
+    b = value if isinstance(value, bytes) else str(value).encode()
+    return b"$%d\r\n%s\r\n" % (len(b), b)
+
+
+class _Client:
+    def __init__(self, sock, addr):
+        self.sock = sock
+        self.addr = addr
+        self.file = sock.makefile("rb")
+        self.channels = set()
+        self.send_lock = threading.Lock()  # Thread của client khác cũng ghi vào (PUBLISH)
+
+    def send(self, data):
+        with self.send_lock:
+            self.sock.sendall(data)
+
+
+class BrokerServer:
+    def __init__(self, host="127.0.0.1", port=6390, clock=time.time):
+        self.host, self.port = host, port
+        self.clock = clock
+        self._kv = {}     # key (bytes) -> (value bytes, hết hạn | None)
+        self._subs = {}   # kênh (bytes) -> set(_Client)
+        self._lock = threading.Lock()
+        self._sock = None
+        self.clients = 0
+        self.commands = 0
+        self.published = 0
+
+    def start(self):
+        """Mở cổng nghe và chạy vòng accept ở thread nền"""
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._sock.bind((self.host, self.port))
+        self._sock.listen(64)
+        self.port = self._sock.getsockname()[1]
+        threading.Thread(target=self._accept_loop, name="broker-accept", daemon=True).start()
+        print(f"[BROKER] Listening on {self.host}:{self.port}")
+        return self
+
+    def close(self):
+        if self._sock is not None:
+            self._sock.close()
+
+    def _accept_loop(self):
+        while True:
+            try:
+                sock, addr = self._sock.accept()
+            except OSError:
+                return
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            threading.Thread(target=self._serve, args=(_Client(sock, addr),), daemon=True).start()
+
+    def _serve(self, client):
+        self.clients += 1
+        try:
+            while True:
+                try:
+                    args = read_reply(client.file)
+                except RespError as e:
+                    client.send(encode_reply(RespError(f"ERR {e}")))
+                    return
+                if not isinstance(args, list) or not args:
+                    continue
+                self.commands += 1
+                for reply in self._dispatch(client, args):
+                    client.send(encode_reply(reply))
+        except (OSError, ConnectionError):
+            pass
+        finally:
+            self.clients -= 1
+            with self._lock:
+                for ch in client.channels:
+                    self._subs.get(ch, set()).discard(client)
+            try:
+                client.sock.close()
+            except OSError:
+                pass
+
+    # ---------- Lệnh ----------
+    def _alive(self, key, now):
+        item = self._kv.get(key)
+        if item is not None and item[1] is not None and item[1] <= now:
+            del self._kv[key]
+            return None
+        return item
+
+    def _dispatch(self, client, args):
+        """-> danh sách phản hồi (SUBSCRIBE nhiều kênh trả nhiều phản hồi)"""
+        cmd, args = args[0].upper().decode(), args[1:]
+        now = self.clock()
+        try:
+            if cmd == "PING":
+                return [args[0] if args else "PONG"]
+            if cmd == "ECHO":
+                return [args[0]]
+            if cmd == "PUBLISH":
+                channel, message = args
+                return [self._publish(channel, message)]
+            if cmd == "SUBSCRIBE":
+                out = []
+                with self._lock:
+                    for ch in args:
+                        self._subs.setdefault(ch, set()).add(client)
+                        client.channels.add(ch)
+                        out.append([b"subscribe", ch, len(client.channels)])
+                return out
+            if cmd == "UNSUBSCRIBE":
+                out = []
+                with self._lock:
+                    for ch in args or list(client.channels):
+                        self._subs.get(ch, set()).discard(client)
+                        client.channels.discard(ch)
+                        out.append([b"unsubscribe", ch, len(client.channels)])
+                return out
+            with self._lock:
+                if cmd == "GET":
+                    item = self._alive(args[0], now)
+                    return [item[0] if item else None]
+                if cmd == "SET":
+                    expires = None
+                    opts = [a.upper() for a in args[2:]]
+                    if b"EX" in opts: expires = now + int(args[2 + opts.index(b"EX") + 1])
+                    if b"PX" in opts: expires = now + int(args[2 + opts.index(b"PX") + 1]) / 1000
+                    self._kv[args[0]] = (args[1], expires)
+                    return [True]
+                if cmd == "DEL":
+                    return [sum(self._kv.pop(k, None) is not None for k in args)]
+                if cmd == "INCR":
+                    item = self._alive(args[0], now)
+                    value = int(item[0]) + 1 if item else 1
+                    self._kv[args[0]] = (str(value).encode(), item[1] if item else None)
+                    return [value]
+                if cmd == "EXPIRE":
+                    item = self._alive(args[0], now)
+                    if item is None: return [0]
+                    self._kv[args[0]] = (item[0], now + int(args[1]))
+                    return [1]
+                if cmd == "KEYS":
+                    pattern = args[0].decode()
+                    return [[k for k in list(self._kv)
+                             if self._alive(k, now) and fnmatch.fnmatchcase(k.decode(), pattern)]]
+                if cmd == "DBSIZE":
+                    return [sum(1 for k in list(self._kv) if self._alive(k, now))]
+                if cmd == "FLUSHALL":
+                    self._kv.clear()
+                    return [True]
+        except (IndexError, ValueError):
+            return [RespError(f"ERR wrong arguments for '{cmd.lower()}'")]
+        return [RespError(f"ERR unknown command '{cmd.lower()}'")]
+
+    def _publish(self, channel, message):
+        with self._lock:
+            targets = list(self._subs.get(channel, ()))
+        data = encode_reply([b"message", channel, message])
+        sent = 0
+        for client in targets:
+            try:
+                client.send(data)
+                sent += 1
+            except OSError:
+                pass
+        self.published += 1
+        return sent
+
+    def stats(self):
+        with self._lock:
+            return {"clients": self.clients, "commands": self.commands, "published": self.published,
+                    "keys": len(self._kv), "channels": {ch.decode(): len(c) for ch, c in self._subs.items() if c}}
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=6390)
+    args = ap.parse_args()
+    server = BrokerServer(args.host, args.port).start()
+    try:
+        while True:
+            time.sleep(60)
+            print(f"[BROKER] {server.stats()}")
+    except KeyboardInterrupt:
+        server.close()
+
+
+if __name__ == '__main__':
+    main()
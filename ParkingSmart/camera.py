@@ -0,0 +1,163 @@
+"""
+FILE: camera.py
+DESCRIPTION: Client cho ESP32-CAM.
+- Giữ kết nối keep-alive (requests.Session + pool) thay vì mở kết nối mới mỗi lần chụp
+- Tùy chọn đọc luồng MJPEG liên tục, giữ N frame mới nhất trong ring buffer
+  để lúc có xe chỉ việc lấy frame đã nhận sẵn
+"""
+import threading
+import time
+from collections import deque
+
+import cv2
+import numpy as np
+import requests
+from requests.adapters import HTTPAdapter
+
+
+class CameraClient:
+    def __init__(self, cam_ip, timeout=2, retries=3, pool_size=2,
+                 stream_url=None, ring_size=5, max_frame_age=0.5):
+        self.cam_ip = cam_ip
+        self.capture_url = f"http://{cam_ip}/capture"
+        self.stream_url = stream_url
+        self.timeout = timeout
+        self.retries = retries
+        self.max_frame_age = max_frame_age
+
+        # Pool keep-alive riêng cho từng camera (retry do mình tự làm, nhanh hơn)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("http://", adapter)
+
+        # Ring buffer cho chế độ stream: (timestamp, frame, jpeg_bytes)
+        self._ring = deque(maxlen=ring_size)
+        self._cond = threading.Condition()
+        self._last_taken = 0.0
+        self._stream_thread = None
+        self._streaming = False
+
+        self.stats_counter = {"http_ok": 0, "http_fail": 0, "stream_hits": 0,
+                              "stream_frames": 0, "stream_reconnects": 0}
+
+    # ==========================================
+    # CHỤP ẢNH QUA HTTP /capture (keep-alive)
+    # ==========================================
+    def fetch_jpeg(self):
+        """Lấy 1 ảnh JPEG (bytes) qua /capture, thử lại nhanh nếu lỗi mạng"""
+        for attempt in range(self.retries):
+            try:
+                resp = self.session.get(self.capture_url, timeout=self.timeout)
+                if resp.status_code == 200:
+                    self.stats_counter["http_ok"] += 1
+                    return resp.content
+            except Exception as e:
+                print(f"[CAM] {self.cam_ip} retry {attempt+1} due to error: {e}")
+                time.sleep(0.1)
+        self.stats_counter["http_fail"] += 1
+        print(f"[CAM] Failed to capture from {self.cam_ip}")
+        return None
+
+    def grab(self, wait=0.3, timings=None):
+        """
+        Lấy (frame, jpeg_bytes).
+        Đang stream -> lấy frame mới hơn frame đã trả lần trước (chờ tối đa `wait` giây),
+        nếu không có frame đủ mới thì chụp qua HTTP như bình thường.
+        timings (dict): điền thời gian từng bước (ms) - stream_wait / http_capture / decode
+        """
+        t = time.perf_counter()
+        if self._streaming:
+            item = self._take_from_ring(wait)
+            if timings is not None: timings["stream_wait"] = (time.perf_counter() - t) * 1000
+            if item is not None:
+                self.stats_counter["stream_hits"] += 1
+                return item[1], item[2]
+
+        t = time.perf_counter()
+        data = self.fetch_jpeg()
+        if timings is not None: timings["http_capture"] = (time.perf_counter() - t) * 1000
+        if not data: return None, None
+        t = time.perf_counter()
+        frame = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+        if timings is not None: timings["decode"] = (time.perf_counter() - t) * 1000
+        if frame is None:
+            print(f"[CAM] JPEG lỗi từ {self.cam_ip} ({len(data)} bytes)")
+            return None, None
+        return frame, data
+
+    # ==========================================
+    # CHẾ ĐỘ STREAM MJPEG
+    # ==========================================
+    def start_stream(self):
+        if not self.stream_url or self._streaming: return self
+        self._streaming = True
+        self._stream_thread = threading.Thread(target=self._stream_loop,
+                                               name=f"mjpeg-{self.cam_ip}", daemon=True)
+        self._stream_thread.start()
+        print(f"[CAM] Stream mode: {self.stream_url}")
+        return self
+
+    def stop_stream(self):
+        self._streaming = False
+
+    def _take_from_ring(self, wait):
+        deadline = time.time() + wait
+        with self._cond:
+            while True:
+                now = time.time()
+                if self._ring:
+                    ts, frame, data = self._ring[-1]
+                    if ts > self._last_taken and now - ts <= self.max_frame_age:
+                        self._last_taken = ts
+                        return ts, frame, data
+                remaining = deadline - now
+                if remaining <= 0: return None
+                self._cond.wait(remaining)
+
+    def _stream_loop(self):
+        backoff = 0.5
+        while self._streaming:
+            try:
+                with self.session.get(self.stream_url, stream=True, timeout=(self.timeout, 5)) as resp:
+                    if resp.status_code != 200:
+                        raise IOError(f"HTTP {resp.status_code}")
+                    backoff = 0.5
+                    self._read_mjpeg(resp)
+            except Exception as e:
+                print(f"[CAM] Stream {self.cam_ip} lỗi: {e}")
+            if self._streaming:
+                self.stats_counter["stream_reconnects"] += 1
+                time.sleep(backoff)
+                backoff = min(backoff * 2, 5)
+
+    def _read_mjpeg(self, resp):
+        """Tách frame JPEG theo marker SOI (FFD8) / EOI (FFD9), không cần parse boundary"""
+        buf = b""
+        for chunk in resp.iter_content(chunk_size=16384):
+            if not self._streaming: return
+            buf += chunk
+            while True:
+                start = buf.find(b"\xff\xd8")
+                if start < 0:
+                    buf = b""
+                    break
+                end = buf.find(b"\xff\xd9", start + 2)
+                if end < 0:
+                    buf = buf[start:]
+                    break
+                data = buf[start:end + 2]
+                buf = buf[end + 2:]
+                frame = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+                if frame is None: continue
+                with self._cond:
+                    self._ring.append((time.time(), frame, data))
+                    self.stats_counter["stream_frames"] += 1
+                    self._cond.notify_all()
+
+    def stats(self):
+        out = dict(self.stats_counter)
+        out["streaming"] = self._streaming
+        out["buffered"] = len(self._ring)
+        if self._ring:
+            out["latest_age_ms"] = round((time.time() - self._ring[-1][0]) * 1000, 1)
+        return out
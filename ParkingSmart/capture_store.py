@@ -0,0 +1,252 @@
+"""
+FILE: capture_store.py
+DESCRIPTION: Vòng đời ảnh chụp ở cổng.
+- Chia thư mục theo ngày / camera: captures/YYYY/MM/DD/<cam>/<label>_<time>.jpg
+  (không dồn hàng trăm nghìn file vào 1 thư mục)
+- Dọn dẹp nền: xóa các shot không được chọn (không có trong parking_log) và ảnh _debug cũ
+- Ngày cũ được đóng gói thành 1 file YYYY/MM/DD.zip (mục lục zip = chỉ mục),
+  read() vẫn đọc được ảnh trong gói nên web không cần biết ảnh đã bị đóng gói
+- usage(): dung lượng theo loại (shot / debug / gói / thumbnail)
+
+Chạy tay: python capture_store.py retention [database.db]
+"""
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+import zipfile
+from collections import OrderedDict
+from datetime import date, datetime, timedelta
+
+DAY_DIR = re.compile(r"^(\d{4})/(\d{2})/(\d{2})$")
+PACK_EXT = ".zip"
+
+
+class CaptureStore:
+    def __init__(self, root, cam_names=None, thumb_root=None, keep_shots_days=7, keep_debug_days=3,
+                 pack_after_days=30, open_packs=8):
+        self.root = root
+        self.cam_names = dict(cam_names or {})  # IP -> tên thư mục (entry / exit)
+        self.thumb_root = thumb_root
+        self.keep_shots_days = keep_shots_days   # Shot không được chọn giữ lại chừng này ngày
+        self.keep_debug_days = keep_debug_days   # Ảnh _debug giữ lại chừng này ngày
+        self.pack_after_days = pack_after_days   # Ngày cũ hơn -> đóng gói zip (None = không đóng gói)
+        self._packs = OrderedDict()              # Gói zip đang mở (LRU)
+        self.open_packs = open_packs
+        self._lock = threading.Lock()
+        self._thread = None
+        self.last_run = None
+        self.last_usage = None
+
+    # ---------- Đường dẫn ----------
+    def cam_dir(self, cam_ip):
+        return self.cam_names.get(cam_ip) or (cam_ip or "unknown").replace(".", "_").replace(":", "_")
+
+    def path_for(self, label, cam_ip=None, when=None):
+        when = when or datetime.now()
+        return os.path.join(self.root, when.strftime("%Y"), when.strftime("%m"), when.strftime("%d"),
+                            self.cam_dir(cam_ip), f"{label}_{when.strftime('%Y%m%d_%H%M%S')}.jpg")
+
+    def pack_path(self, day_rel):
+        return os.path.join(self.root, day_rel + PACK_EXT)
+
+    # ---------- Đọc (kể cả ảnh đã đóng gói) ----------
+    def _pack(self, path):
+        with self._lock:
+            zf = self._packs.get(path)
+            if zf is not None:
+                self._packs.move_to_end(path)
+                return zf
+        if not os.path.exists(path):
+            return None
+        zf = zipfile.ZipFile(path)
+        with self._lock:
+            self._packs[path] = zf
+            while len(self._packs) > self.open_packs:
+                self._packs.popitem(last=False)[1].close()
+        return zf
+
+    def read(self, rel):
+        """Bytes của ảnh theo đường dẫn tương đối trong root, None nếu không có"""
+        path = os.path.join(self.root, rel)
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                return f.read()
+        parts = rel.replace("\\", "/").split("/")
+        if len(parts) < 4:
+            return None  # Ảnh cũ để phẳng trong root, không đóng gói
+        zf = self._pack(self.pack_path("/".join(parts[:3])))
+        if zf is None:
+            return None
+        try:
+            with self._lock:
+                return zf.read("/".join(parts[3:]))
+        except KeyError:
+            return None
+
+    # ---------- Dọn dẹp ----------
+    def _day_dirs(self):
+        """[(date, 'YYYY/MM/DD')] các thư mục ngày chưa đóng gói"""
+        out = []
+        for dirpath, dirnames, _ in os.walk(self.root):
+            rel = os.path.relpath(dirpath, self.root).replace("\\", "/")
+            m = DAY_DIR.match(rel)
+            if m:
+                out.append((date(int(m[1]), int(m[2]), int(m[3])), rel))
+                dirnames[:] = []  # Không cần đi sâu hơn
+            elif rel.count("/") >= 2:
+                dirnames[:] = []
+        return sorted(out)
+
+    def _remove(self, path, rel, counters, key):
+        try:
+            size = os.path.getsize(path)
+            os.remove(path)
+        except OSError:
+            return
+        counters[key] += 1
+        counters["bytes_freed"] += size
+        if self.thumb_root:
+            base = os.path.splitext(rel)[0]
+            for size_dir in (os.listdir(self.thumb_root) if os.path.isdir(self.thumb_root) else []):
+                for ext in (".webp", ".jpeg", ".jpg"):
+                    thumb = os.path.join(self.thumb_root, size_dir, base + ext)
+                    if os.path.exists(thumb):
+                        os.remove(thumb)
+
+    def run_retention(self, keep_paths, today=None):
+        """
+        keep_paths: tập đường dẫn tương đối (trong root) đang được parking_log tham chiếu.
+        Trả về số file đã xóa / ngày đã đóng gói
+        """
+        today = today or date.today()
+        counters = {"shots_removed": 0, "debug_removed": 0, "days_packed": 0, "bytes_freed": 0}
+        shot_cutoff = today - timedelta(days=self.keep_shots_days)
+        debug_cutoff = today - timedelta(days=self.keep_debug_days)
+
+        for day, day_rel in self._day_dirs():
+            if day >= debug_cutoff:
+                continue
+            day_path = os.path.join(self.root, day_rel)
+            for dirpath, _, files in os.walk(day_path):
+                for name in files:
+                    path = os.path.join(dirpath, name)
+                    rel = os.path.relpath(path, self.root).replace("\\", "/")
+                    if name.endswith("_debug.jpg"):
+                        self._remove(path, rel, counters, "debug_removed")
+                    elif day < shot_cutoff and name.endswith(".jpg") and rel not in keep_paths:
+                        self._remove(path, rel, counters, "shots_removed")
+
+            if self.pack_after_days is not None and day < today - timedelta(days=self.pack_after_days):
+                self.pack_day(day_rel)
+                counters["days_packed"] += 1
+
+        # Ảnh cũ để phẳng trong root (trước khi chia thư mục): xét theo ngày sửa file
+        for entry in os.scandir(self.root):
+            if not entry.is_file() or not entry.name.endswith(".jpg"):
+                continue
+            day = date.fromtimestamp(entry.stat().st_mtime)
+            if entry.name.endswith("_debug.jpg") and day < debug_cutoff:
+                self._remove(entry.path, entry.name, counters, "debug_removed")
+            elif day < shot_cutoff and entry.name not in keep_paths and not entry.name.endswith("_debug.jpg"):
+                self._remove(entry.path, entry.name, counters, "shots_removed")
+
+        self.last_run = {"at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"), **counters}
+        return counters
+
+    def pack_day(self, day_rel):
+        """Gom cả thư mục ngày vào YYYY/MM/DD.zip (JPEG đã nén sẵn -> ZIP_STORED) rồi xóa thư mục"""
+        day_path = os.path.join(self.root, day_rel)
+        pack = self.pack_path(day_rel)
+        tmp = pack + ".tmp"
+        with zipfile.ZipFile(tmp, "w", zipfile.ZIP_STORED) as zf:
+            if os.path.exists(pack):  # Gộp với gói cũ nếu ngày này đã từng được đóng gói
+                with zipfile.ZipFile(pack) as old:
+                    for name in old.namelist():
+                        zf.writestr(old.getinfo(name), old.read(name))
+            for dirpath, _, files in os.walk(day_path):
+                for name in files:
+                    path = os.path.join(dirpath, name)
+                    zf.write(path, os.path.relpath(path, day_path).replace("\\", "/"))
+        with self._lock:
+            old = self._packs.pop(pack, None)
+            if old: old.close()
+        os.replace(tmp, pack)
+        for dirpath, _, files in sorted(os.walk(day_path), key=lambda w: -len(w[0])):
+            for name in files:
+                os.remove(os.path.join(dirpath, name))
+            os.rmdir(dirpath)
+
+    def start(self, keep_paths_fn, interval=3600):
+        """Chạy dọn dẹp định kỳ ở thread nền. keep_paths_fn() -> tập ảnh cần giữ (đọc từ DB)"""
+        def loop():
+            while True:
+                try:
+                    self.run_retention(keep_paths_fn())
+                    self.usage()
+                except Exception as e:
+                    print(f"[STORAGE] Retention lỗi: {e}")
+                time.sleep(interval)
+        self._thread = threading.Thread(target=loop, name="capture-retention", daemon=True)
+        self._thread.start()
+        return self
+
+    # ---------- Thống kê ----------
+    def usage(self):
+        """Quét dung lượng (tốn I/O -> kết quả được giữ lại trong last_usage)"""
+        out = {"shots": [0, 0], "debug": [0, 0], "packs": [0, 0], "thumbs": [0, 0]}
+        for root, kind in ((self.root, None), (self.thumb_root, "thumbs")):
+            if not root or not os.path.isdir(root): continue
+            for dirpath, _, files in os.walk(root):
+                for name in files:
+                    try:
+                        size = os.path.getsize(os.path.join(dirpath, name))
+                    except OSError:
+                        continue
+                    k = kind or ("packs" if name.endswith(PACK_EXT) else
+                                 "debug" if name.endswith("_debug.jpg") else "shots")
+                    out[k][0] += 1
+                    out[k][1] += size
+        self.last_usage = {k: {"files": v[0], "bytes": v[1]} for k, v in out.items()}
+        self.last_usage["total_bytes"] = sum(v[1] for v in out.values())
+        self.last_usage["at"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        return self.last_usage
+
+    def stats(self):
+        return {"usage": self.last_usage, "last_retention": self.last_run,
+                "policy": {"keep_shots_days": self.keep_shots_days, "keep_debug_days": self.keep_debug_days,
+                           "pack_after_days": self.pack_after_days}}
+
+
+# Ảnh lúc vào, lúc ra, và ảnh bằng chứng cảnh báo (db.keep_capture)
+SQL_REFERENCED = """
+    SELECT image_path FROM parking_log WHERE image_path IS NOT NULL
+    UNION SELECT exit_image_path FROM parking_log WHERE exit_image_path IS NOT NULL
+    UNION SELECT path FROM capture_refs
+"""
+
+
+def referenced_paths(conn, root):
+    """Ảnh đang được parking_log / capture_refs dùng (đường dẫn tương đối trong root)"""
+    prefix = root.replace("\\", "/").rstrip("/") + "/"
+    keep = set()
+    for (path,) in conn.execute(SQL_REFERENCED):
+        path = path.replace("\\", "/")
+        if path.startswith(prefix):
+            keep.add(path[len(prefix):])
+    return keep
+
+
+if __name__ == '__main__':
+    if len(sys.argv) >= 2 and sys.argv[1] == "retention":
+        db_file = sys.argv[2] if len(sys.argv) >= 3 else "database.db"
+        store = CaptureStore("static/captures", thumb_root="static/thumbs")
+        conn = sqlite3.connect(db_file)
+        from db import migrate
+        migrate(conn)  # Cần cột exit_image_path / bảng capture_refs
+        print(store.run_retention(referenced_paths(conn, store.root)))
+        print(store.usage())
+    else:
+        print("Usage: python capture_store.py retention [database.db]")
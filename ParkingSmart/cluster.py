@@ -0,0 +1,143 @@
+"""
+FILE: cluster.py
+DESCRIPTION: Chạy nhiều worker app.py trên 1 máy (dùng hết CPU cho YOLO / OCR), chung 1 broker.
+- Worker 0 (chính) nghe ở --port: ESP32, đầu đọc RFID, dashboard vẫn gọi đúng 1 địa chỉ như cũ.
+  Request của làn thuộc worker khác được chuyển tiếp tới worker đó (gán cổng: lots.py)
+- Worker k nghe ở --port + k; có thể trỏ thẳng thiết bị của làn vào đó để bỏ 1 chặng chuyển tiếp
+- Broker: --broker redis://host:port/ (Redis thật), mặc định chạy broker_server.py ngay trong launcher
+- Worker 0 khởi động trước (migration DB), các worker khác chạy sau khi worker 0 đã nhận request
+- Mỗi worker giới hạn thread torch / OpenMP = số CPU / số worker (tránh tranh CPU giữa các worker)
+- Worker thoát bất thường -> khởi động lại; Ctrl+C -> dừng tất cả
+
+Chạy: python cluster.py --workers 4 [--port 5000] [--lots lots.json] [--broker redis://127.0.0.1:6379/]
+"""
+import argparse
+import os
+import signal
+import subprocess
+import sys
+import time
+
+import requests
+
+from broker_server import BrokerServer
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+class Worker:
+    def __init__(self, index, env, log_dir=None):
+        self.index = index
+        self.env = env
+        self.log_dir = log_dir
+        self.proc = None
+        self.log = None
+        self.started = 0.0
+        self.restarts = 0
+
+    def start(self):
+        out = None
+        if self.log:
+            self.log.close()
+        if self.log_dir:
+            self.log = open(os.path.join(self.log_dir, f"worker{self.index}.log"), "a")
+            out = self.log
+        self.proc = subprocess.Popen([sys.executable, "app.py"], cwd=APP_DIR, env=self.env,
+                                     stdout=out, stderr=subprocess.STDOUT if out else None)
+        self.started = time.time()
+        print(f"[CLUSTER] Worker {self.index} started (pid {self.proc.pid}, port {self.env['PORT']})")
+
+    def alive(self):
+        return self.proc is not None and self.proc.poll() is None
+
+    def stop(self, timeout=10):
+        if self.alive():
+            self.proc.terminate()
+            try:
+                self.proc.wait(timeout)
+            except subprocess.TimeoutExpired:
+                self.proc.kill()
+        if self.log:
+            self.log.close()
+            self.log = None
+
+
+def wait_http(port, timeout, proc=None):
+    """Chờ worker trả lời HTTP (init_db / migration đã xong)"""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if proc is not None and proc.poll() is not None:
+            return False
+        try:
+            requests.get(f"http://127.0.0.1:{port}/api/ready", timeout=2)
+            return True
+        except requests.RequestException:
+            time.sleep(0.5)
+    return False
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--workers", type=int, default=max(1, min(4, (os.cpu_count() or 2) // 2)))
+    ap.add_argument("--port", type=int, default=int(os.environ.get("PORT", 5000)), help="Cổng của worker chính")
+    ap.add_argument("--lots", default=os.environ.get("LOTS_FILE", "lots.json"))
+    ap.add_argument("--broker", default=os.environ.get("BROKER_URL", ""),
+                    help="redis://host:port/ (mặc định: chạy broker cục bộ trong launcher)")
+    ap.add_argument("--broker-port", type=int, default=6390, help="Cổng broker cục bộ")
+    ap.add_argument("--threads", type=int, default=0, help="Thread torch / OpenMP mỗi worker (0 = tự chia)")
+    ap.add_argument("--log-dir", help="Ghi log từng worker ra file thay vì chung stdout")
+    ap.add_argument("--ready-timeout", type=float, default=120)
+    args = ap.parse_args()
+
+    server = None
+    broker_url = args.broker
+    if not broker_url:
+        server = BrokerServer("127.0.0.1", args.broker_port).start()
+        broker_url = f"redis://127.0.0.1:{server.port}/"
+    if args.log_dir:
+        os.makedirs(args.log_dir, exist_ok=True)
+
+    threads = args.threads or max(1, (os.cpu_count() or 1) // args.workers)
+    workers = []
+    for k in range(args.workers):
+        env = dict(os.environ, WORKER_ID=str(k), WORKER_COUNT=str(args.workers),
+                   WORKER_PORT_BASE=str(args.port), PORT=str(args.port + k), BROKER_URL=broker_url,
+                   LOTS_FILE=args.lots, SERVER_DEBUG="0",  # debug=True bật reloader -> thêm tiến trình con
+                   OMP_NUM_THREADS=str(threads), MKL_NUM_THREADS=str(threads))
+        workers.append(Worker(k, env, args.log_dir))
+
+    stopping = []
+    signal.signal(signal.SIGTERM, lambda *_: stopping.append(True))
+    try:
+        workers[0].start()
+        if not wait_http(args.port, args.ready_timeout, workers[0].proc):
+            print("[CLUSTER] Worker 0 không khởi động được")
+            return 1
+        for w in workers[1:]:
+            w.start()
+        print(f"[CLUSTER] {args.workers} workers, broker {broker_url}, {threads} threads/worker")
+
+        while not stopping:
+            time.sleep(1)
+            for w in workers:
+                if not w.alive():
+                    code = w.proc.returncode
+                    # Chết ngay sau khi chạy (lỗi cấu hình...) thì chờ lâu hơn trước khi chạy lại
+                    delay = 1 if time.time() - w.started > 30 else min(30, 2 ** min(w.restarts, 5))
+                    print(f"[CLUSTER] Worker {w.index} exited ({code}), restarting in {delay}s")
+                    time.sleep(delay)
+                    w.restarts += 1
+                    w.start()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print("[CLUSTER] Stopping workers...")
+        for w in workers:
+            w.stop()
+        if server is not None:
+            server.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,174 @@
+"""
+FILE: commands.py
+DESCRIPTION: Kênh lệnh điều khiển barie theo từng cổng (thay cho list command_queue).
+- Mỗi cổng 1 hàng đợi (deque), có khóa -> an toàn khi nhiều thread / request cùng lấy lệnh
+- Lệnh có TTL: bấm "mở cổng" mà 30s sau thiết bị mới hỏi thì bỏ, không mở nhầm
+- Long-poll: thiết bị hỏi 1 lần và chờ tới khi có lệnh (hoặc hết wait giây) -> nhận lệnh
+  gần như tức thì mà không phải hỏi liên tục. Request đang chờ ngủ ngắn bằng sleep (socketio.sleep:
+  không chặn hub eventlet) và chỉ so số version - hàng đợi chỉ được xem lại khi có lệnh mới / lệnh
+  giao lại (version tăng) hoặc tới hạn giao lại lệnh chưa ack
+- Xác nhận (ack): lệnh đã giao cho client yêu cầu ack mà không được ack trong
+  redeliver_after giây sẽ được giao lại. Client cũ không ack -> giao đúng 1 lần như trước
+- Push: nếu có thiết bị đang giữ Socket.IO trong room gate:<cổng>, lệnh được đẩy ngay (on_push)
+- Nhiều worker: hàng đợi chỉ nằm ở worker chính, worker khác tạo id (new_id) rồi gửi lệnh qua broker
+"""
+import itertools
+import threading
+import time
+from collections import deque
+
+GATES = ("entry", "exit")
+
+
+class Command:
+    __slots__ = ("id", "gate", "name", "created", "expires", "delivered_at", "deliveries", "acked")
+
+    def __init__(self, cmd_id, gate, name, ttl):
+        self.id = cmd_id
+        self.gate = gate
+        self.name = name
+        self.created = time.time()
+        self.expires = self.created + ttl
+        self.delivered_at = None
+        self.deliveries = 0
+        self.acked = False
+
+    def to_dict(self):
+        return {"id": self.id, "gate": self.gate, "command": self.name,
+                "age_ms": round((time.time() - self.created) * 1000, 1)}
+
+
+class CommandBus:
+    def __init__(self, gates=GATES, ttl=30, redeliver_after=5, sleep=time.sleep,
+                 poll_interval=0.02, on_push=None, id_prefix=""):
+        self.ttl = ttl
+        self.redeliver_after = redeliver_after
+        self.sleep = sleep  # socketio.sleep khi chạy eventlet (threading.Condition sẽ chặn cả hub)
+        self.poll_interval = poll_interval
+        self.on_push = on_push  # fn(command) -> True nếu đã đẩy tới thiết bị qua socket
+        self._queues = {g: deque() for g in gates}
+        self._inflight = {}      # id -> Command đã giao, chờ ack
+        self._listeners = {g: 0 for g in gates}  # Số thiết bị đang giữ socket theo cổng
+        self._lock = threading.Lock()
+        self._version = 0  # Tăng mỗi khi có lệnh vào hàng đợi -> take() đang chờ biết để xem lại
+        self._ids = itertools.count(1)
+        self.id_prefix = id_prefix
+        self.counters = {"enqueued": 0, "delivered": 0, "pushed": 0, "acked": 0,
+                         "redelivered": 0, "expired": 0}
+
+    @property
+    def gates(self):
+        return tuple(self._queues.keys())
+
+    def new_id(self):
+        return f"{self.id_prefix}{int(time.time())}-{next(self._ids)}"
+
+    def enqueue(self, gate, name, ttl=None, cmd_id=None):
+        if gate not in self._queues:
+            raise ValueError(f"Unknown gate: {gate}")
+        cmd = Command(cmd_id or self.new_id(), gate, name, ttl or self.ttl)
+        with self._lock:
+            self.counters["enqueued"] += 1
+            pushed = self._listeners[gate] > 0 and self.on_push is not None
+            if pushed:
+                # Đã có thiết bị giữ socket: đẩy ngay, chờ ack như lệnh đã giao qua long-poll
+                self._mark_delivered(cmd)
+                self.counters["pushed"] += 1
+            else:
+                self._queues[gate].append(cmd)
+                self._version += 1
+        if pushed:
+            self.on_push(cmd)
+        return cmd
+
+    def _mark_delivered(self, cmd):
+        cmd.delivered_at = time.time()
+        cmd.deliveries += 1
+        self._inflight[cmd.id] = cmd
+
+    def _redeliver(self, now):
+        """Lệnh đã giao nhưng quá hạn ack -> đưa lại đầu hàng đợi. Gọi khi đang giữ _lock"""
+        due = [c for c in self._inflight.values() if now - c.delivered_at >= self.redeliver_after]
+        for cmd in due:
+            del self._inflight[cmd.id]
+            if cmd.expires > now:
+                self._queues[cmd.gate].appendleft(cmd)
+                self.counters["redelivered"] += 1
+            else:
+                self.counters["expired"] += 1
+        if due:
+            self._version += 1  # take() khác đang chờ cổng đó nhận được lệnh giao lại
+
+    def _next_redelivery(self, now):
+        """Số giây tới lúc lệnh đang chờ ack sớm nhất tới hạn giao lại (None nếu không có)"""
+        if not self._inflight:
+            return None
+        oldest = min(c.delivered_at for c in self._inflight.values())
+        return max(oldest + self.redeliver_after - now, 0.0)
+
+    def _take_locked(self, gates, want_ack):
+        now = time.time()
+        self._redeliver(now)
+
+        # Lấy lệnh cũ nhất trong các cổng được hỏi
+        best = None
+        for gate in gates:
+            q = self._queues.get(gate)
+            while q and q[0].expires <= now:
+                q.popleft()
+                self.counters["expired"] += 1
+            if q and (best is None or q[0].created < best[0].created):
+                best = q
+        if best is None:
+            return None
+        cmd = best.popleft()
+        self.counters["delivered"] += 1
+        if want_ack:
+            self._mark_delivered(cmd)
+        else:
+            cmd.delivered_at = now
+            cmd.deliveries += 1
+        return cmd
+
+    def take(self, gates=None, wait=0, want_ack=False):
+        """Lấy 1 lệnh cho các cổng (mặc định: mọi cổng), chờ tối đa wait giây nếu chưa có"""
+        gates = gates or self.gates
+        deadline = time.time() + wait
+        while True:
+            with self._lock:
+                cmd = self._take_locked(gates, want_ack)
+                if cmd is not None:
+                    return cmd
+                now = time.time()
+                if now >= deadline:
+                    return None
+                version = self._version
+                due = self._next_redelivery(now)
+            # Ngủ tới khi có lệnh mới / giao lại (version đổi), hoặc tới hạn giao lại lệnh chưa ack
+            wake = deadline if due is None else min(deadline, now + due)
+            while self._version == version and time.time() < wake:
+                self.sleep(self.poll_interval)
+
+    def ack(self, cmd_id):
+        with self._lock:
+            cmd = self._inflight.pop(cmd_id, None)
+            if cmd is None:
+                return False
+            cmd.acked = True
+            self.counters["acked"] += 1
+            return True
+
+    # ---------- Thiết bị giữ socket ----------
+    def attach(self, gate):
+        with self._lock:
+            if gate in self._listeners: self._listeners[gate] += 1
+
+    def detach(self, gate):
+        with self._lock:
+            if self._listeners.get(gate): self._listeners[gate] -= 1
+
+    def stats(self):
+        with self._lock:
+            return {"queued": {g: len(q) for g, q in self._queues.items()},
+                    "inflight": len(self._inflight), "listeners": dict(self._listeners),
+                    **self.counters}
@@ -0,0 +1,241 @@
+"""
+FILE: db.py
+DESCRIPTION: Lớp kết nối SQLite dùng chung cho mọi route.
+- Pool có giới hạn: thread mượn 1 kết nối (không mở/đóng lại mỗi request), cuối request / job
+  trả lại bằng release() -> số kết nối (và file WAL/shm mở) không tăng theo số thread
+- Bật WAL + synchronous=NORMAL + mmap + cache lớn ngay khi mở
+- Các câu SQL trên đường nóng (vào/ra cổng) khai báo sẵn ở đây để
+  statement cache của sqlite3 tái sử dụng bản đã prepare
+- Migration theo PRAGMA user_version (index, active_sessions, bảng tổng hợp stats_*,
+  ảnh lúc ra + ảnh bằng chứng cảnh báo để dọn ảnh không xóa nhầm)
+"""
+import queue
+import sqlite3
+import threading
+
+# ======================================
+# CÂU LỆNH ĐƯỜNG NÓNG
+# ======================================
+SQL_FIND_REGISTERED = "SELECT * FROM registered_vehicles WHERE plate = ?"
+# Tra lượt xe đang trong bãi qua active_sessions (chỉ chứa xe chưa ra) -> không phụ thuộc độ dài lịch sử
+SQL_FIND_IN_BY_PLATE = """
+    SELECT p.* FROM active_sessions a JOIN parking_log p ON p.id = a.log_id
+    WHERE a.plate = ? ORDER BY a.log_id DESC LIMIT 1"""
+SQL_FIND_IN_BY_RFID = """
+    SELECT p.* FROM active_sessions a JOIN parking_log p ON p.id = a.log_id
+    WHERE a.rfid_uid = ? ORDER BY a.log_id DESC LIMIT 1"""
+SQL_INSERT_ENTRY = "INSERT INTO parking_log (plate, rfid_uid, entry_time, image_path, status) VALUES (?, ?, ?, ?, ?)"
+SQL_MARK_EXIT = "UPDATE parking_log SET exit_time=?, fee=?, exit_image_path=?, status='OUT' WHERE id=?"
+SQL_KEEP_CAPTURE = "INSERT OR IGNORE INTO capture_refs (path, log_id, reason, created_at) VALUES (?, ?, ?, ?)"
+SQL_ACTIVE_INSERT = "INSERT OR REPLACE INTO active_sessions (log_id, plate, rfid_uid, entry_time) VALUES (?, ?, ?, ?)"
+SQL_ACTIVE_DELETE = "DELETE FROM active_sessions WHERE log_id = ?"
+
+# ======================================
+# MIGRATIONS (mỗi phần tử = 1 version, chỉ được thêm vào cuối)
+# ======================================
+MIGRATIONS = [
+    # 1. Index cho tra cứu lúc ra cổng / lọc lịch sử + bảng xe đang trong bãi
+    """
+    CREATE INDEX IF NOT EXISTS idx_log_plate_in ON parking_log(plate, id) WHERE status = 'IN';
+    CREATE INDEX IF NOT EXISTS idx_log_rfid_in ON parking_log(rfid_uid, id) WHERE status = 'IN';
+    CREATE INDEX IF NOT EXISTS idx_log_entry_time ON parking_log(entry_time, id);
+
+    CREATE TABLE IF NOT EXISTS active_sessions (
+        log_id INTEGER PRIMARY KEY,
+        plate TEXT,
+        rfid_uid TEXT,
+        entry_time TEXT
+    );
+    CREATE INDEX IF NOT EXISTS idx_active_plate ON active_sessions(plate);
+    CREATE INDEX IF NOT EXISTS idx_active_rfid ON active_sessions(rfid_uid);
+
+    INSERT OR IGNORE INTO active_sessions (log_id, plate, rfid_uid, entry_time)
+        SELECT id, plate, rfid_uid, entry_time FROM parking_log WHERE status = 'IN';
+    """,
+    # 2. Bộ đếm version cho cache vé tháng (trigger tự tăng khi bảng đổi)
+    """
+    CREATE TABLE IF NOT EXISTS app_meta (
+        key TEXT PRIMARY KEY,
+        value INTEGER NOT NULL DEFAULT 0
+    );
+    INSERT OR IGNORE INTO app_meta (key, value) VALUES ('registered_version', 0);
+
+    CREATE TRIGGER IF NOT EXISTS trg_registered_ins AFTER INSERT ON registered_vehicles BEGIN
+        UPDATE app_meta SET value = value + 1 WHERE key = 'registered_version';
+    END;
+    CREATE TRIGGER IF NOT EXISTS trg_registered_upd AFTER UPDATE ON registered_vehicles BEGIN
+        UPDATE app_meta SET value = value + 1 WHERE key = 'registered_version';
+    END;
+    CREATE TRIGGER IF NOT EXISTS trg_registered_del AFTER DELETE ON registered_vehicles BEGIN
+        UPDATE app_meta SET value = value + 1 WHERE key = 'registered_version';
+    END;
+    """,
+    # 3. Version cho danh sách xe đang trong bãi (chỉ mục so khớp gần đúng lúc ra)
+    """
+    INSERT OR IGNORE INTO app_meta (key, value) VALUES ('active_version', 0);
+
+    CREATE TRIGGER IF NOT EXISTS trg_active_ins AFTER INSERT ON active_sessions BEGIN
+        UPDATE app_meta SET value = value + 1 WHERE key = 'active_version';
+    END;
+    CREATE TRIGGER IF NOT EXISTS trg_active_del AFTER DELETE ON active_sessions BEGIN
+        UPDATE app_meta SET value = value + 1 WHERE key = 'active_version';
+    END;
+    """,
+    # 4. Bảng tổng hợp theo giờ / ngày cho báo cáo doanh thu (xem stats.py)
+    """
+    CREATE TABLE IF NOT EXISTS stats_hourly (
+        bucket TEXT PRIMARY KEY,
+        revenue REAL NOT NULL DEFAULT 0,
+        entries INTEGER NOT NULL DEFAULT 0,
+        exits INTEGER NOT NULL DEFAULT 0,
+        guest_exits INTEGER NOT NULL DEFAULT 0,
+        monthly_exits INTEGER NOT NULL DEFAULT 0,
+        denied INTEGER NOT NULL DEFAULT 0,
+        dwell_seconds INTEGER NOT NULL DEFAULT 0
+    );
+    CREATE TABLE IF NOT EXISTS stats_daily (
+        bucket TEXT PRIMARY KEY,
+        revenue REAL NOT NULL DEFAULT 0,
+        entries INTEGER NOT NULL DEFAULT 0,
+        exits INTEGER NOT NULL DEFAULT 0,
+        guest_exits INTEGER NOT NULL DEFAULT 0,
+        monthly_exits INTEGER NOT NULL DEFAULT 0,
+        denied INTEGER NOT NULL DEFAULT 0,
+        dwell_seconds INTEGER NOT NULL DEFAULT 0
+    );
+    """,
+    # 5. Ảnh chụp lúc ra + ảnh bằng chứng của cảnh báo (chặn xe ra, thẻ đang dùng...) không gắn với
+    #    lượt ra nào -> capture_store.referenced_paths giữ lại, không coi là shot thừa
+    """
+    ALTER TABLE parking_log ADD COLUMN exit_image_path TEXT;
+
+    CREATE TABLE IF NOT EXISTS capture_refs (
+        path TEXT PRIMARY KEY,
+        log_id INTEGER,
+        reason TEXT,
+        created_at TEXT
+    );
+    """,
+]
+
+
+def migrate(conn):
+    """Chạy các migration còn thiếu, mỗi migration trong 1 transaction"""
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    for i in range(version, len(MIGRATIONS)):
+        conn.executescript(f"BEGIN;\n{MIGRATIONS[i]}\nPRAGMA user_version = {i + 1};\nCOMMIT;")
+        print(f"[DB] Migration {i + 1} applied.")
+    return len(MIGRATIONS)
+
+
+def open_session(conn, plate, rfid_uid, entry_time, image_path):
+    """Ghi lượt vào (status IN) và thêm vào active_sessions. Trả về id lượt gửi"""
+    cur = conn.execute(SQL_INSERT_ENTRY, (plate, rfid_uid, entry_time, image_path, "IN"))
+    conn.execute(SQL_ACTIVE_INSERT, (cur.lastrowid, plate, rfid_uid, entry_time))
+    return cur.lastrowid
+
+
+def close_session(conn, log_id, exit_time, fee, exit_image_path=None):
+    """Đánh dấu lượt ra (kèm ảnh lúc ra) và xóa khỏi active_sessions"""
+    conn.execute(SQL_MARK_EXIT, (exit_time, fee, exit_image_path, log_id))
+    conn.execute(SQL_ACTIVE_DELETE, (log_id,))
+
+
+def keep_capture(conn, path, reason, created_at, log_id=None):
+    """Ảnh bằng chứng của cảnh báo (không ghi vào parking_log) -> không bị dọn theo keep_shots_days"""
+    if path:
+        conn.execute(SQL_KEEP_CAPTURE, (path, log_id, reason, created_at))
+
+
+class PooledConnection(sqlite3.Connection):
+    """Kết nối của pool: close() từ code cũ sẽ không đóng thật (pool.release() mới trả kết nối)"""
+
+    def close(self):
+        pass
+
+    def really_close(self):
+        super().close()
+
+
+class ConnectionPool:
+    def __init__(self, db_file, cache_size_kb=16384, mmap_size=256 * 1024 * 1024,
+                 busy_timeout_ms=5000, cached_statements=256, max_size=16, acquire_timeout=30):
+        self.db_file = db_file
+        self.cache_size_kb = cache_size_kb
+        self.mmap_size = mmap_size
+        self.busy_timeout_ms = busy_timeout_ms
+        self.cached_statements = cached_statements
+        self.max_size = max_size
+        self.acquire_timeout = acquire_timeout  # Giây chờ khi cả max_size kết nối đều đang được mượn
+        self._local = threading.local()
+        self._idle = queue.LifoQueue()  # Kết nối rảnh (LIFO: dùng lại kết nối còn "nóng" cache)
+        self._all = []
+        self._lock = threading.Lock()
+        self.waits = 0
+
+    def connection(self):
+        """Kết nối của thread hiện tại (mượn từ pool ở lần gọi đầu, giữ tới khi release())"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._acquire()
+            self._local.conn = conn
+        return conn
+
+    def _acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if len(self._all) < self.max_size:
+                conn = self._open()
+                self._all.append(conn)
+                return conn
+            self.waits += 1
+        try:
+            return self._idle.get(timeout=self.acquire_timeout)
+        except queue.Empty:
+            raise sqlite3.OperationalError(f"Hết kết nối trong pool ({self.max_size})")
+
+    def release(self):
+        """Trả kết nối của thread hiện tại về pool (gọi ở cuối request / job / vòng lặp nền)"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            return
+        self._local.conn = None
+        try:
+            if conn.in_transaction:
+                conn.rollback()  # Transaction bỏ dở không được lọt sang người mượn sau
+        except sqlite3.Error:
+            pass
+        self._idle.put(conn)
+
+    def _open(self):
+        conn = sqlite3.connect(self.db_file, check_same_thread=False, factory=PooledConnection,
+                               timeout=self.busy_timeout_ms / 1000.0,
+                               cached_statements=self.cached_statements)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")        # Đọc không bị chặn bởi ghi
+        conn.execute("PRAGMA synchronous=NORMAL")      # An toàn với WAL, ít fsync hơn
+        conn.execute(f"PRAGMA mmap_size={int(self.mmap_size)}")
+        conn.execute(f"PRAGMA cache_size=-{int(self.cache_size_kb)}")  # Số âm = KB
+        conn.execute("PRAGMA temp_store=MEMORY")
+        conn.execute(f"PRAGMA busy_timeout={int(self.busy_timeout_ms)}")
+        return conn
+
+    def close_all(self):
+        with self._lock:
+            for conn in self._all:
+                try:
+                    conn.really_close()
+                except Exception:
+                    pass
+            self._all = []
+        self._idle = queue.LifoQueue()
+        self._local = threading.local()
+
+    def stats(self):
+        with self._lock:
+            idle = self._idle.qsize()
+            return {"connections": len(self._all), "idle": idle, "in_use": len(self._all) - idle,
+                    "max_size": self.max_size, "waits": self.waits, "db_file": self.db_file}
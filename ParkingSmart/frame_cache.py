@@ -0,0 +1,165 @@
+"""
+FILE: frame_cache.py
+DESCRIPTION: Bỏ qua nhận diện lại ảnh gần như trùng (xe đứng yên trước barie, quẹt thẻ nhiều lần).
+- Khóa = dHash (hash cảm nhận) của ảnh, so gần đúng theo khoảng cách Hamming -> nhiễu / nén JPEG
+  giữa 2 lần chụp không làm trượt cache
+- 2 tầng, theo từng camera, có TTL + giới hạn số phần tử (LRU):
+  * Cả khung hình: trúng -> trả lại kết quả (plate, status, conf, chars) cũ, không chạy YOLO + OCR.
+    Chỉ giữ kết quả đọc được biển (SUCCESS), kèm box + hash vùng biển số: ảnh mới còn phải có
+    vùng biển số giống (khung giống nhưng biển khác, VD xe khác cùng màu dừng đúng chỗ cũ -> không
+    dùng kết quả cũ). Ảnh không thấy / không đọc được biển thì lần sau vẫn chạy lại AI
+  * Ảnh crop biển số (sau YOLO): trúng -> dùng lại kết quả OCR, không chạy EasyOCR
+"""
+import threading
+import time
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+FRAME_HASH_SIZE = (16, 16)  # 256 bit cho cả khung hình
+CROP_HASH_SIZE = (24, 8)    # 192 bit, theo tỉ lệ biển số
+HASH_MARGIN = 2             # Chênh lệch sáng tối thiểu để đặt bit (vùng phẳng: nhiễu không lật bit)
+
+
+def dhash(img, size=FRAME_HASH_SIZE, margin=HASH_MARGIN):
+    """
+    Difference hash: thu nhỏ về (w+1) x h, bit = pixel bên phải sáng hơn bên trái quá margin
+    -> số nguyên w*h bit. margin giúp vùng phẳng (tường, mặt đường) không bị nhiễu cảm biến lật bit
+    """
+    w, h = size
+    small = cv2.resize(img, (w + 1, h), interpolation=cv2.INTER_AREA)  # Thu nhỏ trước rồi mới đổi sang xám
+    if small.ndim == 3:
+        small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+    small = small.astype(np.float32)
+    bits = (small[:, 1:] - small[:, :-1] > margin).ravel()
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+def hamming(a, b):
+    return bin(a ^ b).count("1")
+
+
+class HashLRU:
+    """LRU theo camera, tra gần đúng: lấy phần tử gần nhất có khoảng cách <= max_distance và chưa hết hạn"""
+
+    def __init__(self, ttl=3.0, max_entries=16, max_distance=8, clock=time.monotonic, on_lookup=None):
+        self.ttl = ttl
+        self.max_entries = max_entries    # Mỗi camera
+        self.max_distance = max_distance
+        self.clock = clock
+        self.on_lookup = on_lookup  # fn("hit" | "miss" | "rejected") mỗi lần tra (counter /metrics)
+        self._items = {}  # cam -> OrderedDict(hash -> (thời điểm, giá trị))
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evicted = 0
+        self.rejected = 0
+
+    def get(self, cam, key, accept=None):
+        """accept(giá trị) -> False: phần tử giống nhưng không dùng được (tính là trượt)"""
+        value, outcome = self._get(cam, key, accept)
+        if self.on_lookup is not None:
+            self.on_lookup(outcome)
+        return value
+
+    def _get(self, cam, key, accept):
+        now = self.clock()
+        with self._lock:
+            items = self._items.get(cam)
+            best, best_d = None, self.max_distance + 1
+            if items:
+                for h, (ts, _) in list(items.items()):
+                    if now - ts > self.ttl:
+                        del items[h]
+                        self.expired += 1
+                        continue
+                    d = hamming(h, key)
+                    if d < best_d:
+                        best, best_d = h, d
+            outcome = "miss"
+            if best is not None and accept is not None and not accept(items[best][1]):
+                self.rejected += 1
+                best, outcome = None, "rejected"
+            if best is None:
+                self.misses += 1
+                return None, outcome
+            items.move_to_end(best)
+            self.hits += 1
+            return items[best][1], "hit"
+
+    def put(self, cam, key, value):
+        with self._lock:
+            items = self._items.setdefault(cam, OrderedDict())
+            items[key] = (self.clock(), value)
+            items.move_to_end(key)
+            while len(items) > self.max_entries:
+                items.popitem(last=False)
+                self.evicted += 1
+
+    def stats(self):
+        with self._lock:
+            looked = self.hits + self.misses
+            return {"hits": self.hits, "misses": self.misses,
+                    "hit_rate": round(self.hits / looked, 3) if looked else None,
+                    "expired": self.expired, "evicted": self.evicted, "rejected": self.rejected,
+                    "entries": sum(len(v) for v in self._items.values())}
+
+
+class RecognitionCache:
+    # Chỉ cache khung đã đọc ra biển: NO_DETECTION / OCR_EMPTY... mà cache thì xe vừa nhích lên
+    # (khung vẫn gần trùng) cũng không được nhận diện lại. Lỗi tạm thời (AI_FAIL...) càng không
+    CACHEABLE = ("SUCCESS",)
+
+    def __init__(self, ttl=3.0, max_entries=16, frame_distance=10, crop_distance=8, on_lookup=None):
+        """on_lookup(tầng "frame" | "crop", kết quả "hit" | "miss" | "rejected")"""
+        hook = (lambda level: lambda outcome: on_lookup(level, outcome)) if on_lookup else (lambda level: None)
+        self.frames = HashLRU(ttl, max_entries, frame_distance, on_lookup=hook("frame"))
+        self.crops = HashLRU(ttl, max_entries, crop_distance, on_lookup=hook("crop"))
+        self.crop_distance = crop_distance
+
+    @staticmethod
+    def frame_key(frame):
+        return dhash(frame, FRAME_HASH_SIZE)
+
+    @staticmethod
+    def crop_key(crop):
+        return dhash(crop, CROP_HASH_SIZE)
+
+    # ---------- Tầng khung hình ----------
+    def lookup(self, cam, frame):
+        """-> (kết quả cũ | None, hash khung hình để store)"""
+        key = self.frame_key(frame)
+
+        def same_plate(entry):
+            # Khung giống nhưng vùng biển số khác -> không dùng kết quả cũ
+            _, box, crop_hash = entry
+            if box is None or crop_hash is None:
+                return False
+            x1, y1, x2, y2 = box
+            crop = frame[y1:y2, x1:x2]
+            return crop.size > 0 and hamming(self.crop_key(crop), crop_hash) <= self.crop_distance
+
+        entry = self.frames.get(cam, key, accept=same_plate)
+        return (entry[0] if entry else None), key
+
+    def store(self, cam, key, result, box=None, crop_hash=None):
+        if result[1] not in self.CACHEABLE or box is None or crop_hash is None:
+            return
+        self.frames.put(cam, key, (result, box, crop_hash))
+
+    # ---------- Tầng crop biển số (OCR) ----------
+    def lookup_ocr(self, cam, crop):
+        key = self.crop_key(crop)
+        return self.crops.get(cam, key), key
+
+    def store_ocr(self, cam, key, ocr_res, status):
+        """Như tầng khung hình: chỉ giữ kết quả OCR đã chuẩn hóa ra biển (status SUCCESS)"""
+        if status not in self.CACHEABLE or not ocr_res:
+            return
+        self.crops.put(cam, key, ocr_res)
+
+    def stats(self):
+        return {"frame": self.frames.stats(), "crop": self.crops.stats(),
+                "ttl": self.frames.ttl}
@@ -0,0 +1,152 @@
+"""
+FILE: inference.py
+DESCRIPTION: Worker suy luận dùng chung cho tất cả các làn xe.
+Gom khung hình từ nhiều cổng thành micro-batch để gọi YOLO một lần,
+mỗi request nhận về một Future chứa kết quả của riêng nó.
+"""
+import threading
+import queue
+import time
+from collections import deque
+from concurrent.futures import Future
+
+
+class _Job:
+    __slots__ = ("frame", "meta", "future", "t_submit")
+
+    def __init__(self, frame, meta):
+        self.frame = frame
+        self.meta = meta or {}
+        self.future = Future()
+        self.t_submit = time.perf_counter()
+
+
+class InferenceEngine:
+    """
+    predict_fn(frames)  -> list các detections [(x1, y1, x2, y2, conf), ...] cho từng frame
+                           (pass_meta=True: predict_fn(frames, metas), VD để cắt ROI theo camera)
+    postprocess_fn(frame, detections, meta) -> kết quả trả về cho người gọi (VD: (plate, status))
+    """
+
+    def __init__(self, predict_fn, postprocess_fn, max_batch=4, max_wait_ms=15, stats_window=200,
+                 pass_meta=False):
+        self.predict_fn = predict_fn
+        self.pass_meta = pass_meta
+        self.postprocess_fn = postprocess_fn
+        self.max_batch = max(1, int(max_batch))
+        self.max_wait = max_wait_ms / 1000.0
+
+        self._queue = queue.Queue()
+        self._thread = None
+        self._running = False
+
+        # Thống kê để tinh chỉnh cửa sổ chờ
+        self._lock = threading.Lock()
+        self._batches = deque(maxlen=stats_window)  # (size, wait_ms, predict_ms, total_ms)
+        self._size_hist = {}
+        self._total_batches = 0
+        self._total_frames = 0
+
+    # ---------- Vòng đời ----------
+    def start(self):
+        if self._running: return self
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="inference-worker", daemon=True)
+        self._thread.start()
+        print(f"[AI ENGINE] Started (max_batch={self.max_batch}, wait={self.max_wait*1000:.0f}ms)")
+        return self
+
+    def stop(self):
+        self._running = False
+        self._queue.put(None)  # Đánh thức worker
+        if self._thread:
+            self._thread.join(timeout=2)
+
+    # ---------- API cho request thread ----------
+    def submit(self, frame, meta=None):
+        """Đưa 1 frame vào hàng đợi, trả về Future"""
+        job = _Job(frame, meta)
+        if not self._running:
+            job.future.set_exception(RuntimeError("Inference engine is not running"))
+            return job.future
+        self._queue.put(job)
+        return job.future
+
+    def stats(self):
+        with self._lock:
+            batches = list(self._batches)
+            hist = dict(sorted(self._size_hist.items()))
+            total_b, total_f = self._total_batches, self._total_frames
+
+        if not batches:
+            return {"batches": total_b, "frames": total_f, "size_hist": hist, "queue": self._queue.qsize()}
+
+        def avg(idx): return round(sum(b[idx] for b in batches) / len(batches), 2)
+        predict_sorted = sorted(b[2] for b in batches)
+        return {
+            "batches": total_b,
+            "frames": total_f,
+            "queue": self._queue.qsize(),
+            "size_hist": hist,
+            "avg_batch_size": avg(0),
+            "avg_wait_ms": avg(1),
+            "avg_predict_ms": avg(2),
+            "p95_predict_ms": round(predict_sorted[round(0.95 * (len(predict_sorted) - 1))], 2),
+            "avg_batch_total_ms": avg(3),
+            "max_batch": self.max_batch,
+            "max_wait_ms": self.max_wait * 1000,
+        }
+
+    # ---------- Worker ----------
+    def _collect(self):
+        """Lấy job đầu tiên (chờ vô hạn) rồi gom thêm trong cửa sổ max_wait"""
+        first = self._queue.get()
+        if first is None: return []
+        batch = [first]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0: break
+            try:
+                job = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if job is None: break
+            batch.append(job)
+        return batch
+
+    def _run(self):
+        while self._running:
+            batch = self._collect()
+            if batch:
+                self._run_batch(batch)
+
+    def _run_batch(self, batch):
+        t0 = time.perf_counter()
+        try:
+            frames = [j.frame for j in batch]
+            if self.pass_meta:
+                detections = self.predict_fn(frames, [j.meta for j in batch])
+            else:
+                detections = self.predict_fn(frames)
+        except Exception as e:
+            print(f"[AI ENGINE] Predict error: {e}")
+            for j in batch:
+                j.future.set_exception(e)
+            return
+        t1 = time.perf_counter()
+
+        for job, dets in zip(batch, detections):
+            try:
+                job.future.set_result(self.postprocess_fn(job.frame, dets, job.meta))
+            except Exception as e:
+                job.future.set_exception(e)
+        t2 = time.perf_counter()
+
+        wait_ms = (t0 - min(j.t_submit for j in batch)) * 1000
+        with self._lock:
+            size = len(batch)
+            self._batches.append((size, wait_ms, (t1 - t0) * 1000, (t2 - t0) * 1000))
+            self._size_hist[size] = self._size_hist.get(size, 0) + 1
+            self._total_batches += 1
+            self._total_frames += size
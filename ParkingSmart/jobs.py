@@ -0,0 +1,105 @@
+"""
+FILE: jobs.py
+DESCRIPTION: Hàng đợi job cho các tác vụ nặng (chụp ảnh + AI + ghi DB ở cổng).
+Job chạy trên thread pool thật, request chỉ việc submit rồi chờ (nhường CPU)
+hoặc trả job_id để cổng tự hỏi lại -> các API cảm biến / lệnh không bị chặn.
+"""
+import itertools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class Job:
+    __slots__ = ("id", "kind", "state", "result", "error", "created", "started", "finished")
+
+    def __init__(self, job_id, kind):
+        self.id = job_id
+        self.kind = kind
+        self.state = "queued"   # queued -> running -> done | error
+        self.result = None
+        self.error = None
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+
+    @property
+    def done(self):
+        return self.state in ("done", "error")
+
+    def to_dict(self):
+        out = {"job_id": self.id, "kind": self.kind, "state": self.state}
+        if self.started:
+            out["queue_ms"] = round((self.started - self.created) * 1000, 1)
+        if self.finished:
+            out["run_ms"] = round((self.finished - self.started) * 1000, 1)
+        if self.error:
+            out["error"] = self.error
+        return out
+
+
+class JobManager:
+    def __init__(self, max_workers=4, keep_seconds=300, sleep=time.sleep, poll_interval=0.01, id_prefix="",
+                 on_finish=None):
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="gate-job")
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self.max_workers = max_workers
+        self.keep_seconds = keep_seconds
+        self.sleep = sleep  # socketio.sleep khi chạy eventlet để chờ không chặn hub
+        self.poll_interval = poll_interval
+        self.id_prefix = id_prefix  # Nhiều worker: "w<k>-" để biết job nằm ở worker nào
+        self.on_finish = on_finish  # Gọi trên thread của job khi xong (VD trả kết nối DB về pool)
+
+    def submit(self, kind, fn, *args, **kwargs):
+        job = Job(f"{self.id_prefix}{int(time.time())}-{next(self._ids)}", kind)
+        with self._lock:
+            self._cleanup()
+            self._jobs[job.id] = job
+        self._pool.submit(self._run, job, fn, args, kwargs)
+        return job
+
+    def _run(self, job, fn, args, kwargs):
+        job.state = "running"
+        job.started = time.time()
+        try:
+            job.result = fn(*args, **kwargs)
+            job.state = "done"
+        except Exception as e:
+            print(f"[JOB] {job.kind} {job.id} lỗi: {e}")
+            job.error = str(e)
+            job.state = "error"
+        finally:
+            job.finished = time.time()
+            if self.on_finish is not None:
+                self.on_finish()
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def wait(self, job, timeout):
+        """Chờ job xong (tối đa timeout giây) bằng cách ngủ ngắn, nhường cho request khác"""
+        deadline = time.time() + timeout
+        while not job.done and time.time() < deadline:
+            self.sleep(self.poll_interval)
+        return job.done
+
+    def _cleanup(self):
+        cutoff = time.time() - self.keep_seconds
+        for jid in [j.id for j in self._jobs.values() if j.done and j.finished < cutoff]:
+            del self._jobs[jid]
+
+    def stats(self):
+        with self._lock:
+            jobs = list(self._jobs.values())
+        states = {}
+        for j in jobs:
+            states[j.state] = states.get(j.state, 0) + 1
+        finished = [j for j in jobs if j.finished and j.started]
+        out = {"workers": self.max_workers, "states": states}
+        if finished:
+            out["avg_queue_ms"] = round(sum(j.started - j.created for j in finished) / len(finished) * 1000, 1)
+            out["avg_run_ms"] = round(sum(j.finished - j.started for j in finished) / len(finished) * 1000, 1)
+        return out
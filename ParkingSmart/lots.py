@@ -0,0 +1,89 @@
+"""
+FILE: lots.py
+DESCRIPTION: Danh sách bãi xe / cổng (thay cho cặp CAM_ENTRY_IP / CAM_EXIT_IP cố định).
+- Đọc từ file JSON (LOTS_FILE, mẫu: lots.example.json). Không có file -> 1 bãi "main" với 2 cổng
+  entry / exit dùng CAM_ENTRY_IP / CAM_EXIT_IP như cũ
+- Mỗi cổng: id duy nhất (dùng cho ?gate=, room gate:<id>, thư mục ảnh, nhãn metrics), bãi, loại
+  (entry | exit), IP camera
+- Gán cổng cho worker (chế độ nhiều tiến trình, xem cluster.py): "worker" trong file, không ghi thì
+  chia vòng theo thứ tự cổng -> cùng 1 làn luôn do cùng 1 worker xử lý (ROI, cache nhận diện,
+  kết nối keep-alive tới camera của làn nằm sẵn ở worker đó)
+"""
+import json
+import os
+
+KINDS = ("entry", "exit")
+DEFAULT_LOT = "main"
+
+
+class Gate:
+    __slots__ = ("id", "lot", "kind", "cam", "worker", "index")
+
+    def __init__(self, gate_id, lot, kind, cam, worker=None, index=0):
+        if kind not in KINDS:
+            raise ValueError(f"Cổng {gate_id}: kind phải là entry | exit")
+        self.id = gate_id
+        self.lot = lot
+        self.kind = kind
+        self.cam = cam
+        self.worker = worker  # None = chia vòng theo index
+        self.index = index
+
+    def to_dict(self):
+        return {"id": self.id, "lot": self.lot, "kind": self.kind, "cam": self.cam}
+
+
+class LotRegistry:
+    def __init__(self, lots):
+        self.lots = {}    # id -> {"id", "name", "gates": [id cổng]}
+        self.gates = {}   # id -> Gate (giữ thứ tự khai báo)
+        for lot in lots:
+            lot_id = lot["id"]
+            if lot_id in self.lots:
+                raise ValueError(f"Trùng id bãi: {lot_id}")
+            self.lots[lot_id] = {"id": lot_id, "name": lot.get("name", lot_id), "gates": []}
+            for g in lot.get("gates", []):
+                if g["id"] in self.gates:
+                    raise ValueError(f"Trùng id cổng: {g['id']}")
+                self.gates[g["id"]] = Gate(g["id"], lot_id, g["kind"], g["cam"], g.get("worker"),
+                                           index=len(self.gates))
+                self.lots[lot_id]["gates"].append(g["id"])
+        if not self.gates:
+            raise ValueError("Chưa khai báo cổng nào")
+        self.default_lot = next(iter(self.lots))
+
+    @classmethod
+    def default(cls, entry_cam, exit_cam):
+        return cls([{"id": DEFAULT_LOT, "gates": [{"id": "entry", "kind": "entry", "cam": entry_cam},
+                                                  {"id": "exit", "kind": "exit", "cam": exit_cam}]}])
+
+    @classmethod
+    def load(cls, path, entry_cam, exit_cam):
+        """File không tồn tại -> cấu hình 1 bãi mặc định"""
+        if not path or not os.path.exists(path):
+            return cls.default(entry_cam, exit_cam)
+        with open(path, encoding="utf-8") as f:
+            return cls(json.load(f)["lots"])
+
+    def resolve(self, kind, gate_id=None, lot=None):
+        """Cổng theo ?gate=<id>, hoặc cổng đầu tiên đúng loại của bãi (mặc định: bãi đầu tiên)"""
+        if gate_id:
+            gate = self.gates.get(gate_id)
+            return gate if gate is not None and gate.kind == kind else None
+        lot = self.lots.get(lot or self.default_lot)
+        if lot is None:
+            return None
+        return next((self.gates[g] for g in lot["gates"] if self.gates[g].kind == kind), None)
+
+    def cam_labels(self):
+        """IP camera -> id cổng (nhãn thư mục ảnh / metrics)"""
+        return {g.cam: g.id for g in self.gates.values()}
+
+    def owner(self, gate_id, workers):
+        gate = self.gates[gate_id]
+        return (gate.worker if gate.worker is not None else gate.index) % max(workers, 1)
+
+    def to_dict(self, workers=1):
+        return {"default_lot": self.default_lot,
+                "lots": [{**lot, "gates": [{**self.gates[g].to_dict(), "worker": self.owner(g, workers)}
+                                           for g in lot["gates"]]} for lot in self.lots.values()]}
@@ -0,0 +1,257 @@
+"""
+FILE: metrics.py
+DESCRIPTION: Đo thời gian từng bước xử lý ở cổng và xuất ra /metrics (định dạng text của Prometheus).
+- Trace: 1 lượt xử lý ở cổng (quẹt RFID / camera) từ lúc nhận HTTP tới lúc trả lời,
+  gồm các span [(bước, ms)]: queue, http_capture, decode, ai_wait, yolo, ocr, db_lookup, db_write, socket_emit
+- Trace gắn với thread đang chạy job của cổng (current()); bước chạy ở thread khác
+  (tải ảnh trước, InferenceEngine) thì đo ở đó rồi trace.add(bước, ms) khi có kết quả
+- Mỗi span được cộng vào histogram parking_stage_seconds{gate, stage}, cả lượt vào
+  parking_gate_request_seconds{gate, kind, result}. Kết thúc lượt -> in 1 dòng log JSON
+  và giữ N trace gần nhất cho /api/traces
+Không phụ thuộc prometheus_client: chỉ cần histogram / counter / gauge đơn giản.
+"""
+import json
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+# Giây. Từ vài ms (tra DB, emit) tới vài giây (chụp lại 3 shot)
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _labels(names, values, extra=None):
+    pairs = list(zip(names, values)) + (list(extra) if extra else [])
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+def _num(v):
+    if v == float("inf"): return "+Inf"
+    return repr(float(v)) if isinstance(v, float) else str(v)
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, help_text, labels=()):
+        self.name, self.help, self.label_names = name, help_text, tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, n=1, **labels):
+        key = tuple(str(labels.get(k, "")) for k in self.label_names)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + n
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, _labels(self.label_names, key), v) for key, v in sorted(self._values.items())]
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        self.name, self.help, self.label_names = name, help_text, tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        self._values = {}  # nhãn -> [đếm theo bucket..., tổng, số lần]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(k, "")) for k in self.label_names)
+        with self._lock:
+            row = self._values.get(key)
+            if row is None:
+                row = self._values[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, le in enumerate(self.buckets):
+                if value <= le:
+                    row[i] += 1
+            row[-2] += value
+            row[-1] += 1
+
+    def samples(self):
+        out = []
+        with self._lock:
+            items = sorted((k, list(v)) for k, v in self._values.items())
+        for key, row in items:
+            for le, n in zip(self.buckets + (float("inf"),), row[:len(self.buckets)] + [row[-1]]):
+                out.append((self.name + "_bucket", _labels(self.label_names, key, [("le", _num(le))]), n))
+            out.append((self.name + "_sum", _labels(self.label_names, key), round(row[-2], 6)))
+            out.append((self.name + "_count", _labels(self.label_names, key), row[-1]))
+        return out
+
+    def label_sets(self):
+        with self._lock:
+            return [dict(zip(self.label_names, key)) for key in self._values]
+
+    def summary(self, **labels):
+        """{count, avg_ms} cho 1 bộ nhãn (xem nhanh không cần Prometheus)"""
+        key = tuple(str(labels.get(k, "")) for k in self.label_names)
+        with self._lock:
+            row = self._values.get(key)
+            if not row or not row[-1]:
+                return None
+            return {"count": row[-1], "avg_ms": round(row[-2] / row[-1] * 1000, 2)}
+
+
+class Gauge:
+    """Giá trị đọc lúc scrape: fn() -> số hoặc {tuple nhãn: số}"""
+    kind = "gauge"
+
+    def __init__(self, name, help_text, fn, labels=()):
+        self.name, self.help, self.label_names, self.fn = name, help_text, tuple(labels), fn
+
+    def samples(self):
+        try:
+            value = self.fn()
+        except Exception:
+            return []
+        if value is None:
+            return []
+        if isinstance(value, dict):
+            return [(self.name, _labels(self.label_names, key), v) for key, v in sorted(value.items())]
+        return [(self.name, "", value)]
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, help_text, labels=()):
+        return self.register(Counter(name, help_text, labels))
+
+    def histogram(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, help_text, labels, buckets))
+
+    def gauge(self, name, help_text, fn, labels=()):
+        return self.register(Gauge(name, help_text, fn, labels))
+
+    def render(self):
+        lines = []
+        for m in self._metrics:
+            lines.append(f"# HELP {m.name} {m.help}")
+            lines.append(f"# TYPE {m.name} {m.kind}")
+            for name, labels, value in m.samples():
+                lines.append(f"{name}{labels} {_num(value)}")
+        return "\n".join(lines) + "\n"
+
+
+class Trace:
+    def __init__(self, tracer, kind, gate, started=None):
+        self.tracer = tracer
+        self.kind = kind
+        self.gate = gate
+        self.t0 = started if started is not None else time.perf_counter()
+        self.at = time.strftime("%Y-%m-%d %H:%M:%S")
+        self.spans = []   # [(bước, ms)] theo thứ tự, 1 bước có thể lặp (mỗi shot 1 lần)
+        self.result = None
+        self.total_ms = None
+
+    def add(self, stage, ms):
+        self.spans.append((stage, round(ms, 2)))
+        self.tracer.stage_seconds.observe(ms / 1000.0, gate=self.gate, stage=stage)
+
+    @contextmanager
+    def span(self, stage):
+        t = time.perf_counter()
+        try:
+            yield self
+        finally:
+            self.add(stage, (time.perf_counter() - t) * 1000)
+
+    def to_dict(self):
+        return {"kind": self.kind, "gate": self.gate, "at": self.at, "result": self.result,
+                "total_ms": self.total_ms, "spans": [list(s) for s in self.spans]}
+
+
+class GateTracer:
+    """Quản lý trace của các lượt xử lý ở cổng + histogram / counter liên quan"""
+
+    def __init__(self, registry, keep=200, log=True):
+        self.registry = registry
+        self.log = log
+        self.stage_seconds = registry.histogram(
+            "parking_stage_seconds", "Thời gian từng bước xử lý ở cổng", ("gate", "stage"))
+        self.request_seconds = registry.histogram(
+            "parking_gate_request_seconds", "Thời gian cả lượt xử lý ở cổng (từ lúc nhận request)",
+            ("gate", "kind", "result"))
+        self.plate_status = registry.counter(
+            "parking_plate_ai_total", "Kết quả nhận diện từng ảnh chụp theo trạng thái", ("gate", "status"))
+        self._local = threading.local()
+        self._recent = deque(maxlen=keep)
+
+    def current(self):
+        return getattr(self._local, "trace", None)
+
+    @contextmanager
+    def span(self, stage):
+        """Đo 1 bước của trace hiện tại (không có trace -> không đo)"""
+        trace = self.current()
+        if trace is None:
+            yield None
+            return
+        with trace.span(stage):
+            yield trace
+
+    def add(self, stage, ms):
+        trace = self.current()
+        if trace is not None:
+            trace.add(stage, ms)
+
+    def count_status(self, status, gate=None):
+        trace = self.current()
+        self.plate_status.inc(gate=gate or (trace.gate if trace else "unknown"), status=status)
+
+    def wrap(self, kind, gate, fn):
+        """
+        Bọc handler của cổng: trace bắt đầu từ lúc nhận request (thời gian chờ thread pool = span queue),
+        kết quả lấy theo body["action"] của handler (allow_entry, deny_exit...)
+        """
+        received = time.perf_counter()
+
+        def run(*args, **kwargs):
+            trace = Trace(self, kind, gate, started=received)
+            trace.add("queue", (time.perf_counter() - received) * 1000)
+            self._local.trace = trace
+            try:
+                body, code = fn(*args, **kwargs)
+                trace.result = (body or {}).get("action") or (body or {}).get("status") or str(code)
+                return body, code
+            except Exception:
+                trace.result = "exception"
+                raise
+            finally:
+                self._local.trace = None
+                self._finish(trace)
+        return run
+
+    def _finish(self, trace):
+        elapsed = time.perf_counter() - trace.t0
+        trace.total_ms = round(elapsed * 1000, 1)
+        self.request_seconds.observe(elapsed, gate=trace.gate, kind=trace.kind, result=trace.result)
+        self._recent.append(trace.to_dict())
+        if self.log:
+            print(f"[TRACE] {json.dumps(trace.to_dict(), ensure_ascii=False)}")
+
+    def recent(self, n=50):
+        return list(self._recent)[-n:]
+
+    def summary(self):
+        """Thời gian TB từng bước theo cổng (cho /api/traces)"""
+        out = {}
+        for labels in self.stage_seconds.label_sets():
+            s = self.stage_seconds.summary(**labels)
+            if s: out.setdefault(labels["gate"], {})[labels["stage"]] = s
+        return out
@@ -0,0 +1,67 @@
+"""
+FILE: ocr_prep.py
+DESCRIPTION: Tiền xử lý ảnh biển số cho EasyOCR theo kích thước thực tế của chữ.
+- Cách cũ: phóng to cố định 3 lần (INTER_CUBIC) -> ảnh vào OCR to gấp 9 lần dù crop đã đủ lớn,
+  sau đó readtext còn chạy thêm bộ dò chữ (CRAFT) trên cả ảnh to đó
+- Ở đây: đưa mỗi dòng chữ về chiều cao RECOGNIZER_HEIGHT (EasyOCR cũng resize về đúng cỡ này),
+  tách biển 2 dòng (xe máy, biển vuông) thành từng dòng, rồi gọi reader.recognize 1 lần
+  với danh sách dòng -> bỏ qua bước dò chữ, chỉ còn bước nhận dạng
+"""
+import cv2
+import numpy as np
+
+RECOGNIZER_HEIGHT = 64      # imgH của bộ nhận dạng EasyOCR
+TWO_LINE_MAX_ASPECT = 2.5   # Rộng/cao nhỏ hơn ngưỡng này -> có thể là biển 2 dòng (VN: ~1.4)
+MAX_SCALE = 3.0
+
+
+def split_rows(gray):
+    """
+    Tìm khe giữa 2 dòng chữ bằng tổng gradient ngang theo từng hàng pixel.
+    Trả về [(y1, y2)] (1 hoặc 2 dòng)
+    """
+    h, w = gray.shape[:2]
+    if h < 8 or w / float(h) >= TWO_LINE_MAX_ASPECT:
+        return [(0, h)]
+    energy = np.abs(cv2.Sobel(gray, cv2.CV_32F, 1, 0, ksize=3)).sum(axis=1)
+    energy = np.convolve(energy, np.ones(3) / 3, mode="same")
+    lo, hi = int(h * 0.3), int(h * 0.7)
+    cut = lo + int(np.argmin(energy[lo:hi]))
+    # Khe phải "rỗng" rõ rệt so với 2 dòng chữ
+    if energy[cut] > 0.35 * min(energy[:cut].max(), energy[cut:].max()):
+        return [(0, h)]
+    return [(0, cut), (cut, h)]
+
+
+def prepare_plate(crop, target_height=RECOGNIZER_HEIGHT, max_scale=MAX_SCALE):
+    """
+    crop (BGR hoặc gray) -> (gray đã resize, [[x1, x2, y1, y2] cho từng dòng])
+    Dòng chữ cao ~ target_height sau resize; ảnh đã đủ lớn thì thu nhỏ thay vì phóng to
+    """
+    gray = crop if crop.ndim == 2 else cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY)
+    rows = split_rows(gray)
+    row_h = max(1.0, float(np.mean([y2 - y1 for y1, y2 in rows])))
+    scale = min(max_scale, target_height / row_h)
+
+    if abs(scale - 1.0) > 0.05:
+        interp = cv2.INTER_AREA if scale < 1 else cv2.INTER_LINEAR
+        gray = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=interp)
+    if scale > 1.5:
+        gray = cv2.GaussianBlur(gray, (3, 3), 0)  # Làm mịn răng cưa do phóng to
+
+    h, w = gray.shape[:2]
+    boxes = [[0, w, min(h - 1, int(y1 * scale)), min(h, int(round(y2 * scale)))] for y1, y2 in rows]
+    return gray, boxes
+
+
+def recognize_plate(reader, crop, allowlist=None):
+    """
+    Giống reader.readtext(detail=1) nhưng không dò chữ: [(box, text, conf)] theo thứ tự dòng trên -> dưới.
+    Trả về (kết quả, ảnh gray đã xử lý)
+    """
+    gray, boxes = prepare_plate(crop)
+    res = reader.recognize(gray, horizontal_list=boxes, free_list=[], detail=1,
+                           allowlist=allowlist, batch_size=len(boxes))
+    res = [r for r in res if r[1]]
+    res.sort(key=lambda r: min(p[1] for p in r[0]))
+    return res, gray
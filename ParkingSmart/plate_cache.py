@@ -0,0 +1,97 @@
+"""
+FILE: plate_cache.py
+DESCRIPTION: Cache trong RAM danh sách xe vé tháng (biển số -> hạn dùng).
+- Nạp 1 lần lúc khởi động, cập nhật ngay khi thêm/xóa qua API
+- app_meta.registered_version được trigger tăng mỗi khi bảng registered_vehicles đổi,
+  các worker khác so version (rất rẻ) để biết khi nào cần nạp lại
+"""
+import threading
+import time
+from datetime import date
+
+from plate_match import PlateIndex, DEFAULT_MAX_COST
+
+SQL_REGISTERED_VERSION = "SELECT value FROM app_meta WHERE key = 'registered_version'"
+
+
+class RegisteredCache:
+    def __init__(self, get_conn, check_interval=1.0):
+        self.get_conn = get_conn
+        self.check_interval = check_interval
+        self._plates = {}       # plate -> {"expiry_date", "vehicle_type", "owner"}
+        self._index = PlateIndex()  # Tra gần đúng khi OCR đọc nhầm ký tự
+        self._version = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self.reloads = 0
+
+    def _read_version(self, conn):
+        row = conn.execute(SQL_REGISTERED_VERSION).fetchone()
+        return row[0] if row else 0
+
+    def reload(self):
+        conn = self.get_conn()
+        version = self._read_version(conn)
+        rows = conn.execute("SELECT plate, expiry_date, vehicle_type, owner FROM registered_vehicles").fetchall()
+        plates = {r["plate"]: {"expiry_date": r["expiry_date"], "vehicle_type": r["vehicle_type"],
+                               "owner": r["owner"]} for r in rows}
+        index = PlateIndex(plates.keys())
+        with self._lock:
+            self._plates = plates
+            self._index = index
+            self._version = version
+            self._checked_at = time.monotonic()
+            self.reloads += 1
+        print(f"[CACHE] Loaded {len(plates)} registered plates (version {version})")
+
+    def _maybe_reload(self):
+        """Tối đa mỗi check_interval giây mới hỏi DB version 1 lần"""
+        now = time.monotonic()
+        if self._version is not None and now - self._checked_at < self.check_interval:
+            return
+        self._checked_at = now
+        if self._version is None or self._read_version(self.get_conn()) != self._version:
+            self.reload()
+
+    # ---------- Tra cứu ----------
+    def get(self, plate):
+        self._maybe_reload()
+        return self._plates.get(plate)
+
+    def status(self, plate, today=None):
+        """'ACTIVE' | 'EXPIRED' | None (không đăng ký)"""
+        if not plate: return None
+        info = self.get(plate)
+        if info is None: return None
+        expiry = info.get("expiry_date")
+        if expiry:
+            today = today or date.today().isoformat()
+            # expiry_date dạng YYYY-MM-DD (hết hạn sau ngày này), so sánh chuỗi là đủ
+            if str(expiry)[:10] < today:
+                return "EXPIRED"
+        return "ACTIVE"
+
+    def resolve(self, plate, max_cost=DEFAULT_MAX_COST):
+        """Biển số vé tháng gần nhất với kết quả OCR: (plate, cost) hoặc (None, None)"""
+        if not plate: return None, None
+        self._maybe_reload()
+        return self._index.match(plate, max_cost)
+
+    def plates(self):
+        self._maybe_reload()
+        return list(self._plates.keys())
+
+    # ---------- Cập nhật từ API của chính worker này ----------
+    # (Version vẫn để nguyên: lần kiểm tra kế tiếp sẽ nạp lại nếu worker khác cũng vừa sửa)
+    def put(self, plate, expiry_date=None, vehicle_type=None, owner=None):
+        with self._lock:
+            self._plates[plate] = {"expiry_date": expiry_date, "vehicle_type": vehicle_type, "owner": owner}
+            self._index.add(plate)
+
+    def remove(self, plate):
+        with self._lock:
+            self._plates.pop(plate, None)
+            self._index.remove(plate)
+
+    def stats(self):
+        return {"plates": len(self._plates), "version": self._version, "reloads": self.reloads}
@@ -0,0 +1,161 @@
+"""
+FILE: plate_match.py
+DESCRIPTION: So khớp biển số "gần đúng", chịu được lỗi nhầm ký tự của OCR (0/O, 8/B, 1/I...).
+
+- Khung (skeleton): thay mỗi ký tự dễ nhầm bằng 1 ký tự đại diện -> lỗi nhầm lẫn
+  thuần túy được tra bằng dict O(1)
+- Chỉ mục xóa 1 ký tự (kiểu SymSpell) trên skeleton -> bắt thêm 1 lỗi thêm/bớt/sai ký tự
+- Ứng viên được chấm bằng khoảng cách Levenshtein có trọng số
+  (nhầm lẫn quen thuộc rẻ hơn nhiều so với sai ký tự bất kỳ)
+"""
+import threading
+import time
+
+# Các nhóm ký tự OCR hay nhầm với nhau trên biển số VN
+CONFUSION_GROUPS = ["0ODQ", "1IL", "8B", "5S", "2Z", "6G", "4A", "7T"]
+CONFUSION_COST = 0.25
+EDIT_COST = 1.0
+# Mặc định chỉ chấp nhận nhầm trong nhóm CONFUSION_GROUPS (tối đa 2 ký tự), không chấp nhận sai hẳn 1 ký tự
+DEFAULT_MAX_COST = 2 * CONFUSION_COST
+
+_CANON = {}
+for _group in CONFUSION_GROUPS:
+    for _ch in _group:
+        _CANON[_ch] = _group[0]
+
+
+def skeleton(plate):
+    return "".join(_CANON.get(ch, ch) for ch in plate)
+
+
+def sub_cost(a, b):
+    if a == b: return 0.0
+    if _CANON.get(a, a) == _CANON.get(b, b): return CONFUSION_COST
+    return EDIT_COST
+
+
+def plate_distance(a, b, max_cost=None):
+    """Levenshtein có trọng số. Dừng sớm (trả về inf) nếu chắc chắn vượt max_cost"""
+    if a == b: return 0.0
+    prev = [j * EDIT_COST for j in range(len(b) + 1)]
+    for i in range(1, len(a) + 1):
+        cur = [i * EDIT_COST] + [0.0] * len(b)
+        ca = a[i - 1]
+        for j in range(1, len(b) + 1):
+            cur[j] = min(prev[j] + EDIT_COST,
+                         cur[j - 1] + EDIT_COST,
+                         prev[j - 1] + sub_cost(ca, b[j - 1]))
+        if max_cost is not None and min(cur) > max_cost:
+            return float("inf")
+        prev = cur
+    return prev[-1]
+
+
+def _deletes(s):
+    return {s[:i] + s[i + 1:] for i in range(len(s))}
+
+
+class PlateIndex:
+    def __init__(self, plates=()):
+        self._plates = set()
+        self._by_skel = {}     # skeleton -> set(plate)
+        self._by_delete = {}   # skeleton bỏ 1 ký tự -> set(plate)
+        for p in plates:
+            self.add(p)
+
+    def __len__(self):
+        return len(self._plates)
+
+    def __contains__(self, plate):
+        return plate in self._plates
+
+    def __iter__(self):
+        return iter(self._plates)
+
+    def add(self, plate):
+        if not plate or plate in self._plates: return
+        self._plates.add(plate)
+        sk = skeleton(plate)
+        self._by_skel.setdefault(sk, set()).add(plate)
+        for d in _deletes(sk):
+            self._by_delete.setdefault(d, set()).add(plate)
+
+    def remove(self, plate):
+        if plate not in self._plates: return
+        self._plates.discard(plate)
+        sk = skeleton(plate)
+        for table, key in [(self._by_skel, sk)] + [(self._by_delete, d) for d in _deletes(sk)]:
+            bucket = table.get(key)
+            if bucket is not None:
+                bucket.discard(plate)
+                if not bucket: del table[key]
+
+    def candidates(self, plate):
+        sk = skeleton(plate)
+        out = set(self._by_skel.get(sk, ()))         # Chỉ nhầm lẫn
+        out |= self._by_delete.get(sk, set())        # OCR thiếu 1 ký tự
+        for d in _deletes(sk):
+            out |= self._by_skel.get(d, set())       # OCR thừa 1 ký tự
+            out |= self._by_delete.get(d, set())     # OCR sai 1 ký tự
+        return out
+
+    def match(self, plate, max_cost=DEFAULT_MAX_COST):
+        """
+        Trả về (biển_khớp, cost) hoặc (None, None).
+        Nếu có 2 biển cùng khoảng cách nhỏ nhất -> không đoán (None).
+        """
+        if not plate: return None, None
+        if plate in self._plates: return plate, 0.0
+
+        best, best_cost, tie = None, None, False
+        for cand in self.candidates(plate):
+            cost = plate_distance(plate, cand, max_cost)
+            if cost > max_cost: continue
+            if best_cost is None or cost < best_cost:
+                best, best_cost, tie = cand, cost, False
+            elif cost == best_cost:
+                tie = True
+        if best is None or tie:
+            return None, None
+        return best, best_cost
+
+
+class VersionedPlateIndex:
+    """
+    PlateIndex nạp từ DB, tự cập nhật khi app_meta.<version_key> đổi
+    (VD: danh sách xe đang trong bãi - active_sessions). Mỗi lượt vào / ra đổi version nên chỉ
+    thêm / bớt các biển chênh lệch, không dựng lại cả chỉ mục
+    """
+
+    def __init__(self, get_conn, version_key, plates_sql, check_interval=0.5):
+        self.get_conn = get_conn
+        self.version_key = version_key
+        self.plates_sql = plates_sql
+        self.check_interval = check_interval
+        self.index = PlateIndex()
+        self._version = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def _refresh(self):
+        now = time.monotonic()
+        if self._version is not None and now - self._checked_at < self.check_interval:
+            return
+        conn = self.get_conn()
+        row = conn.execute("SELECT value FROM app_meta WHERE key = ?", (self.version_key,)).fetchone()
+        version = row[0] if row else 0
+        self._checked_at = now
+        if version != self._version:
+            plates = {r[0] for r in conn.execute(self.plates_sql).fetchall()}
+            with self._lock:
+                current = set(self.index)
+                for p in current - plates:
+                    self.index.remove(p)
+                for p in plates - current:
+                    self.index.add(p)
+                self._version = version
+
+    def match(self, plate, max_cost=DEFAULT_MAX_COST):
+        self._refresh()
+        with self._lock:  # Chỉ mục được sửa tại chỗ -> không tra trong lúc đang cập nhật
+            return self.index.match(plate, max_cost)
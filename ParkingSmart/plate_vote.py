@@ -0,0 +1,47 @@
+"""
+FILE: plate_vote.py
+DESCRIPTION: Gộp kết quả OCR của nhiều lần chụp bằng bỏ phiếu từng ký tự,
+có trọng số theo độ tin cậy của OCR.
+"""
+
+
+def vote_plate(reads):
+    """
+    reads: list các lần đọc, mỗi lần là list [(ký_tự, conf), ...] đã chuẩn hóa
+    Trả về (plate, conf) hoặc (None, 0.0) nếu không có lần đọc nào.
+
+    - Chọn độ dài biển có tổng độ tin cậy lớn nhất (OCR hay thiếu/thừa 1 ký tự)
+    - Mỗi vị trí: ký tự có tổng conf lớn nhất thắng
+    - conf vị trí = (1 - Π(1 - c) các phiếu đồng ý) * (tỉ lệ phiếu đồng ý)
+    - conf biển số = conf thấp nhất trong các vị trí
+    """
+    reads = [r for r in reads if r]
+    if not reads: return None, 0.0
+
+    # 1. Chọn nhóm độ dài
+    by_len = {}
+    for r in reads:
+        by_len.setdefault(len(r), []).append(r)
+    group = max(by_len.values(), key=lambda g: sum(c for r in g for _, c in r))
+
+    # 2. Bỏ phiếu từng vị trí
+    plate = []
+    plate_conf = 1.0
+    for pos in range(len(group[0])):
+        scores = {}
+        for r in group:
+            ch, c = r[pos]
+            scores[ch] = scores.get(ch, 0.0) + c
+        total = sum(scores.values())
+        best = max(scores, key=scores.get)
+
+        miss = 1.0
+        for r in group:
+            if r[pos][0] == best:
+                miss *= (1.0 - r[pos][1])
+        pos_conf = (1.0 - miss) * (scores[best] / total if total > 0 else 0.0)
+
+        plate.append(best)
+        plate_conf = min(plate_conf, pos_conf)
+
+    return "".join(plate), round(plate_conf, 4)
@@ -0,0 +1,151 @@
+"""
+FILE: realtime.py
+DESCRIPTION: Gửi sự kiện Socket.IO từ bất kỳ thread nào.
+Job chạy trên thread pool không được gọi socketio.emit trực tiếp (không an toàn với eventlet),
+nên sự kiện được đẩy vào hàng đợi và 1 background task của SocketIO phát đi.
+Có broker (broker.py) thì sự kiện đi qua kênh CHANNEL_REALTIME: mọi worker nhận và phát lại
+cho client Socket.IO đang nối vào mình (dashboard nối vào worker nào cũng thấy đủ log).
+
+SensorFanout: ESP32 gửi trạng thái ~20 lần/giây nhưng hiếm khi đổi. Chỉ phát sensor_update
+khi slot / MQ135 thay đổi (gộp nhiều lần đổi trong 1 tick thành 1 lần phát) hoặc theo nhịp
+heartbeat, và chỉ tới room "sensors" (trang chỉ xem lịch sử không nhận).
+"""
+import queue
+import threading
+import time
+
+# Room Socket.IO: client chọn qua io({query: {rooms: "sensors,logs"}}) hoặc sự kiện "subscribe"
+ROOM_SENSORS = "sensors"
+ROOM_LOGS = "logs"
+ROOMS = (ROOM_SENSORS, ROOM_LOGS)
+
+
+class RealtimeOutbox:
+    def __init__(self, socketio, idle_sleep=0.01, broker=None, channel=None):
+        self.socketio = socketio
+        self.idle_sleep = idle_sleep
+        self.broker = broker
+        self.channel = channel
+        self._queue = queue.Queue()
+        self._started = False
+        self.sent = 0
+
+    def start(self):
+        if not self._started:
+            self._started = True
+            if self.broker is not None:
+                self.broker.subscribe(self.channel, self._on_message)
+            self.socketio.start_background_task(self._pump)
+        return self
+
+    def emit(self, event, payload, **kwargs):
+        if self.broker is not None:
+            self.broker.publish(self.channel, {"event": event, "payload": payload, "kwargs": kwargs})
+        else:
+            self._queue.put((event, payload, kwargs))
+
+    def _on_message(self, message):
+        self._queue.put((message["event"], message["payload"], message.get("kwargs") or {}))
+
+    def pending(self):
+        return self._queue.qsize()
+
+    def _pump(self):
+        while True:
+            try:
+                event, payload, kwargs = self._queue.get_nowait()
+            except queue.Empty:
+                self.socketio.sleep(self.idle_sleep)
+                continue
+            try:
+                self.socketio.emit(event, payload, **kwargs)
+                self.sent += 1
+            except Exception as e:
+                print(f"[SOCKET] Emit {event} lỗi: {e}")
+
+
+class SensorFanout:
+    def __init__(self, outbox, tick=0.2, heartbeat=2.0, stale_after=5.0, mq_delta=10,
+                 event="sensor_update", room=ROOM_SENSORS):
+        self.outbox = outbox
+        self.tick = tick                # Giây, gộp các lần thay đổi trong 1 tick
+        self.heartbeat = heartbeat      # Giây, phát lại trạng thái dù không đổi (watchdog phía web)
+        self.stale_after = stale_after  # Cảm biến im lặng lâu hơn -> thôi heartbeat để web báo mất tín hiệu
+        self.mq_delta = mq_delta        # MQ135 dao động nhỏ hơn ngưỡng này coi như không đổi
+        self.event = event
+        self.room = room
+
+        self._lock = threading.Lock()
+        self._state = None       # Trạng thái mới nhất nhận được
+        self._sent = None        # Trạng thái đã phát lần cuối
+        self._received_at = 0.0
+        self._sent_at = 0.0
+        self._started = False
+        self.received = 0
+        self.emitted = 0
+        self.heartbeats = 0
+
+    def start(self, socketio):
+        if not self._started:
+            self._started = True
+            socketio.start_background_task(self._loop, socketio)
+        return self
+
+    def update(self, payload):
+        """Gọi từ /api/update_data, chỉ ghi nhận trạng thái (không phát)"""
+        with self._lock:
+            self._state = payload
+            self._received_at = time.monotonic()
+            self.received += 1
+
+    def observe(self, payload):
+        """
+        Trạng thái do worker khác đã phát (nhiều worker: chỉ worker chính nhận /api/update_data).
+        Chỉ giữ làm snapshot cho client mới vào room, coi như đã phát -> không phát lại
+        """
+        with self._lock:
+            self._state = self._sent = payload
+
+    def snapshot(self):
+        """Trạng thái hiện tại (gửi ngay cho client vừa vào room)"""
+        with self._lock:
+            return self._state
+
+    def _changed(self, state):
+        sent = self._sent
+        if sent is None: return True
+        if state.get("slots") != sent.get("slots"): return True
+        try:
+            return abs(float(state.get("mq135", 0)) - float(sent.get("mq135", 0))) >= self.mq_delta
+        except (TypeError, ValueError):
+            return state.get("mq135") != sent.get("mq135")
+
+    def flush(self, now=None):
+        """1 tick: phát nếu trạng thái đổi hoặc tới hạn heartbeat. Trả về True nếu đã phát"""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            state = self._state
+            if state is None: return False
+            changed = self._changed(state)
+            alive = now - self._received_at < self.stale_after
+            if not changed and not (alive and now - self._sent_at >= self.heartbeat):
+                return False
+            self._sent = state
+            self._sent_at = now
+            self.emitted += 1
+            if not changed: self.heartbeats += 1
+        self.outbox.emit(self.event, state, to=self.room)
+        return True
+
+    def _loop(self, socketio):
+        while True:
+            socketio.sleep(self.tick)
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"[SOCKET] Sensor fanout lỗi: {e}")
+
+    def stats(self):
+        return {"received": self.received, "emitted": self.emitted, "heartbeats": self.heartbeats,
+                "suppressed": self.received - (self.emitted - self.heartbeats),
+                "tick": self.tick, "heartbeat": self.heartbeat}
@@ -0,0 +1,130 @@
+"""
+FILE: roi.py
+DESCRIPTION: Vùng quan tâm (ROI) theo từng camera cổng.
+Camera cố định nên biển số luôn xuất hiện quanh 1 vùng: học vùng đó từ các box đã đọc
+được biển gần đây, lần sau chỉ chạy YOLO trên ảnh cắt (imgsz nhỏ hơn).
+Không thấy gì trong vùng cắt -> chạy lại trên cả khung hình như cũ.
+Trượt liên tiếp nhiều lần (camera bị xoay / dời) -> quên vùng cũ, học lại.
+"""
+import threading
+from collections import deque
+
+import numpy as np
+
+
+class RoiTracker:
+    def __init__(self, window=30, min_samples=5, margin=0.5, min_width=0.25, min_height=0.25,
+                 max_misses=5):
+        self.window = window            # Số box gần nhất dùng để ước lượng vùng
+        self.min_samples = min_samples  # Chưa đủ mẫu -> chưa dùng ROI
+        self.margin = margin            # Nới rộng mỗi phía thêm margin * kích thước vùng
+        self.min_width = min_width      # Vùng tối thiểu (tỉ lệ theo khung hình)
+        self.min_height = min_height
+        self.max_misses = max_misses
+        self._boxes = deque(maxlen=window)  # (x1, y1, x2, y2) chuẩn hóa 0..1
+        self._misses = 0
+        self.resets = 0
+
+    def observe(self, box, shape):
+        """box (x1, y1, x2, y2) tính theo pixel của khung hình đầy đủ có kích thước shape"""
+        h, w = shape[:2]
+        x1, y1, x2, y2 = box[:4]
+        self._boxes.append((x1 / w, y1 / h, x2 / w, y2 / h))
+        self._misses = 0
+
+    def miss(self):
+        self._misses += 1
+        if self._misses >= self.max_misses:
+            self._boxes.clear()
+            self._misses = 0
+            self.resets += 1
+
+    def region(self, shape):
+        """(x1, y1, x2, y2) pixel của vùng cần cắt, hoặc None nếu chưa học xong"""
+        if len(self._boxes) < self.min_samples:
+            return None
+        b = np.array(self._boxes)
+        # Bỏ 5% ngoại lai mỗi phía
+        x1, y1 = np.percentile(b[:, 0], 5), np.percentile(b[:, 1], 5)
+        x2, y2 = np.percentile(b[:, 2], 95), np.percentile(b[:, 3], 95)
+        bw, bh = x2 - x1, y2 - y1
+        x1, x2 = x1 - bw * self.margin, x2 + bw * self.margin
+        y1, y2 = y1 - bh * self.margin, y2 + bh * self.margin
+        # Đảm bảo kích thước tối thiểu (quanh tâm vùng)
+        if x2 - x1 < self.min_width:
+            cx = (x1 + x2) / 2
+            x1, x2 = cx - self.min_width / 2, cx + self.min_width / 2
+        if y2 - y1 < self.min_height:
+            cy = (y1 + y2) / 2
+            y1, y2 = cy - self.min_height / 2, cy + self.min_height / 2
+
+        h, w = shape[:2]
+        px1, py1 = max(0, int(x1 * w)), max(0, int(y1 * h))
+        px2, py2 = min(w, int(np.ceil(x2 * w))), min(h, int(np.ceil(y2 * h)))
+        if px2 - px1 >= w * 0.9 and py2 - py1 >= h * 0.9:
+            return None  # Vùng gần bằng cả khung -> cắt không lợi gì
+        return px1, py1, px2, py2
+
+    def stats(self):
+        return {"samples": len(self._boxes), "misses_in_row": self._misses, "resets": self.resets}
+
+
+class RoiRegistry:
+    """Tracker cho từng camera + thống kê tỉ lệ trúng và thời gian tiết kiệm"""
+
+    def __init__(self, ema=0.1, **tracker_kwargs):
+        self._trackers = {}
+        self._tracker_kwargs = tracker_kwargs
+        self._lock = threading.Lock()
+        self.ema = ema
+        self.hits = 0          # Tìm thấy box ngay trong vùng cắt
+        self.misses = 0        # Vùng cắt không có box -> chạy lại cả khung
+        self.full = 0          # Chưa có ROI -> chạy cả khung
+        self.crop_ms = None    # Thời gian YOLO TB cho 1 ảnh cắt (EMA)
+        self.full_ms = None    # Thời gian YOLO TB cho 1 khung đầy đủ (EMA)
+
+    def _tracker(self, cam):
+        t = self._trackers.get(cam)
+        if t is None:
+            t = self._trackers[cam] = RoiTracker(**self._tracker_kwargs)
+        return t
+
+    def region(self, cam, shape):
+        if cam is None: return None
+        with self._lock:
+            return self._tracker(cam).region(shape)
+
+    def observe(self, cam, box, shape):
+        """Box đã đọc ra biển số hợp lệ (trên khung đầy đủ)"""
+        if cam is None: return
+        with self._lock:
+            self._tracker(cam).observe(box, shape)
+
+    def miss(self, cam):
+        if cam is None: return
+        with self._lock:
+            self._tracker(cam).miss()
+
+    def record(self, hits=0, misses=0, full=0, crop_ms=None, full_ms=None):
+        """Cập nhật sau mỗi batch. crop_ms / full_ms: thời gian TB cho 1 ảnh trong batch"""
+        with self._lock:
+            self.hits += hits
+            self.misses += misses
+            self.full += full
+            if crop_ms is not None:
+                self.crop_ms = crop_ms if self.crop_ms is None else self.crop_ms + self.ema * (crop_ms - self.crop_ms)
+            if full_ms is not None:
+                self.full_ms = full_ms if self.full_ms is None else self.full_ms + self.ema * (full_ms - self.full_ms)
+
+    def stats(self):
+        with self._lock:
+            tried = self.hits + self.misses
+            out = {"hits": self.hits, "misses": self.misses, "full_frame": self.full,
+                   "hit_rate": round(self.hits / tried, 3) if tried else None,
+                   "crop_ms": round(self.crop_ms, 2) if self.crop_ms is not None else None,
+                   "full_ms": round(self.full_ms, 2) if self.full_ms is not None else None,
+                   "cameras": {cam: t.stats() for cam, t in self._trackers.items()}}
+        if out["crop_ms"] is not None and out["full_ms"] is not None:
+            # Trúng: tiết kiệm (full - crop). Trượt: tốn thêm 1 lần crop
+            out["saved_ms_total"] = round(self.hits * (self.full_ms - self.crop_ms) - self.misses * self.crop_ms, 1)
+        return out
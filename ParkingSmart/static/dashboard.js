@@ -4,11 +4,14 @@
  * DESCRIPTION: Quản lý toàn bộ logic Frontend, SocketIO, ChartJS và API
  */
 
-const socket = io();
+const socket = io({ query: { rooms: 'sensors,logs' } });
 const moneyFmt = new Intl.NumberFormat('vi-VN', { style: 'currency', currency: 'VND' });
 
 // Biến toàn cục
 let allHistory = [];        // Cache dữ liệu lịch sử để search nhanh
+let historyCursor = null;   // id dòng cuối của trang hiện tại (phân trang keyset)
+const HISTORY_PAGE = 200;
+const HISTORY_FIELDS = 'id,plate,entry_time,exit_time,fee,image_path,status';
 let chartInstance = null;   // Lưu instance biểu đồ để destroy khi vẽ lại
 let sensorWatchdog = null;  // Timer kiểm tra kết nối cảm biến
 let cameraWatchdog = null;  // Timer kiểm tra kết nối camera
@@ -83,9 +86,10 @@ socket.on('new_log', (data) => {
         // === TRƯỜNG HỢP CAMERA: Hiển thị ảnh chụp ===
         // Tạo lại thẻ img để đảm bảo load ảnh mới nhất
         camBox.innerHTML = `
-            <img id="live-img" src="${data.image}?t=${new Date().getTime()}" 
-                 alt="Live Capture" 
-                 style="max-width: 100%; max-height: 100%; object-fit: contain;">
+            <img id="live-img" src="${data.thumb || data.image}" 
+                 alt="Live Capture" title="Click để xem ảnh gốc"
+                 onclick="window.open('${data.image}', '_blank')"
+                 style="max-width: 100%; max-height: 100%; object-fit: contain; cursor:pointer;">
         `;
     }
     
@@ -204,7 +208,7 @@ function updateSlot(id, isBusy) {
 // ============================================================
 
 document.addEventListener("DOMContentLoaded", () => {
-    loadHistory(); // Load dữ liệu mặc định (50 dòng)
+    loadHistory(); // Load trang đầu tiên (200 dòng mới nhất)
 });
 
 function switchTab(tabId) {
@@ -237,27 +241,72 @@ function switchTab(tabId) {
 // ============================================================
 
 /**
- * Hàm trung tâm để lấy dữ liệu lịch sử
+ * Lấy 1 trang lịch sử (server phân trang theo id, chỉ lấy các cột cần hiển thị)
+ * @param {string} cursor - id dòng cuối trang trước ('' = trang đầu)
+ */
+async function fetchHistoryPage(start = '', end = '', cursor = '') {
+    let url = `/api/history?limit=${HISTORY_PAGE}&fields=${HISTORY_FIELDS}`;
+    if(start && end) url += `&start=${start}&end=${end}`;
+    if(cursor) url += `&cursor=${cursor}`;
+    const res = await fetch(url);
+    return res.json();
+}
+
+// Tải trang đầu tiên của bảng lịch sử (theo bộ lọc ngày nếu có)
+async function loadHistory() {
+    const start = document.getElementById('hist-start').value;
+    const end = document.getElementById('hist-end').value;
+    try {
+        const page = await fetchHistoryPage(start, end);
+        allHistory = page.items; // Cache lại để search local
+        historyCursor = page.next_cursor;
+        renderHistory(allHistory);
+        updateLoadMore();
+    } catch(e) {
+        console.error("Fetch error:", e);
+    }
+}
+
+// Nút "Xem thêm": nối trang kế tiếp
+async function loadMoreHistory() {
+    if(!historyCursor) return;
+    const start = document.getElementById('hist-start').value;
+    const end = document.getElementById('hist-end').value;
+    try {
+        const page = await fetchHistoryPage(start, end, historyCursor);
+        allHistory = allHistory.concat(page.items);
+        historyCursor = page.next_cursor;
+        renderHistory(allHistory);
+        updateLoadMore();
+    } catch(e) {
+        console.error("Fetch error:", e);
+    }
+}
+
+function updateLoadMore() {
+    const btn = document.getElementById('hist-more');
+    if(btn) btn.classList.toggle('d-none', !historyCursor);
+}
+
+// Tải file lịch sử (server stream, không giới hạn số dòng)
+function exportHistory(format) {
+    const start = document.getElementById('hist-start').value;
+    const end = document.getElementById('hist-end').value;
+    let url = `/api/history/export?format=${format}`;
+    if(start && end) url += `&start=${start}&end=${end}`;
+    window.open(url, '_blank');
+}
+
+/**
+ * Lấy số liệu doanh thu đã tổng hợp sẵn trên server (không tải từng lượt gửi xe)
  * @param {string} start - Ngày bắt đầu (YYYY-MM-DD)
  * @param {string} end - Ngày kết thúc (YYYY-MM-DD)
  */
-async function fetchHistoryData(start = '', end = '') {
+async function fetchStats(start, end) {
     try {
-        let url = '/api/history';
-        if(start && end) {
-            url += `?start=${start}&end=${end}`;
-        }
-        
-        const res = await fetch(url);
+        const res = await fetch(`/api/stats?start=${start}&end=${end}`);
         const data = await res.json();
-        allHistory = data; // Cache lại để search local
-        
-        // Vẽ lại bảng lịch sử
-        renderHistory(data);
-        
-        // Tính toán doanh thu (Dùng chung data này)
-        calculateRevenue(data);
-
+        renderStats(data);
     } catch(e) { 
         console.error("Fetch error:", e); 
     }
@@ -269,12 +318,9 @@ function renderHistory(data) {
     if(!tbody) return;
     tbody.innerHTML = '';
     
-    // Giới hạn 200 dòng để tránh lag nếu dữ liệu quá lớn
-    const displayData = data.length > 200 ? data.slice(0, 200) : data;
-
-    displayData.forEach(row => { 
+    data.forEach(row => { 
         // 1. XỬ LÝ HIỂN THỊ ẢNH / ICON
-        let imgUrl = row.image_path || "";
+        let imgUrl = row.image_url || row.image_path || "";
         let visualContent = "";
 
         // Điều kiện: Nếu đường dẫn chứa "rfid_icon" HOẶC biển số bắt đầu bằng "RFID"
@@ -294,12 +340,12 @@ function renderHistory(data) {
                 const filename = imgUrl.split(/[\\/]/).pop();
                 imgUrl = "/captures/" + filename;
             }
-            // Thêm sự kiện onclick để phóng to ảnh nếu cần
+            // Bảng chỉ hiện thumbnail, click mới mở ảnh gốc
             visualContent = `
-                <img src="${imgUrl}" height="40" 
+                <img src="${row.thumb_url || imgUrl}" height="40" loading="lazy"
                      style="border-radius:4px; border:1px solid #ddd; cursor:pointer;" 
                      title="Click để xem ảnh gốc"
-                     onclick="window.open(this.src, '_blank')">
+                     onclick="window.open('${imgUrl}', '_blank')">
             `;
         }
 
@@ -331,14 +377,14 @@ function loadHistoryWithFilter() {
         alert("Vui lòng chọn đủ ngày bắt đầu và kết thúc!");
         return;
     }
-    fetchHistoryData(start, end);
+    loadHistory();
 }
 
 function resetFilter() {
     document.getElementById('hist-start').value = '';
     document.getElementById('hist-end').value = '';
     // Load lại mặc định (không tham số)
-    fetchHistoryData();
+    loadHistory();
 }
 
 // Search biển số (Client-side)
@@ -390,7 +436,7 @@ function quickRevenueFilter(type) {
     }
 
     // Gọi API
-    fetchHistoryData(start, end);
+    fetchStats(start, end);
 }
 
 // Xử lý nút Xem Tùy Chọn
@@ -400,41 +446,26 @@ function loadRevenueCustom() {
     if(!start || !end) { alert("Chọn ngày!"); return; }
     
     document.getElementById('lbl-rev-money').innerText = `Doanh Thu (${start} -> ${end})`;
-    fetchHistoryData(start, end);
+    fetchStats(start, end);
 }
 
-// Tính toán và Vẽ biểu đồ
-function calculateRevenue(data) {
-    let rev = 0;
-    let cntIn = 0;
-    let cntOut = 0;
-
-    // Vì Data đã được lọc theo ngày từ Server, nên ta chỉ việc cộng tổng
-    data.forEach(r => {
-        const st = (r.status || "").toUpperCase();
-        
-        if (st.includes('IN') || st.includes('ALLOWED')) cntIn++;
-        if (st.includes('OUT') || st.includes('PAID')) {
-            cntOut++;
-            rev += (r.fee || 0);
-        }
-    });
-
-    // Hiển thị số liệu
-    if(document.getElementById('rev-total')) 
-        document.getElementById('rev-total').innerText = moneyFmt.format(rev);
-    if(document.getElementById('rev-count-in')) 
-        document.getElementById('rev-count-in').innerText = cntIn;
-    if(document.getElementById('rev-count-out')) 
-        document.getElementById('rev-count-out').innerText = cntOut;
-
-    // Vẽ biểu đồ: Lấy tối đa 20 giao dịch OUT gần nhất để vẽ
-    const chartData = data
-        .filter(x => (x.status || "").toUpperCase().includes('OUT'))
-        .slice(0, 20)
-        .reverse();
-        
-    updateChart(chartData);
+// Hiển thị số liệu tổng hợp và Vẽ biểu đồ
+function renderStats(data) {
+    const t = data.total || {};
+    const setText = (id, val) => { const el = document.getElementById(id); if(el) el.innerText = val; };
+
+    setText('rev-total', moneyFmt.format(t.revenue || 0));
+    setText('rev-count-in', t.entries || 0);
+    setText('rev-count-out', t.exits || 0);
+    setText('rev-guest-monthly', `${t.guest_exits || 0} / ${t.monthly_exits || 0}`);
+    setText('rev-avg-dwell', `${t.avg_dwell_minutes || 0} phút`);
+    setText('rev-denied', t.denied || 0);
+
+    // 1 ngày -> cột theo giờ, nhiều ngày -> cột theo ngày
+    updateChart((data.series || []).map(x => ({
+        label: data.group === 'hour' ? x.bucket.slice(11) + 'h' : x.bucket.slice(5),
+        value: x.revenue
+    })));
 }
 
 // Hàm vẽ biểu đồ Chart.js
@@ -455,9 +486,9 @@ function updateChart(recentData) {
         labels = ["Không có dữ liệu"];
         dataValues = [0];
     } else {
-        // Label là Giờ hoặc Ngày tùy vào khoảng thời gian (ở đây lấy giờ cho chi tiết)
-        labels = recentData.map(x => (x.exit_time || x.entry_time).split(' ')[1]);
-        dataValues = recentData.map(x => x.fee || 0);
+        // Label là Giờ hoặc Ngày tùy vào khoảng thời gian
+        labels = recentData.map(x => x.label);
+        dataValues = recentData.map(x => x.value || 0);
     }
 
     // 3. Tạo biểu đồ mới
@@ -0,0 +1,139 @@
+"""
+FILE: stats.py
+DESCRIPTION: Bảng tổng hợp doanh thu / lưu lượng theo giờ và theo ngày (stats_hourly, stats_daily).
+- Cập nhật cộng dồn ngay trong transaction ghi lượt vào/ra (UPSERT, không quét parking_log)
+- /api/stats đọc thẳng các bảng này cho mọi khoảng ngày
+- DB cũ: chạy `python stats.py backfill [database.db]` để dựng lại từ parking_log
+
+Lượt vào tính theo giờ vào, lượt ra / doanh thu / thời gian gửi tính theo giờ ra.
+"""
+import sqlite3
+import sys
+from datetime import datetime
+
+TIME_FMT = "%Y-%m-%d %H:%M:%S"
+
+# Các cột cộng dồn (giống nhau ở cả 2 bảng)
+COUNTERS = ["revenue", "entries", "exits", "guest_exits", "monthly_exits", "denied", "dwell_seconds"]
+
+_SET = ", ".join(f"{c} = {c} + excluded.{c}" for c in COUNTERS)
+SQL_UPSERT = {
+    table: f"INSERT INTO {table} (bucket, {', '.join(COUNTERS)}) VALUES (?, {', '.join('?' * len(COUNTERS))}) "
+           f"ON CONFLICT(bucket) DO UPDATE SET {_SET}"
+    for table in ("stats_hourly", "stats_daily")
+}
+
+
+def _add(conn, ts, **values):
+    """Cộng values vào ô giờ (YYYY-MM-DD HH) và ô ngày (YYYY-MM-DD) chứa thời điểm ts"""
+    row = [values.get(c, 0) for c in COUNTERS]
+    conn.execute(SQL_UPSERT["stats_hourly"], [ts[:13]] + row)
+    conn.execute(SQL_UPSERT["stats_daily"], [ts[:10]] + row)
+
+
+def record_entry(conn, entry_time, denied=False):
+    """Gọi cùng transaction với open_session / insert DENIED"""
+    if denied:
+        _add(conn, entry_time, denied=1)
+    else:
+        _add(conn, entry_time, entries=1)
+
+
+def record_exit(conn, entry_time, exit_time, fee, monthly=False):
+    """Gọi cùng transaction với close_session"""
+    dwell = 0
+    if entry_time:
+        try:
+            dwell = max(0, int((datetime.strptime(exit_time, TIME_FMT) -
+                                datetime.strptime(entry_time, TIME_FMT)).total_seconds()))
+        except ValueError:
+            pass
+    _add(conn, exit_time, revenue=fee or 0, exits=1, dwell_seconds=dwell,
+         monthly_exits=1 if monthly else 0, guest_exits=0 if monthly else 1)
+
+
+# ======================================
+# TRUY VẤN
+# ======================================
+def _summarize(row):
+    out = {c: row[c] or 0 for c in COUNTERS}
+    out["avg_dwell_minutes"] = round(out["dwell_seconds"] / out["exits"] / 60.0, 1) if out["exits"] else 0
+    return out
+
+
+def query_stats(conn, start, end, group="day"):
+    """
+    Tổng hợp khoảng [start, end] (YYYY-MM-DD, tính cả 2 đầu).
+    group = 'day' | 'hour': độ chi tiết của chuỗi series trả về (để vẽ biểu đồ)
+    """
+    sums = ", ".join(f"SUM({c}) AS {c}" for c in COUNTERS)
+    total = conn.execute(f"SELECT {sums} FROM stats_daily WHERE bucket BETWEEN ? AND ?",
+                         (start, end)).fetchone()
+
+    if group == "hour":
+        table, lo, hi = "stats_hourly", f"{start} 00", f"{end} 23"
+    else:
+        table, lo, hi = "stats_daily", start, end
+    rows = conn.execute(f"SELECT bucket, {', '.join(COUNTERS)} FROM {table} "
+                        f"WHERE bucket BETWEEN ? AND ? ORDER BY bucket", (lo, hi)).fetchall()
+    series = []
+    for r in rows:
+        item = _summarize(r)
+        item["bucket"] = r["bucket"]
+        series.append(item)
+
+    return {"start": start, "end": end, "group": group, "total": _summarize(total), "series": series}
+
+
+# ======================================
+# BACKFILL (DB đã có dữ liệu trước khi có bảng tổng hợp)
+# ======================================
+# Lịch sử không lưu loại vé: lượt ra miễn phí của biển số có trong registered_vehicles coi là vé tháng
+_BACKFILL_SELECT = """
+    SELECT {bucket} AS bucket,
+        SUM(CASE WHEN status IN ('IN', 'OUT') THEN 1 ELSE 0 END) AS entries,
+        SUM(CASE WHEN status = 'DENIED' THEN 1 ELSE 0 END) AS denied
+    FROM parking_log WHERE entry_time IS NOT NULL GROUP BY 1
+"""
+_BACKFILL_EXITS = """
+    SELECT {bucket} AS bucket,
+        SUM(COALESCE(fee, 0)) AS revenue,
+        COUNT(*) AS exits,
+        SUM(is_monthly) AS monthly_exits,
+        SUM(1 - is_monthly) AS guest_exits,
+        SUM(MAX(0, CAST(strftime('%s', exit_time) AS INTEGER) - CAST(strftime('%s', entry_time) AS INTEGER))) AS dwell_seconds
+    FROM (
+        SELECT p.*, CASE WHEN COALESCE(p.fee, 0) = 0 AND r.plate IS NOT NULL THEN 1 ELSE 0 END AS is_monthly
+        FROM parking_log p LEFT JOIN registered_vehicles r ON r.plate = p.plate
+        WHERE p.status = 'OUT' AND p.exit_time IS NOT NULL
+    ) GROUP BY 1
+"""
+
+
+def backfill(conn):
+    """Xóa và dựng lại toàn bộ stats_hourly / stats_daily từ parking_log"""
+    conn.execute("BEGIN")
+    try:
+        for table, width in (("stats_hourly", 13), ("stats_daily", 10)):
+            conn.execute(f"DELETE FROM {table}")
+            for r in conn.execute(_BACKFILL_SELECT.format(bucket=f"substr(entry_time, 1, {width})")).fetchall():
+                conn.execute(SQL_UPSERT[table], [r[0], 0, r[1], 0, 0, 0, r[2], 0])
+            for r in conn.execute(_BACKFILL_EXITS.format(bucket=f"substr(exit_time, 1, {width})")).fetchall():
+                conn.execute(SQL_UPSERT[table], [r[0], r[1], 0, r[2], r[4], r[3], 0, r[5] or 0])
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    return conn.execute("SELECT COUNT(*) FROM stats_daily").fetchone()[0]
+
+
+if __name__ == '__main__':
+    if len(sys.argv) >= 2 and sys.argv[1] == "backfill":
+        from db import migrate
+        db_file = sys.argv[2] if len(sys.argv) >= 3 else "database.db"
+        conn = sqlite3.connect(db_file, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        migrate(conn)
+        print(f"[STATS] Backfilled {backfill(conn)} days from {db_file}")
+    else:
+        print("Usage: python stats.py backfill [database.db]")
@@ -0,0 +1,73 @@
+"""
+FILE: storage.py
+DESCRIPTION: Ghi file ảnh (bằng chứng / debug) ở thread nền.
+Request chỉ cần đẩy bytes vào hàng đợi, không phải chờ ghi thẻ nhớ.
+"""
+import os
+import threading
+import queue
+
+
+class AsyncFileWriter:
+    def __init__(self, max_pending=256):
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._pending = {}  # path -> bytes (chưa ghi xong, vẫn phục vụ được cho web)
+        self._lock = threading.Lock()
+        self._thread = None
+        self.written = 0
+        self.sync_fallbacks = 0
+        self.errors = 0
+
+    def start(self):
+        if self._thread: return self
+        self._thread = threading.Thread(target=self._run, name="file-writer", daemon=True)
+        self._thread.start()
+        return self
+
+    def write(self, path, data):
+        """Đưa file vào hàng đợi ghi. Nếu hàng đợi đầy thì ghi luôn (không bỏ ảnh)"""
+        with self._lock:
+            self._pending[path] = data
+        try:
+            self._queue.put_nowait((path, data))
+        except queue.Full:
+            self.sync_fallbacks += 1
+            self._write_file(path, data)
+
+    def pending(self, path):
+        """Trả về bytes nếu file vẫn đang nằm trong hàng đợi"""
+        with self._lock:
+            return self._pending.get(path)
+
+    def flush(self):
+        """Chờ ghi hết hàng đợi (dùng khi tắt server / benchmark)"""
+        self._queue.join()
+
+    def stats(self):
+        return {"queued": self._queue.qsize(), "written": self.written,
+                "sync_fallbacks": self.sync_fallbacks, "errors": self.errors}
+
+    def _run(self):
+        while True:
+            path, data = self._queue.get()
+            try:
+                self._write_file(path, data)
+            finally:
+                self._queue.task_done()
+
+    def _write_file(self, path, data):
+        try:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            tmp = path + ".tmp"
+            with open(tmp, 'wb') as f:
+                f.write(data)
+            os.replace(tmp, path)
+            self.written += 1
+        except Exception as e:
+            self.errors += 1
+            print(f"[STORAGE] Write error {path}: {e}")
+        finally:
+            with self._lock:
+                # Chỉ xóa nếu không có bản mới hơn được ghi đè vào cùng path
+                if self._pending.get(path) is data:
+                    del self._pending[path]
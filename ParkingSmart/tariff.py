@@ -0,0 +1,190 @@
+"""
+FILE: tariff.py
+DESCRIPTION: Bảng giá gửi xe cấu hình được + tính phí hàng loạt bằng NumPy.
+- Khung giờ (VD ngày 100đ/phút, đêm 22h-6h 150đ/phút), trần phí mỗi ngày, hệ số theo loại xe
+- Giá theo từng giây trong ngày được cộng dồn sẵn (prefix sum) -> phí 1 lượt = vài phép trừ,
+  không phụ thuộc lượt gửi dài bao lâu
+- fee(): 1 lượt (route ra cổng), fees(): cả mảng lượt (tính lại phí / đối soát cả tháng)
+  Hai hàm dùng chung 1 công thức nên cho cùng kết quả (bench/bench_tariff.py kiểm tra lại)
+
+Tính lại phí theo bảng giá mới: python tariff.py rebill [database.db] [--tariff tariff.json] [--apply]
+"""
+import json
+import sqlite3
+import sys
+from datetime import date, datetime
+
+import numpy as np
+
+DAY = 86400
+_EPOCH = date(1970, 1, 1).toordinal()
+
+# Bảng giá mặc định = logic cũ của calculate_fee: miễn phí 15p đầu, sau đó 100đ/phút cho cả lượt
+DEFAULT_TARIFF = {
+    "free_minutes": 15,
+    "bands": [[0, 24, 100]],   # [giờ_bắt_đầu, giờ_kết_thúc, đồng/phút]; kết thúc < bắt đầu = qua đêm
+    "daily_cap": None,         # Trần phí cho mỗi ngày lịch (None = không giới hạn)
+    "vehicle_rates": {},       # Hệ số theo loại xe, VD {"Car": 1.0, "Motorbike": 0.3}
+    "round_to": 1,
+}
+
+# Khách vãng lai không khai báo loại xe -> tính như ô tô (giống cột loại xe mặc định trên dashboard)
+GUEST_VEHICLE_TYPE = "Car"
+
+
+def to_seconds(ts):
+    """'YYYY-MM-DD HH:MM:SS' (hoặc datetime) -> số giây kể từ 1970 (giờ địa phương, không múi giờ)"""
+    if isinstance(ts, datetime):
+        return (ts.toordinal() - _EPOCH) * DAY + ts.hour * 3600 + ts.minute * 60 + ts.second
+    return ((date(int(ts[0:4]), int(ts[5:7]), int(ts[8:10])).toordinal() - _EPOCH) * DAY
+            + int(ts[11:13]) * 3600 + int(ts[14:16]) * 60 + int(ts[17:19]))
+
+
+def as_seconds(values):
+    """Mảng chuỗi thời gian / datetime64 / số giây -> mảng int64 số giây"""
+    arr = np.asarray(values)
+    if arr.dtype.kind in "iu":
+        return arr.astype(np.int64)
+    return arr.astype("datetime64[s]").astype(np.int64)
+
+
+class Tariff:
+    def __init__(self, bands=((0, 24, 100),), free_minutes=15, daily_cap=None,
+                 vehicle_rates=None, round_to=1):
+        self.bands = [tuple(b) for b in bands]
+        self.free_minutes = free_minutes
+        self.daily_cap = daily_cap
+        self.vehicle_rates = dict(vehicle_rates or {})
+        self.round_to = round_to
+
+        # Giá (đồng/phút) của từng giây trong ngày; band khai báo sau ghi đè band trước
+        rate = np.zeros(DAY, np.float64)
+        for start_h, end_h, per_min in self.bands:
+            s, e = int(round(start_h * 3600)), int(round(end_h * 3600))
+            if e > s:
+                rate[s:e] = per_min
+            else:  # Qua nửa đêm: 22h -> 6h
+                rate[s:] = per_min
+                rate[:e] = per_min
+        # cum[s] = chi phí từ 0h tới giây s (đơn vị: đồng/phút * giây, chia 60 khi dùng)
+        self._cum = np.concatenate([[0.0], np.cumsum(rate)])
+        self.day_total = self._cum[DAY] / 60.0
+
+    @classmethod
+    def from_dict(cls, cfg):
+        merged = dict(DEFAULT_TARIFF)
+        merged.update(cfg or {})
+        return cls(**merged)
+
+    def to_dict(self):
+        return {"free_minutes": self.free_minutes, "bands": [list(b) for b in self.bands],
+                "daily_cap": self.daily_cap, "vehicle_rates": self.vehicle_rates, "round_to": self.round_to}
+
+    # ---------- 1 lượt ----------
+    def fee(self, entry, exit, vehicle_type=None):
+        a, b = to_seconds(entry), to_seconds(exit)
+        if b - a <= self.free_minutes * 60:
+            return 0
+        cum, cap = self._cum, self._cap
+        da, sa = divmod(a, DAY)
+        db, sb = divmod(b, DAY)
+        if da == db:
+            money = cap((cum[sb] - cum[sa]) / 60.0)
+        else:
+            money = (cap((cum[DAY] - cum[sa]) / 60.0) + (db - da - 1) * cap(self.day_total)
+                     + cap(cum[sb] / 60.0))
+        money = money * self.vehicle_rates.get(vehicle_type, 1.0)
+        return int(round(money / self.round_to)) * self.round_to
+
+    def _cap(self, x):
+        return x if self.daily_cap is None else min(x, self.daily_cap)
+
+    # ---------- Hàng loạt ----------
+    def fees(self, entries, exits, vehicle_types=None):
+        """Phí cho cả mảng lượt gửi (chuỗi thời gian, datetime64 hoặc số giây). Trả về mảng float64"""
+        a, b = as_seconds(entries), as_seconds(exits)
+        cum = self._cum
+        da, sa = np.divmod(a, DAY)
+        db, sb = np.divmod(b, DAY)
+        cap = (lambda x: x) if self.daily_cap is None else (lambda x: np.minimum(x, self.daily_cap))
+
+        same_day = cap((cum[sb] - cum[sa]) / 60.0)
+        multi_day = (cap((cum[DAY] - cum[sa]) / 60.0) + np.maximum(db - da - 1, 0) * cap(self.day_total)
+                     + cap(cum[sb] / 60.0))
+        money = np.where(da == db, same_day, multi_day)
+
+        if vehicle_types is not None and self.vehicle_rates:
+            kinds, inverse = np.unique(np.asarray(vehicle_types, dtype=object).astype(str), return_inverse=True)
+            mult = np.array([self.vehicle_rates.get(k, 1.0) for k in kinds])
+            money = money * mult[inverse]
+
+        money = np.round(money / self.round_to) * self.round_to
+        return np.where(b - a <= self.free_minutes * 60, 0.0, money)
+
+
+def load_tariff(path=None):
+    """Đọc bảng giá từ file JSON; không có file -> bảng giá mặc định"""
+    if path:
+        try:
+            with open(path, encoding="utf-8") as f:
+                cfg = json.load(f)
+            print(f"[TARIFF] Loaded {path}")
+            return Tariff.from_dict(cfg)
+        except FileNotFoundError:
+            pass
+    return Tariff.from_dict(DEFAULT_TARIFF)
+
+
+# ======================================
+# TÍNH LẠI PHÍ CHO LỊCH SỬ
+# ======================================
+# Bỏ qua lượt vé tháng (miễn phí + biển số có trong registered_vehicles), giống stats.backfill
+# Loại xe lấy theo đăng ký (vé tháng đã hết hạn vẫn trả phí theo loại xe của mình), còn lại là khách
+SQL_REBILL_ROWS = """
+    SELECT p.id, p.entry_time, p.exit_time, COALESCE(p.fee, 0) AS fee,
+           COALESCE(r.vehicle_type, ?) AS vehicle_type
+    FROM parking_log p LEFT JOIN registered_vehicles r ON r.plate = p.plate
+    WHERE p.status = 'OUT' AND p.entry_time IS NOT NULL AND p.exit_time IS NOT NULL
+      AND NOT (COALESCE(p.fee, 0) = 0 AND p.plate IN (SELECT plate FROM registered_vehicles))
+"""
+
+
+def rebill(conn, tariff, start=None, end=None, apply=False):
+    sql, params = SQL_REBILL_ROWS, [GUEST_VEHICLE_TYPE]
+    if start and end:
+        sql += " AND p.exit_time BETWEEN ? AND ?"
+        params += [f"{start} 00:00:00", f"{end} 23:59:59"]
+    rows = conn.execute(sql, params).fetchall()
+    if not rows:
+        return {"rows": 0}
+
+    ids = np.array([r[0] for r in rows], np.int64)
+    old = np.array([r[3] for r in rows], np.float64)
+    new = tariff.fees([r[1] for r in rows], [r[2] for r in rows], [r[4] for r in rows])
+    changed = old != new
+    summary = {"rows": len(rows), "changed": int(changed.sum()),
+               "old_total": float(old.sum()), "new_total": float(new.sum())}
+
+    if apply and summary["changed"]:
+        from stats import backfill
+        conn.executemany("UPDATE parking_log SET fee = ? WHERE id = ?",
+                         zip(new[changed].tolist(), ids[changed].tolist()))
+        conn.commit()
+        backfill(conn)  # Doanh thu trong bảng tổng hợp theo phí mới
+        summary["applied"] = True
+    return summary
+
+
+if __name__ == '__main__':
+    if len(sys.argv) >= 2 and sys.argv[1] == "rebill":
+        args = sys.argv[2:]
+        opt = lambda name: args[args.index(name) + 1] if name in args else None
+        db_file = args[0] if args and not args[0].startswith("--") else "database.db"
+        conn = sqlite3.connect(db_file)
+        if "--apply" in args:
+            from db import migrate
+            migrate(conn)  # Cần bảng stats_* để cập nhật lại doanh thu
+        print(rebill(conn, load_tariff(opt("--tariff")), opt("--start"), opt("--end"), apply="--apply" in args))
+    else:
+        print("Usage: python tariff.py rebill [database.db] [--tariff tariff.json] "
+              "[--start YYYY-MM-DD --end YYYY-MM-DD] [--apply]")
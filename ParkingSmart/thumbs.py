@@ -0,0 +1,99 @@
+"""
+FILE: thumbs.py
+DESCRIPTION: Ảnh thu nhỏ (thumbnail) cho ảnh chụp ở cổng.
+- Bảng lịch sử chỉ hiện ảnh cao 40px, khung live vài trăm px -> không cần gửi ảnh gốc
+- Tạo ngay lúc chụp (thread riêng, từ frame đã giải mã sẵn) hoặc lúc có request đầu tiên
+- Ghi qua AsyncFileWriter, lưu ở <thumb_root>/<size>/<đường dẫn ảnh gốc>.<fmt>
+- read_source(rel) đọc ảnh gốc khi cần tạo lazily (mặc định: file trong src_root)
+"""
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+# Tên cỡ -> chiều cao (px). sm: bảng lịch sử (40px x2 cho màn hình retina), md: khung live
+THUMB_SIZES = {"sm": 80, "md": 360}
+
+
+class ThumbnailCache:
+    def __init__(self, src_root, thumb_root, writer, sizes=None, fmt="webp", quality=70, workers=1,
+                 read_source=None):
+        self.src_root = src_root
+        self.read_source = read_source or self._read_file
+        self.thumb_root = thumb_root
+        self.writer = writer
+        self.sizes = dict(sizes or THUMB_SIZES)
+        self.fmt = fmt
+        self.quality = quality
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="thumb")
+        self._lock = threading.Lock()
+        self.generated = 0
+        self.lazy = 0
+
+    @property
+    def mimetype(self):
+        return "image/webp" if self.fmt == "webp" else "image/jpeg"
+
+    def thumb_path(self, size, rel):
+        return os.path.join(self.thumb_root, size, f"{os.path.splitext(rel)[0]}.{self.fmt}")
+
+    def _encode(self, frame, height):
+        h, w = frame.shape[:2]
+        if h > height:
+            frame = cv2.resize(frame, (max(1, round(w * height / h)), height), interpolation=cv2.INTER_AREA)
+        if self.fmt == "webp":
+            ok, buf = cv2.imencode(".webp", frame, [cv2.IMWRITE_WEBP_QUALITY, self.quality])
+        else:
+            ok, buf = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+        return buf.tobytes() if ok else None
+
+    def _generate(self, rel, frame):
+        out = {}
+        for size, height in self.sizes.items():
+            data = self._encode(frame, height)
+            if data is not None:
+                self.writer.write(self.thumb_path(size, rel), data)
+                out[size] = data
+        with self._lock:
+            self.generated += 1
+        return out
+
+    def submit(self, rel, frame):
+        """Tạo thumbnail ở thread nền từ frame vừa chụp (không làm chậm cổng)"""
+        return self._pool.submit(self._generate, rel, frame)
+
+    def _read_file(self, rel):
+        src = os.path.join(self.src_root, rel)
+        if not os.path.exists(src):
+            return None
+        with open(src, "rb") as f:
+            return f.read()
+
+    def get(self, size, rel, source_bytes=None):
+        """
+        Trả về (path, bytes | None): bytes khi thumbnail còn nằm trong hàng đợi ghi
+        hoặc vừa được tạo lazily. (None, None) nếu không có ảnh gốc
+        """
+        if size not in self.sizes:
+            return None, None
+        path = self.thumb_path(size, rel)
+        data = self.writer.pending(path)
+        if data is not None or os.path.exists(path):
+            return path, data
+
+        # Chưa có (ảnh cũ / tạo nền thất bại) -> tạo ngay từ ảnh gốc
+        if source_bytes is None:
+            source_bytes = self.read_source(rel)
+            if source_bytes is None:
+                return None, None
+        frame = cv2.imdecode(np.frombuffer(source_bytes, np.uint8), cv2.IMREAD_COLOR)
+        if frame is None:
+            return None, None
+        with self._lock:
+            self.lazy += 1
+        return path, self._generate(rel, frame).get(size)
+
+    def stats(self):
+        return {"generated": self.generated, "lazy": self.lazy, "format": self.fmt, "sizes": self.sizes}
@@ -0,0 +1,371 @@
+"""
+FILE: timeseries.py
+DESCRIPTION: Lưu lịch sử cảm biến (slot có xe / MQ135) ngoài SQLite, cho biểu đồ trên dashboard.
+- ESP32 gửi ~20 lần/giây: mỗi lần 1 bản ghi 11 byte (thời điểm ms, bitmask slot, MQ135)
+  -> ~19MB/ngày, ghi theo lô (flush mỗi giây) vào file append-only qua np.memmap
+- 3 tầng: raw (chia file theo ngày, giữ raw_keep_days ngày), 1m và 1h (trung bình / min / max,
+  mỗi bản ghi 1 phút / 1 giờ, giữ mãi - ~60KB/ngày)
+- Mỗi file = header 64 byte + bản ghi cố định kích thước, thời gian tăng dần
+  -> truy vấn khoảng thời gian = 2 lần searchsorted + cắt mảng
+- Phút / giờ đang dở nằm trong RAM (truy vấn vẫn thấy), khởi động lại thì dựng lại từ tầng dưới
+
+Chạy tay: python timeseries.py stats [thư_mục]
+"""
+import glob
+import os
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+MAGIC = b"PSTS"
+HEADER = np.dtype([("magic", "S4"), ("version", "<u2"), ("itemsize", "<u2"), ("count", "<u8")])
+HEADER_SIZE = 64
+MAX_SLOTS = 8
+
+# t: epoch ms; slots: bit i = 1 khi slot i có xe
+RAW_DTYPE = np.dtype([("t", "<i8"), ("slots", "u1"), ("mq135", "<u2")])
+# t: đầu phút / giờ (epoch ms); occ: tỉ lệ thời gian có xe của từng slot
+AGG_DTYPE = np.dtype([("t", "<i8"), ("n", "<u4"), ("occ", "<f4", (MAX_SLOTS,)), ("free_mean", "<f4"),
+                      ("free_min", "u1"), ("mq_mean", "<f4"), ("mq_min", "<u2"), ("mq_max", "<u2")])
+TIERS = {"1m": 60_000, "1h": 3_600_000}
+
+
+class RecordFile:
+    """File append-only: header 64 byte + các bản ghi dtype cố định, đọc / ghi qua np.memmap"""
+
+    def __init__(self, path, dtype, grow=1 << 14):
+        self.path, self.dtype, self.grow = path, dtype, grow
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            with open(path, "wb") as f:
+                f.truncate(HEADER_SIZE + grow * dtype.itemsize)
+            self._map()
+            self._hdr["magic"], self._hdr["version"], self._hdr["itemsize"] = MAGIC, 1, dtype.itemsize
+        else:
+            self._map()
+            if self._hdr["magic"][0] != MAGIC or self._hdr["itemsize"][0] != dtype.itemsize:
+                raise ValueError(f"{path}: không đúng định dạng {dtype}")
+
+    def _map(self):
+        self._mm = np.memmap(self.path, dtype=np.uint8, mode="r+")
+        self._hdr = self._mm[:HEADER.itemsize].view(HEADER)
+        self._recs = self._mm[HEADER_SIZE:].view(self.dtype)
+
+    @property
+    def count(self):
+        return int(self._hdr["count"][0])
+
+    def append(self, recs):
+        n, count = len(recs), self.count
+        if not n: return
+        if count + n > len(self._recs):
+            # Hết chỗ -> nới file (gấp đôi) rồi map lại
+            cap = max(len(self._recs) * 2, count + n)
+            self._mm.flush()
+            del self._recs, self._hdr, self._mm
+            with open(self.path, "r+b") as f:
+                f.truncate(HEADER_SIZE + cap * self.dtype.itemsize)
+            self._map()
+        self._recs[count:count + n] = recs
+        self._hdr["count"] = count + n  # Cập nhật count sau cùng: dữ liệu ghi dở không bị đọc
+
+    def view(self):
+        return self._recs[:self.count]
+
+    def last(self):
+        n = self.count
+        return self._recs[n - 1] if n else None
+
+    def range(self, t0, t1):
+        """Bản ghi có t0 <= t < t1 (bản sao)"""
+        v = self.view()
+        i, j = np.searchsorted(v["t"], [t0, t1], side="left")
+        return np.array(v[i:j])
+
+    def flush(self):
+        self._mm.flush()
+
+    def nbytes(self):
+        return os.path.getsize(self.path)
+
+
+class _Bucket:
+    """Phút / giờ đang gom dở"""
+
+    def __init__(self, t, n_slots):
+        self.t, self.n_slots = t, n_slots
+        self.n = 0
+        self.occ = np.zeros(MAX_SLOTS)
+        self.free_sum, self.free_min = 0.0, 255
+        self.mq_sum, self.mq_min, self.mq_max = 0.0, 65535, 0
+
+    def add_raw(self, recs):
+        bits = np.unpackbits(recs["slots"][:, None], axis=1, bitorder="little")
+        free = self.n_slots - bits[:, :self.n_slots].sum(axis=1)
+        mq = recs["mq135"]
+        self.n += len(recs)
+        self.occ += bits.sum(axis=0)
+        self.free_sum += float(free.sum())
+        self.free_min = min(self.free_min, int(free.min()))
+        self.mq_sum += float(mq.sum())
+        self.mq_min, self.mq_max = min(self.mq_min, int(mq.min())), max(self.mq_max, int(mq.max()))
+
+    def add_agg(self, recs):
+        n = recs["n"].astype(np.float64)
+        self.n += int(n.sum())
+        self.occ += (recs["occ"] * n[:, None]).sum(axis=0)
+        self.free_sum += float((recs["free_mean"] * n).sum())
+        self.free_min = min(self.free_min, int(recs["free_min"].min()))
+        self.mq_sum += float((recs["mq_mean"] * n).sum())
+        self.mq_min, self.mq_max = min(self.mq_min, int(recs["mq_min"].min())), max(self.mq_max, int(recs["mq_max"].max()))
+
+    def record(self):
+        rec = np.zeros(1, AGG_DTYPE)
+        n = max(self.n, 1)
+        rec["t"], rec["n"] = self.t, self.n
+        rec["occ"] = self.occ / n
+        rec["free_mean"], rec["free_min"] = self.free_sum / n, self.free_min
+        rec["mq_mean"], rec["mq_min"], rec["mq_max"] = self.mq_sum / n, self.mq_min, self.mq_max
+        return rec
+
+
+class SensorTimeSeries:
+    def __init__(self, root, n_slots=4, raw_keep_days=7, open_days=3):
+        self.root = root
+        self.n_slots = n_slots
+        self.raw_keep_days = raw_keep_days
+        self.open_days = open_days
+        self._lock = threading.RLock()
+        self._buffer = []        # [(t_ms, bitmask, mq)] chờ flush
+        self._raw = {}           # 'YYYYMMDD' -> RecordFile (chỉ giữ mở vài ngày gần nhất)
+        self._tiers = {name: RecordFile(os.path.join(root, f"{name}.bin"), AGG_DTYPE) for name in TIERS}
+        self._open = {name: None for name in TIERS}  # _Bucket đang gom dở
+        self._last_t = 0
+        self._thread = None
+        self.written = 0
+        self.flushes = 0
+        self.last_flush_ms = None
+        self._recover()
+
+    # ---------- Ghi ----------
+    def write(self, slots, mq135, t_ms=None):
+        """slots: list 0/1 theo thứ tự slot; ghi vào bộ đệm (rất nhanh), flush() ghi xuống file"""
+        mask = 0
+        for i, v in enumerate(slots[:MAX_SLOTS]):
+            if v: mask |= 1 << i
+        try:
+            mq = min(max(int(float(mq135 or 0)), 0), 65535)
+        except (TypeError, ValueError):
+            mq = 0
+        with self._lock:
+            self._buffer.append((int(t_ms if t_ms is not None else time.time() * 1000), mask, mq))
+
+    def write_batch(self, recs):
+        """Ghi thẳng 1 mảng RAW_DTYPE (nhập dữ liệu / benchmark)"""
+        with self._lock:
+            self._append(np.sort(np.asarray(recs, RAW_DTYPE), order="t"))
+
+    def flush(self):
+        with self._lock:
+            if not self._buffer:
+                return 0
+            t = time.perf_counter()
+            batch, self._buffer = self._buffer, []
+            recs = np.array(batch, RAW_DTYPE)
+            self._append(recs[np.argsort(recs["t"], kind="stable")])
+            self.flushes += 1
+            self.last_flush_ms = round((time.perf_counter() - t) * 1000, 2)
+            return len(recs)
+
+    def _append(self, recs):
+        if not len(recs): return
+        # Thời gian phải tăng dần trong file (đồng hồ bị chỉnh lùi -> giữ nguyên mốc cũ)
+        recs["t"] = np.maximum.accumulate(np.maximum(recs["t"], self._last_t))
+        self._last_t = int(recs["t"][-1])
+        keys = self._day_keys(recs["t"])
+        for day in np.unique(keys):
+            self._raw_file(int(day), create=True).append(recs[keys == day])
+        self.written += len(recs)
+        self._aggregate_raw(recs)
+
+    def _aggregate_raw(self, recs):
+        """raw -> phút; phút xong -> ghi tầng 1m và gom tiếp lên giờ"""
+        width = TIERS["1m"]
+        keys = recs["t"] // width * width
+        starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+        for s, e in zip(starts, np.r_[starts[1:], len(recs)]):
+            bucket = self._roll("1m", int(keys[s]))
+            bucket.add_raw(recs[s:e])
+
+    def _roll(self, tier, t):
+        """Bucket cho mốc t của tầng; sang mốc mới thì chốt bucket cũ"""
+        bucket = self._open[tier]
+        if bucket is not None and bucket.t == t:
+            return bucket
+        if bucket is not None and bucket.n:
+            rec = bucket.record()
+            self._tiers[tier].append(rec)
+            if tier == "1m":
+                self._roll("1h", t=int(bucket.t // TIERS["1h"] * TIERS["1h"])).add_agg(rec)
+        self._open[tier] = _Bucket(t, self.n_slots)
+        return self._open[tier]
+
+    # ---------- File raw theo ngày ----------
+    @staticmethod
+    def _day_keys(t_ms):
+        # Ngày theo giờ địa phương (cùng cách chia ngày với parking_log)
+        return ((t_ms // 1000 + time.localtime().tm_gmtoff) // 86400).astype(np.int64)
+
+    def _raw_path(self, day):
+        d = datetime(1970, 1, 1) + timedelta(days=int(day))
+        return os.path.join(self.root, "raw", d.strftime("%Y%m%d") + ".bin")
+
+    def _raw_file(self, day, create=False):
+        f = self._raw.get(day)
+        if f is None:
+            path = self._raw_path(day)
+            if not create and not os.path.exists(path):
+                return None
+            f = self._raw[day] = RecordFile(path, RAW_DTYPE, grow=1 << 16)
+            for old in sorted(self._raw)[:-self.open_days]:
+                self._raw.pop(old).flush()
+        return f
+
+    def _raw_days(self):
+        out = []
+        for path in glob.glob(os.path.join(self.root, "raw", "*.bin")):
+            d = datetime.strptime(os.path.basename(path)[:8], "%Y%m%d")
+            out.append((d - datetime(1970, 1, 1)).days)
+        return sorted(out)
+
+    # ---------- Khởi động lại ----------
+    def _recover(self):
+        """Dựng lại phút / giờ đang dở từ bản ghi tầng dưới mới hơn bản ghi cuối của tầng trên"""
+        days = self._raw_days()
+        if days:
+            last = self._raw_file(days[-1]).last()
+            self._last_t = int(last["t"]) if last is not None else 0
+        last_h = self._tiers["1h"].last()
+        after_h = int(last_h["t"]) + TIERS["1h"] if last_h is not None else 0
+        pending_m = self._tiers["1m"].range(after_h, 1 << 62)
+        if len(pending_m):
+            hour_keys = pending_m["t"] // TIERS["1h"] * TIERS["1h"]
+            for t in np.unique(hour_keys):
+                bucket = self._roll("1h", int(t))
+                bucket.add_agg(pending_m[hour_keys == t])
+
+        last_m = self._tiers["1m"].last()
+        after_m = int(last_m["t"]) + TIERS["1m"] if last_m is not None else 0
+        for day in days[-2:]:
+            recs = self._raw_file(day).range(after_m, 1 << 62)
+            if len(recs):
+                self._aggregate_raw(recs)
+
+    # ---------- Dọn dẹp ----------
+    def run_retention(self, today=None):
+        """Xóa file raw cũ hơn raw_keep_days (tầng 1m / 1h giữ lại)"""
+        today = today if today is not None else int(self._day_keys(np.array([time.time() * 1000]))[0])
+        removed = 0
+        with self._lock:
+            for day in self._raw_days():
+                if day < today - self.raw_keep_days:
+                    f = self._raw.pop(day, None)
+                    if f: del f
+                    os.remove(self._raw_path(day))
+                    removed += 1
+        return removed
+
+    def start(self, interval=1.0, retention_every=3600):
+        """Thread nền: flush bộ đệm mỗi interval giây, dọn raw cũ mỗi retention_every giây"""
+        def loop():
+            last_retention = 0
+            while True:
+                time.sleep(interval)
+                try:
+                    self.flush()
+                    if time.time() - last_retention > retention_every:
+                        self.run_retention()
+                        last_retention = time.time()
+                except Exception as e:
+                    print(f"[SENSOR TS] Lỗi ghi: {e}")
+        self._thread = threading.Thread(target=loop, name="sensor-timeseries", daemon=True)
+        self._thread.start()
+        return self
+
+    # ---------- Truy vấn ----------
+    def _raw_range(self, t0, t1):
+        parts = []
+        for day in range(int(self._day_keys(np.array([t0]))[0]), int(self._day_keys(np.array([max(t0, t1 - 1)]))[0]) + 1):
+            f = self._raw_file(day)
+            if f is not None:
+                parts.append(f.range(t0, t1))
+        return np.concatenate(parts) if parts else np.zeros(0, RAW_DTYPE)
+
+    def _tier_range(self, tier, t0, t1):
+        recs = self._tiers[tier].range(t0, t1)
+        bucket = self._open[tier]
+        if bucket is not None and bucket.n and t0 <= bucket.t < t1:
+            recs = np.concatenate([recs, bucket.record()])
+        return recs
+
+    @staticmethod
+    def pick_tier(t0, t1, max_points, min_points=60):
+        """Khoảng ngắn (tầng 1m chưa đủ min_points điểm) -> raw, còn lại tầng mịn nhất có <= max_points điểm"""
+        span = max(t1 - t0, 1)
+        if span < TIERS["1m"] * min_points:
+            return "raw"
+        return "1m" if span <= TIERS["1m"] * max_points else "1h"
+
+    def query(self, t0, t1, tier="auto", max_points=600, limit=20000):
+        """
+        Dữ liệu vẽ biểu đồ trong [t0, t1) (epoch ms). tier: auto | raw | 1m | 1h
+        Raw nhiều hơn max_points thì lấy cách quãng (step). Trả về dạng cột (t, occupied, free, mq135...)
+        """
+        if tier == "auto":
+            tier = self.pick_tier(t0, t1, max_points)
+        with self._lock:
+            self.flush()
+            recs = self._raw_range(t0, t1) if tier == "raw" else self._tier_range(tier, t0, t1)
+        step = 1
+        if tier == "raw" and len(recs) > max_points:
+            step = -(-len(recs) // max_points)
+            recs = recs[::step]
+        truncated = len(recs) > limit
+        recs = recs[-limit:]
+        out = {"tier": tier, "step": step, "points": len(recs), "truncated": truncated, "t": recs["t"].tolist()}
+        if tier == "raw":
+            bits = np.unpackbits(recs["slots"][:, None], axis=1, bitorder="little")[:, :self.n_slots]
+            out["occupied"] = bits.sum(axis=1).tolist()
+            out["free"] = (self.n_slots - bits.sum(axis=1)).tolist()
+            out["slots"] = bits.T.tolist()
+            out["mq135"] = recs["mq135"].tolist()
+        else:
+            occ = recs["occ"][:, :self.n_slots].astype(np.float64)
+            out["occupied"] = np.round(occ.sum(axis=1), 3).tolist()
+            out["free"] = np.round(recs["free_mean"].astype(np.float64), 3).tolist()
+            out["free_min"] = recs["free_min"].tolist()
+            out["slots"] = np.round(occ.T, 3).tolist()
+            out["mq135"] = np.round(recs["mq_mean"].astype(np.float64), 1).tolist()
+            out["mq135_min"] = recs["mq_min"].tolist()
+            out["mq135_max"] = recs["mq_max"].tolist()
+            out["samples"] = recs["n"].tolist()
+        return out
+
+    def stats(self):
+        with self._lock:
+            days = self._raw_days()
+            raw_bytes = sum(os.path.getsize(self._raw_path(d)) for d in days)
+            return {"written": self.written, "buffered": len(self._buffer), "flushes": self.flushes,
+                    "last_flush_ms": self.last_flush_ms,
+                    "raw": {"days": len(days), "bytes": raw_bytes, "keep_days": self.raw_keep_days},
+                    **{name: {"records": f.count, "bytes": f.nbytes()} for name, f in self._tiers.items()}}
+
+
+if __name__ == '__main__':
+    if len(sys.argv) >= 2 and sys.argv[1] == "stats":
+        print(SensorTimeSeries(sys.argv[2] if len(sys.argv) >= 3 else "data/sensors").stats())
+    else:
+        print("Usage: python timeseries.py stats [data/sensors]")